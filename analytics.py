@@ -0,0 +1,229 @@
+"""Daily conversation analytics over the chats table.
+
+Usage: python analytics.py [--out analytics] [--local chats.jsonl]
+                           [--page-size 1000] [--full] [--json]
+
+Streams chats in id order with keyset pagination (id > watermark, one page
+at a time), derives per-row columns, appends them as Parquet files
+partitioned by day (<out>/chats/day=YYYY-MM-DD/) and rebuilds the daily
+aggregates (<out>/daily.parquet) for the days the new rows touched:
+
+  messages, users        conversation volume
+  emotion_<name>         emotion mix (detect_user_emotion's patterns)
+  returns, went_busy,    unavailability frequency - return messages, times
+  busy_acks              she went busy and "I'll wait" turns, from the kind
+                         marker chat_core writes on each row
+  reply_len_*            reply length in characters (mean/p50/p95)
+
+The last id processed is kept in <out>/_watermark.json, so a rerun only
+reads new rows; --full starts over (and so does a run over a dataset
+written with different columns). Rows from before the kind column
+existed fall back to the old guess: no user message is a return, no reply
+an "I'll wait" turn; going busy can't be told apart from a reply there.
+Message text is not copied out - only lengths and the detected emotion.
+
+Needs pandas and pyarrow, which the app itself doesn't: install them with
+pip install -r requirements-dev.txt. Reads SUPABASE_URL / SUPABASE_KEY from
+the environment (or .env). --local reads a JSONL dump of chat rows into
+fakes.FakeSupabase instead.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from chat_core import BUSY_ACK, REPLY, RETURNED, WENT_BUSY
+from text_analysis import EMOTION_PATTERNS
+
+CHAT_COLUMNS = "id, user_id, user_message, ai_response, kind, timestamp"
+# Bumped whenever the derived columns change; an older dataset is rebuilt
+DATASET_VERSION = 2
+EMOTIONS = [emotion for emotion, _ in EMOTION_PATTERNS] + ["neutral"]
+
+
+# --- source ---
+def open_source(local_path=None):
+    """Supabase client for the chats table (a FakeSupabase over local_path if given)"""
+    if local_path:
+        from fakes import FakeSupabase
+        client = FakeSupabase()
+        with open(local_path, "r", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        client.table('chats').insert(rows).execute()
+        return client
+    from dotenv import load_dotenv
+    from supabase import create_client
+    load_dotenv()
+    url, key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        raise SystemExit("SUPABASE_URL / SUPABASE_KEY not set")
+    return create_client(url, key)
+
+
+def iter_chat_pages(client, after_id=0, page_size=1000):
+    """Pages of chat rows with id > after_id, in id order"""
+    while True:
+        rows = client.table('chats').select(CHAT_COLUMNS).gt('id', after_id).order('id').limit(page_size).execute().data
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1]['id']
+        if len(rows) < page_size:
+            return
+
+
+# --- per-row columns ---
+def detect_emotions(messages):
+    """detect_user_emotion over a Series of messages (first matching pattern wins)"""
+    lowered = messages.fillna("").str.lower()
+    conditions = [lowered.str.contains(pattern).to_numpy() for _, pattern in EMOTION_PATTERNS]
+    return np.select(conditions, [emotion for emotion, _ in EMOTION_PATTERNS], default="neutral")
+
+
+def derive_columns(rows):
+    """Chat rows -> DataFrame of the columns kept in the dataset"""
+    frame = pd.DataFrame.from_records(rows, columns=[c.strip() for c in CHAT_COLUMNS.split(",")])
+    user_message = frame["user_message"].fillna("")
+    ai_response = frame["ai_response"].fillna("")
+    # Rows written before the kind column existed
+    guessed = np.where(user_message == "", RETURNED, np.where(ai_response == "", BUSY_ACK, REPLY))
+    kind = frame["kind"].astype("object").fillna(pd.Series(guessed, index=frame.index)).astype("string")
+    return pd.DataFrame({
+        "id": frame["id"].astype("int64"),
+        "user_id": frame["user_id"].astype("string"),
+        "timestamp": pd.to_datetime(frame["timestamp"], errors="coerce"),
+        "day": frame["timestamp"].astype("string").str.slice(0, 10),
+        "emotion": detect_emotions(user_message),
+        "user_len": user_message.str.len().astype("int32"),
+        "reply_len": ai_response.str.len().astype("int32"),
+        "kind": kind,
+        "is_return": (kind == RETURNED).to_numpy(dtype=bool),
+        "is_went_busy": (kind == WENT_BUSY).to_numpy(dtype=bool),
+        "is_busy_ack": (kind == BUSY_ACK).to_numpy(dtype=bool),
+    })
+
+
+def write_partitions(frame, dataset_path):
+    """Append frame to the day-partitioned dataset"""
+    first, last = int(frame["id"].iloc[0]), int(frame["id"].iloc[-1])
+    pq.write_to_dataset(
+        pa.Table.from_pandas(frame, preserve_index=False), dataset_path,
+        partition_cols=["day"], basename_template=f"part-{first}-{last}-{{i}}.parquet",
+    )
+
+
+# --- aggregates ---
+def daily_aggregates(frame):
+    """Per-day volume, emotion mix, unavailability and reply-length stats"""
+    frame = frame.drop_duplicates("id")
+    by_day = frame.groupby("day", sort=True)
+    replies = frame[~frame["is_busy_ack"]].groupby("day")["reply_len"]
+    daily = pd.DataFrame({
+        "messages": by_day.size(),
+        "users": by_day["user_id"].nunique(),
+        "returns": by_day["is_return"].sum(),
+        "went_busy": by_day["is_went_busy"].sum(),
+        "busy_acks": by_day["is_busy_ack"].sum(),
+        "reply_len_mean": replies.mean(),
+        "reply_len_p50": replies.quantile(0.50),
+        "reply_len_p95": replies.quantile(0.95),
+    })
+    # Messages from the user only (page-load return messages have none)
+    said = frame["user_len"] > 0
+    emotions = pd.crosstab(frame.loc[said, "day"], frame.loc[said, "emotion"])
+    emotions = emotions.reindex(columns=EMOTIONS, fill_value=0).add_prefix("emotion_")
+    daily = daily.join(emotions).fillna(0)
+    return daily.reset_index()
+
+
+def update_daily(out_dir, days):
+    """Recompute the given days from their partitions and merge into daily.parquet"""
+    dataset_path = os.path.join(out_dir, "chats")
+    touched = pd.read_parquet(dataset_path, filters=[("day", "in", sorted(days))])
+    touched["day"] = touched["day"].astype("string")
+    fresh = daily_aggregates(touched)
+    daily_path = os.path.join(out_dir, "daily.parquet")
+    if os.path.exists(daily_path):
+        existing = pd.read_parquet(daily_path)
+        fresh = pd.concat([existing[~existing["day"].isin(days)], fresh], ignore_index=True)
+    fresh = fresh.sort_values("day", ignore_index=True)
+    fresh.to_parquet(daily_path, index=False)
+    return fresh
+
+
+# --- watermark ---
+def load_watermark(out_dir):
+    try:
+        with open(os.path.join(out_dir, "_watermark.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"last_id": 0, "rows": 0, "version": DATASET_VERSION}
+
+
+def save_watermark(out_dir, watermark):
+    path = os.path.join(out_dir, "_watermark.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(watermark, f)
+    os.replace(tmp_path, path)
+
+
+def run(client, out_dir, page_size=1000, full=False):
+    """Process chats past the watermark -> run summary dict"""
+    if os.path.exists(out_dir) and (full or load_watermark(out_dir).get("version", 1) != DATASET_VERSION):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    watermark = load_watermark(out_dir)
+    start = time.perf_counter()
+    rows_read, days = 0, set()
+    for rows in iter_chat_pages(client, watermark["last_id"], page_size):
+        frame = derive_columns(rows)
+        write_partitions(frame, os.path.join(out_dir, "chats"))
+        days.update(frame["day"].dropna().unique())
+        rows_read += len(rows)
+        # Each page is durable before the watermark moves past it
+        watermark = {"last_id": int(frame["id"].iloc[-1]), "rows": watermark["rows"] + len(rows),
+                     "version": DATASET_VERSION}
+        save_watermark(out_dir, watermark)
+    daily = update_daily(out_dir, days) if days else None
+    return {
+        "rows_read": rows_read,
+        "days_updated": sorted(days),
+        "watermark": watermark,
+        "elapsed_s": round(time.perf_counter() - start, 3),
+        "daily": daily,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch analytics over the chats table")
+    parser.add_argument("--out", default="analytics", help="output directory")
+    parser.add_argument("--local", help="JSONL dump of chat rows to use instead of Supabase")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--full", action="store_true", help="ignore the watermark and rebuild")
+    parser.add_argument("--json", action="store_true", help="print the run summary as JSON")
+    args = parser.parse_args(argv)
+
+    report = run(open_source(args.local), args.out, args.page_size, args.full)
+    daily = report.pop("daily")
+    if args.json:
+        report["daily"] = [] if daily is None else daily.to_dict(orient="records")
+        print(json.dumps(report, indent=2, default=str))
+        return 0
+    print(f"read {report['rows_read']} rows in {report['elapsed_s']} s, watermark id {report['watermark']['last_id']}")
+    if daily is None:
+        print("no new rows")
+    else:
+        print(daily[daily["day"].isin(report["days_updated"])].to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
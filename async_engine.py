@@ -0,0 +1,209 @@
+import asyncio
+import concurrent.futures
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from chat_core import REPLY, SUPERSEDED, ChatPipeline, StageTimer
+from history_cache import fetch_recent_turns
+from text_analysis import limit_emojis
+
+# ---------------------------
+# ASYNC TURN ENGINE
+# ---------------------------
+# AsyncChatPipeline keeps ChatPipeline's availability checks and save path
+# but runs a normal turn's I/O on one shared event loop: the name update,
+# the history (re)seed + memory recall and the context precompute overlap,
+# and Gemini is called through generate_content_async. The Streamlit script
+# thread only waits on the result and renders chunks as they arrive.
+# A turn still in flight for the same user when a new one starts (the user
+# reran mid-turn) is cancelled, and so is a stream whose consumer goes away.
+
+_DONE = object()
+
+Prepared = namedtuple("Prepared", ["cache_key", "cached_response", "prompt", "prompt_tokens", "tier"])
+
+
+class EventLoopThread:
+    """One asyncio loop on a daemon thread, shared by every session"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.inflight = {}
+        self.cancelled = 0
+        self._lock = threading.Lock()
+        self._background = set()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="turn-engine", daemon=True)
+        self._thread.start()
+
+    def submit(self, coro, key=None):
+        """Run coro on the loop -> concurrent Future; a previous future for key is cancelled"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        if key is not None:
+            with self._lock:
+                previous = self.inflight.get(key)
+                self.inflight[key] = future
+            if previous is not None and not previous.done():
+                previous.cancel()
+                self.cancelled += 1
+            future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+
+    def cancel(self, key):
+        with self._lock:
+            future = self.inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.cancel()
+            self.cancelled += 1
+
+    def background(self, coro):
+        """Fire-and-forget task on the loop (kept referenced until it finishes)"""
+        def schedule():
+            task = self.loop.create_task(coro)
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+        self.loop.call_soon_threadsafe(schedule)
+
+    def iterate(self, agen, key=None):
+        """Consume an async generator from sync code
+
+        Closing the returned generator (e.g. Streamlit stopping the script
+        on a rerun) cancels the producer. If the producer is cancelled
+        instead (a newer turn for key), the consumer gets
+        asyncio.CancelledError - a BaseException, so views that fall back
+        on errors don't swallow it.
+        """
+        items = queue.Queue()
+
+        async def pump():
+            async for item in agen:
+                items.put((item, None))
+
+        def finished(done):
+            # Runs however the future ends - also if it's cancelled before pump() starts
+            if done.cancelled():
+                items.put((_DONE, asyncio.CancelledError()))
+            else:
+                items.put((_DONE, done.exception()))
+
+        future = self.submit(pump(), key)
+        future.add_done_callback(finished)
+        try:
+            while True:
+                item, error = items.get()
+                if item is _DONE:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def stats(self):
+        return {"inflight": len(self.inflight), "cancelled": self.cancelled, "background": len(self._background)}
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=1.0)
+
+
+class AsyncChatPipeline(ChatPipeline):
+    """ChatPipeline whose normal turns run on an EventLoopThread"""
+
+    def __init__(self, *args, engine, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.engine = engine
+
+    def _converse(self, session, user_input, analysis, view, timings):
+        key = session.user_id
+        if analysis.name:
+            # The prompt uses the new name right away; the database write overlaps the rest
+            session.user_data['profile']['name'] = analysis.name
+            self.engine.background(asyncio.to_thread(self._timed_call, timings, "profile", self._persist_name,
+                                                     session.user_id, analysis.name))
+
+        start = time.perf_counter()
+        try:
+            prepared = self.engine.submit(self._prepare(session, user_input, analysis, timings), key).result()
+        except concurrent.futures.CancelledError:
+            # A newer turn from the same user took over
+            return SUPERSEDED, "", None
+        timings["prepare_ms"] = round((time.perf_counter() - start) * 1000, 3)
+
+        if prepared.cached_response:
+            return self._serve_cached(prepared.cached_response, view, timings)
+        with StageTimer(timings, "generate"):
+            response = self._generate_async(prepared.tier, prepared.prompt, view, timings, key)
+        if response is None:
+            return SUPERSEDED, "", None
+        self._store_reply(session, prepared.cache_key, response)
+        return REPLY, response, prepared.prompt_tokens
+
+    @staticmethod
+    def _timed_call(timings, stage, fn, *args):
+        with StageTimer(timings, stage):
+            return fn(*args)
+
+    def _persist_name(self, user_id, name):
+        try:
+            self.user_store.update_name(user_id, name)
+        except Exception:
+            pass
+
+    def _history_and_memories(self, session, user_input):
+        """Recent turns (re-seeding the cache if it never loaded) + recalled memories"""
+        if not session.history.seeded:
+            try:
+                session.history.seed(fetch_recent_turns(self.supabase, session.user_id, self.history_depth))
+            except Exception:
+                pass
+        recent = session.history.recent()
+        return recent, self._recall(session.user_id, user_input, recent)
+
+    async def _prepare(self, session, user_input, analysis, timings):
+        """Everything before generation, with the I/O overlapped -> Prepared"""
+        now = self.clock()
+        history = asyncio.ensure_future(asyncio.to_thread(
+            self._timed_call, timings, "history", self._history_and_memories, session, user_input))
+        try:
+            with StageTimer(timings, "prompt"):
+                cache_key, cached_response = self._cache_lookup(session, user_input, now)
+            if cached_response:
+                return Prepared(cache_key, cached_response, None, None, None)
+            with StageTimer(timings, "prompt"):
+                context = self._context(session, analysis, now)
+            recent, memories = await history
+        finally:
+            history.cancel()
+        with StageTimer(timings, "prompt"):
+            prompt, prompt_tokens = self._build_prompt(session, context, recent, user_input, memories)
+            tier = self._route(user_input, analysis, recent, timings)
+        return Prepared(cache_key, None, prompt, prompt_tokens, tier)
+
+    def _generate_async(self, tier, prompt, view, timings, key):
+        """Reply text, or None if a newer turn cancelled the request"""
+        if self.stream:
+            chunks = self.engine.iterate(self.router.stream_async(tier, prompt, max_emojis=1, timings=timings), key)
+            try:
+                response = view.stream(chunks, self.fallback_response)
+            except asyncio.CancelledError:
+                return None
+            return response.strip() if isinstance(response, str) and response.strip() else self.fallback_response
+        start = time.perf_counter()
+        try:
+            response, timings["tier"] = self.engine.submit(self.router.generate_async(tier, prompt, timings), key).result()
+            response = limit_emojis(response, max_emojis=1)
+        except concurrent.futures.CancelledError:
+            return None
+        except Exception:
+            response = self.fallback_response
+        timings["total_ms"] = timings["ttft_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        view.show(response)
+        return response
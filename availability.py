@@ -0,0 +1,319 @@
+import heapq
+import json
+import os
+import random
+import threading
+import time
+
+# ---------------------------
+# UNAVAILABILITY WINDOWS
+# ---------------------------
+# Malavika sometimes goes "busy" for a few minutes. Windows are persisted
+# (Supabase or a local JSON file) and a timer heap fires the return message
+# when duration_mins elapses, so she comes back on her own instead of
+# waiting for the user to type again, and a reload doesn't lose the timer.
+
+def get_single_unavailability_reason():
+    """Get ONE random unavailability reason - never combine multiple"""
+    
+    # Define separate reason categories - only pick ONE
+    work_reasons = [
+        {"excuse": "stuck in a client meeting", "return_time": "after this call", "duration_mins": random.randint(5, 8)},
+        {"excuse": "on a tight deadline", "return_time": "once I submit this", "duration_mins": random.randint(6, 10)},
+        {"excuse": "presenting to the team", "return_time": "after my presentation", "duration_mins": random.randint(4, 7)},
+        {"excuse": "back-to-back calls today", "return_time": "between meetings", "duration_mins": random.randint(5, 9)}
+    ]
+    
+    health_reasons = [
+        {"excuse": "feeling a bit under the weather", "return_time": "once I rest a bit", "duration_mins": random.randint(6, 10)},
+        {"excuse": "have a mild headache", "return_time": "after I take some rest", "duration_mins": random.randint(5, 8)},
+        {"excuse": "this cough is bothering me", "return_time": "once I feel better", "duration_mins": random.randint(7, 12)},
+        {"excuse": "feeling really tired today", "return_time": "after a quick nap", "duration_mins": random.randint(8, 15)}
+    ]
+    
+    personal_reasons = [
+        {"excuse": "mom called from Jaipur", "return_time": "once I finish this call", "duration_mins": random.randint(6, 12)},
+        {"excuse": "had to run to the grocery store", "return_time": "once I'm back home", "duration_mins": random.randint(8, 15)},
+        {"excuse": "Shivani needs help with something", "return_time": "once I sort this out", "duration_mins": random.randint(5, 10)},
+        {"excuse": "dealing with apartment maintenance", "return_time": "once they're done", "duration_mins": random.randint(10, 20)}
+    ]
+    
+    # Pick ONE category randomly, then ONE reason from that category
+    all_categories = [work_reasons, health_reasons, personal_reasons]
+    chosen_category = random.choice(all_categories)
+    chosen_reason = random.choice(chosen_category)
+    
+    return chosen_reason
+
+
+def should_become_unavailable(probability=0.20, rng=random):
+    """Determine if Malavika should become unavailable (20% chance)"""
+    return rng.random() < probability
+
+
+def generate_return_message(original_excuse, user_name):
+    """Generate a natural return message"""
+    
+    return_phrases = {
+        "stuck in a client meeting": [
+            f"Finally done with that meeting! {user_name}, tell me everything - I have time now",
+            f"Meeting over! {user_name}, what's up? Can chat properly now",
+            f"Client call finished! {user_name}, missed chatting - what have you been up to?"
+        ],
+        "on a tight deadline": [
+            f"Deadline submitted! {user_name}, finally free - tell me about your day",
+            f"Project done! {user_name}, araam se bata what's happening",
+            f"Work finished! {user_name}, now I have all the time for you"
+        ],
+        "presenting to the team": [
+            f"Presentation went well! {user_name}, free now - what's new?",
+            f"Done with my presentation! {user_name}, can focus on you now",
+            f"Team meeting over! {user_name}, tell me everything"
+        ],
+        "feeling a bit under the weather": [
+            f"Feeling much better now! {user_name}, what's up? I'm all yours",
+            f"Headache gone! {user_name}, missed you - tell me about your day",
+            f"Much better now! {user_name}, araam se bata what happened today"
+        ],
+        "mom called from Jaipur": [
+            f"Mom's call finally done! {user_name}, she had so much to say - anyway, what's up with you?",
+            f"Finished talking to family! {user_name}, now tell me your stories",
+            f"Family time over! {user_name}, I'm all yours now"
+        ],
+        "had to run to the grocery store": [
+            f"Back from shopping! {user_name}, missed you - what have you been doing?",
+            f"Grocery done! {user_name}, finally can chat properly",
+            f"Back home! {user_name}, tell me everything I missed"
+        ]
+    }
+    
+    # Get matching return message or use default
+    messages = return_phrases.get(original_excuse, [
+        f"All sorted now! {user_name}, what's up?",
+        f"Free finally! {user_name}, missed chatting with you",
+        f"Done with everything! {user_name}, tell me about your day"
+    ])
+    
+    return random.choice(messages)
+
+
+# ---------------------------
+# WINDOW STORES
+# ---------------------------
+# One open window per user: {user_id, excuse, return_time, duration_mins,
+# started_at, ends_at (epoch secs), return_message}. return_message is set
+# when the window fires and the row is deleted once it's been delivered, so
+# a restart picks up both pending timers and undelivered "I'm back"s.
+
+WINDOW_FIELDS = ("user_id", "excuse", "return_time", "duration_mins", "started_at", "ends_at", "return_message")
+
+
+class SupabaseWindowStore:
+    """unavailability_windows table (see sql/unavailability.sql)"""
+
+    def __init__(self, supabase, table="unavailability_windows"):
+        self.supabase = supabase
+        self.table = table
+
+    def load_open(self):
+        return self.supabase.table(self.table).select(", ".join(WINDOW_FIELDS)).execute().data or []
+
+    def save(self, window):
+        self.supabase.table(self.table).upsert(window, on_conflict="user_id").execute()
+
+    def update(self, user_id, values):
+        self.supabase.table(self.table).update(values).eq("user_id", user_id).execute()
+
+    def delete(self, user_id):
+        self.supabase.table(self.table).delete().eq("user_id", user_id).execute()
+
+
+class LocalWindowStore:
+    """JSON file keyed by user_id, for single-process/offline runs"""
+
+    def __init__(self, path="unavailability.json"):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, windows):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(windows, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def load_open(self):
+        with self._lock:
+            return list(self._read().values())
+
+    def save(self, window):
+        with self._lock:
+            windows = self._read()
+            windows[window["user_id"]] = dict(window)
+            self._write(windows)
+
+    def update(self, user_id, values):
+        with self._lock:
+            windows = self._read()
+            if user_id in windows:
+                windows[user_id].update(values)
+                self._write(windows)
+
+    def delete(self, user_id):
+        with self._lock:
+            windows = self._read()
+            if windows.pop(user_id, None) is not None:
+                self._write(windows)
+
+
+# ---------------------------
+# SCHEDULER
+# ---------------------------
+
+class AvailabilityScheduler:
+    """Persistent unavailability windows with a timer heap
+
+    start() opens a window and persists it. A background thread sleeps until
+    the earliest ends_at, then calls compose(window) (generate_return_message
+    plus the user's name) and parks the message until the session collects
+    it with pop_return(). Open windows are reloaded from the store on
+    startup, so timers survive restarts and page reloads.
+    """
+
+    def __init__(self, store, compose, clock=time.time):
+        self.store = store
+        self.compose = compose
+        self.clock = clock
+        self.windows = {}
+        self._heap = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self.fired = 0
+        self.delivered = 0
+        self.store_errors = 0
+        self._load()
+        self._thread = threading.Thread(target=self._run, name="availability-scheduler", daemon=True)
+        self._thread.start()
+
+    def _load(self):
+        try:
+            rows = self.store.load_open()
+        except Exception:
+            self.store_errors += 1
+            return
+        for row in rows:
+            window = {field: row.get(field) for field in WINDOW_FIELDS}
+            self.windows[window["user_id"]] = window
+            if not window["return_message"]:
+                heapq.heappush(self._heap, (window["ends_at"], window["user_id"]))
+
+    def _persist(self, action, *args):
+        try:
+            action(*args)
+        except Exception:
+            self.store_errors += 1
+
+    # --- session API ---
+    def start(self, user_id, reason):
+        """Open a window for reason (from get_single_unavailability_reason)"""
+        now = self.clock()
+        window = {
+            "user_id": user_id,
+            "excuse": reason["excuse"],
+            "return_time": reason["return_time"],
+            "duration_mins": reason["duration_mins"],
+            "started_at": now,
+            "ends_at": now + reason["duration_mins"] * 60,
+            "return_message": None,
+        }
+        with self._cond:
+            self.windows[user_id] = window
+            heapq.heappush(self._heap, (window["ends_at"], user_id))
+            self._cond.notify()
+        self._persist(self.store.save, window)
+        return window
+
+    def current(self, user_id):
+        """The user's open window while she's still busy, else None"""
+        window = self.windows.get(user_id)
+        if window is None or window["return_message"] or window["ends_at"] <= self.clock():
+            return None
+        return window
+
+    def remaining_mins(self, user_id):
+        window = self.current(user_id)
+        return (window["ends_at"] - self.clock()) / 60 if window else 0.0
+
+    def has_return(self, user_id):
+        """Is an "I'm back" message due for this user?"""
+        window = self.windows.get(user_id)
+        return window is not None and (bool(window["return_message"]) or window["ends_at"] <= self.clock())
+
+    def pop_return(self, user_id):
+        """Take the user's due "I'm back" message (None if she's still busy)"""
+        if not self.has_return(user_id):
+            return None
+        # The timer thread may not have got to it yet
+        self._fire(user_id)
+        with self._cond:
+            window = self.windows.pop(user_id, None)
+        if window is None or not window["return_message"]:
+            return None
+        self.delivered += 1
+        self._persist(self.store.delete, user_id)
+        return window["return_message"]
+
+    def stats(self):
+        return {
+            "open_windows": len(self.windows),
+            "timers": len(self._heap),
+            "fired": self.fired,
+            "delivered": self.delivered,
+            "store_errors": self.store_errors,
+        }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=1.0)
+
+    # --- timer thread ---
+    def _fire(self, user_id):
+        window = self.windows.get(user_id)
+        if window is None or window["return_message"] or window["ends_at"] > self.clock():
+            return
+        # compose may look up the user's name - keep it outside the lock
+        try:
+            message = self.compose(window)
+        except Exception:
+            message = generate_return_message(window["excuse"], "yaar")
+        with self._cond:
+            if self.windows.get(user_id) is not window or window["return_message"]:
+                return
+            window["return_message"] = message
+            self.fired += 1
+        self._persist(self.store.update, user_id, {"return_message": message})
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._heap and self._heap[0][0] <= self.clock():
+                        break
+                    timeout = self._heap[0][0] - self.clock() if self._heap else None
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+                ends_at, user_id = heapq.heappop(self._heap)
+                window = self.windows.get(user_id)
+                # Skip timers for windows that were replaced or already delivered
+                current = window is not None and window["ends_at"] == ends_at
+            if current:
+                self._fire(user_id)
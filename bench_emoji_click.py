@@ -0,0 +1,97 @@
+"""Reruns and Supabase calls per Quick Emoji click, full rerun vs fragment.
+
+Usage: python bench_emoji_click.py [clicks] [--db-latency 0.02] [--history 40]
+
+Replays what one click costs against a fake Supabase (with the given
+round-trip latency) for the three ways the sidebar has worked:
+
+  uncached  - st.rerun() of the whole script, profile fetched every rerun
+  rerun     - st.rerun() of the whole script, profile from the TTL cache
+  fragment  - the emoji panel fragment only (on_click sets session state)
+
+A full rerun also re-reads the availability scheduler and re-renders the
+visible chat log; a fragment rerun renders its own panel and nothing else.
+"""
+import argparse
+import sys
+import time
+
+from chat_log import ChatLog
+from load_test import build_pipeline
+
+EMOJIS = ["😊", "😂", "❤️", "😍", "🤔"]
+
+
+def full_rerun(pipeline, session_state, user_id):
+    """The backend work app.py does on every full script run"""
+    session = pipeline.open_session(session_state, user_id)
+    pipeline.availability.current(user_id)
+    pipeline.availability.pop_return(user_id)
+    rendered = [(message.role, message.content) for message in session_state["chat_log"].visible()]
+    return session, rendered
+
+
+def emoji_fragment(session_state, emoji):
+    """The emoji panel fragment: the click callback plus its own render"""
+    session_state["selected_emoji"] = emoji
+    return [(emoji, session_state["selected_emoji"])]
+
+
+def run_mode(mode, args):
+    pipeline, cleanup = build_pipeline(args, 0.0, args.db_latency, "/tmp/bench_emoji_spill.jsonl")
+    supabase = pipeline.supabase
+    user_id = "bench-user"
+    session_state = {"chat_log": ChatLog()}
+    for turn in range(args.history):
+        session_state["chat_log"].append("user", f"message {turn}")
+        session_state["chat_log"].append("assistant", f"reply {turn}")
+    # The page load before the first click
+    full_rerun(pipeline, session_state, user_id)
+
+    reruns = 0
+    calls_before = supabase.call_count
+    start = time.perf_counter()
+    for click in range(args.clicks):
+        emoji = EMOJIS[click % len(EMOJIS)]
+        if mode == "fragment":
+            emoji_fragment(session_state, emoji)
+            continue
+        # The button's own run, then the st.rerun() it asks for
+        for _ in range(2):
+            if mode == "uncached":
+                pipeline.user_store.invalidate(user_id)
+            emoji_fragment(session_state, emoji)
+            full_rerun(pipeline, session_state, user_id)
+            reruns += 1
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    calls = supabase.call_count - calls_before
+    cleanup()
+    return {
+        "mode": mode,
+        "reruns_per_click": reruns / args.clicks,
+        "supabase_calls_per_click": calls / args.clicks,
+        "ms_per_click": elapsed_ms / args.clicks,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the cost of a Quick Emoji click")
+    parser.add_argument("clicks", nargs="?", type=int, default=50)
+    parser.add_argument("--db-latency", type=float, default=0.02, help="fake Supabase round trip (s)")
+    parser.add_argument("--history", type=int, default=40, help="turns already in the chat log")
+    args = parser.parse_args(argv)
+    # build_pipeline options: no model limiter, no memory index, sync turns
+    args.quota_errors, args.rate, args.concurrency, args.max_wait = 0.0, 0.0, 0, 20.0
+    args.memory, args.use_async, args.busy, args.stream = False, False, 0.0, True
+
+    print(f"{args.clicks} clicks, fake Supabase latency {args.db_latency * 1000:.0f} ms")
+    print(f"{'mode':<10}{'reruns/click':>14}{'supabase/click':>16}{'ms/click':>11}")
+    for mode in ("uncached", "rerun", "fragment"):
+        report = run_mode(mode, args)
+        print(f"{report['mode']:<10}{report['reruns_per_click']:>14.1f}"
+              f"{report['supabase_calls_per_click']:>16.1f}{report['ms_per_click']:>11.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
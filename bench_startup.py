@@ -0,0 +1,122 @@
+"""Import-time and first-paint benchmark for app.py.
+
+Usage: python bench_startup.py [--runs 3] [--top 15] [--check]
+                               [--metrics http://localhost:9100/metrics.json]
+
+Imports everything app.py imports in a fresh interpreter with
+`python -X importtime` (--runs times, best run kept) and prints the wall
+time plus the slowest top-level imports. It also lists any of the deferred
+modules (google.generativeai, supabase, pytz, numpy) that the import pulled
+in eagerly; with --check that is an error, so this can guard against
+regressions in CI.
+
+First paint can't be measured without a browser session. app.py records
+first_paint / history_paint (ms from script start until the header and the
+chat history are drawn) in the tracer. --metrics reads them from a running
+app's metrics endpoint (METRICS_PORT).
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFERRED = ("google.generativeai", "supabase", "pytz", "numpy")
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+{imports}
+print(json.dumps({{
+    "ms": (time.perf_counter() - start) * 1000,
+    "eager": [name for name in {deferred!r} if name in sys.modules],
+}}))
+"""
+
+
+def app_imports(path):
+    """Top-level module names app.py imports"""
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.append(node.module)
+    return list(dict.fromkeys(names))
+
+
+def parse_importtime(stderr):
+    """-X importtime output -> [(cumulative_us, module)] for top-level imports"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        if name.startswith(" ") and not name.startswith("  "):
+            rows.append((int(cumulative), name.strip()))
+    return rows
+
+
+def measure(modules):
+    """One cold import of modules -> (report dict, top-level timings)"""
+    imports = "\n".join(f"import {name}" for name in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD.format(imports=imports, deferred=DEFERRED)],
+        cwd=HERE, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed"
+        raise RuntimeError(error)
+    return json.loads(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+
+def print_paint_metrics(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        snapshot = json.load(response)
+    print("\nfirst paint (ms from script start, rolling):")
+    for stage in ("first_paint", "history_paint"):
+        stats = snapshot.get("stages", {}).get(stage)
+        if stats:
+            print(f"  {stage:<14} " + "  ".join(f"{key}={value}" for key, value in stats.items()))
+        else:
+            print(f"  {stage:<14} no samples yet")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure app.py import time and first paint")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="slowest top-level imports to list")
+    parser.add_argument("--check", action="store_true", help="fail if a deferred module is imported eagerly")
+    parser.add_argument("--metrics", help="metrics.json URL of a running app")
+    args = parser.parse_args(argv)
+
+    modules = app_imports(os.path.join(HERE, "app.py"))
+    print(f"app.py imports: {', '.join(modules)}")
+    best = None
+    try:
+        for _ in range(args.runs):
+            report, timings = measure(modules)
+            if best is None or report["ms"] < best[0]["ms"]:
+                best = (report, timings)
+    except RuntimeError as e:
+        print(f"import failed: {e}")
+        return 2
+    report, timings = best
+    print(f"cold import  {report['ms']:.1f} ms (best of {args.runs})")
+    print(f"{'module':<40}{'cumulative ms':>15}")
+    for cumulative, name in sorted(timings, reverse=True)[:args.top]:
+        print(f"{name:<40}{cumulative / 1000:>15.1f}")
+    print(f"eager deferred modules: {', '.join(report['eager']) or 'none'}")
+
+    if args.metrics:
+        print_paint_metrics(args.metrics)
+    return 1 if args.check and report["eager"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Micro-benchmark: precompiled text_analysis vs the old per-call helpers.
+
+Usage: python bench_text_analysis.py [iterations]
+"""
+import re
+import sys
+import timeit
+
+from text_analysis import analyse, limit_emojis
+
+SAMPLES = [
+    "ok",
+    "hii 😊",
+    "gm! what's up",
+    "I'm Rahul btw, my name is Rahul Sharma 😂😂",
+    "ugh I'm so frustrated with work today, my manager is annoyed at everything 😤🔥",
+    "I miss you yaar... been a really long and tiring day ❤️❤️❤️",
+    "tell me about your day, did you finish that article you were writing about Jaipur?",
+    "I am happy, great news - got the job!!! 🎉🎉🎉",
+]
+REPLY = "Arre wah! 😊 That's amazing news yaar 🎉 so proud of you ❤️ party kab hai? 😂"
+
+
+# --- legacy implementations (as they were in app.py) ---
+def legacy_detect_user_emotion(message):
+    message_lower = message.lower()
+    if any(word in message_lower for word in ["happy", "great", "awesome", "excited"]):
+        return "happy"
+    elif any(word in message_lower for word in ["sad", "down", "upset", "hurt"]):
+        return "sad"
+    elif any(word in message_lower for word in ["angry", "mad", "frustrated", "annoyed"]):
+        return "frustrated"
+    elif any(word in message_lower for word in ["love", "adore", "care", "miss"]):
+        return "loving"
+    else:
+        return "neutral"
+
+
+def legacy_check_if_user_agreed(user_input):
+    agreement_words = ["cool", "okay", "ok", "sure", "fine", "alright", "understood", "got it", "np", "no problem"]
+    user_text = user_input.lower().strip()
+    return (user_text in agreement_words or
+            len(user_text) <= 4 and any(word in user_text for word in ["ok", "k", "sure"]))
+
+
+def legacy_extract_name(user_input):
+    name_match = re.search(r'(?:my name is|i\'m|i am) (\w+(?:\s+\w+)?)', user_input, re.IGNORECASE)
+    return name_match.group(1).strip() if name_match else None
+
+
+def legacy_limit_emojis(text, max_emojis=1):
+    emoji_pattern = re.compile(r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F700-\U0001F77F\U0001F780-\U0001F7FF\U0001F800-\U0001F8FF\U0001F900-\U0001F9FF\U0001FA00-\U0001FA6F\U0001FA70-\U0001FAFF☀-⛿✀-➿]')
+    emojis_found = emoji_pattern.findall(text)
+    if len(emojis_found) <= max_emojis:
+        return text
+    emoji_count = 0
+    result = []
+    for char in text:
+        if emoji_pattern.match(char):
+            emoji_count += 1
+            if emoji_count > max_emojis:
+                continue
+        result.append(char)
+    return ''.join(result).strip()
+
+
+def legacy_turn():
+    for message in SAMPLES:
+        legacy_detect_user_emotion(message)
+        legacy_check_if_user_agreed(message)
+        legacy_extract_name(message)
+    legacy_limit_emojis(REPLY)
+
+
+def new_turn():
+    for message in SAMPLES:
+        analyse(message)
+    limit_emojis(REPLY)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    for message in SAMPLES:
+        result = analyse(message)
+        assert result.emotion == legacy_detect_user_emotion(message), message
+        assert result.agreed == legacy_check_if_user_agreed(message), message
+        assert result.name == legacy_extract_name(message), message
+    assert limit_emojis(REPLY) == legacy_limit_emojis(REPLY)
+
+    legacy = min(timeit.repeat(legacy_turn, number=iterations, repeat=3))
+    new = min(timeit.repeat(new_turn, number=iterations, repeat=3))
+    per_message = 1e6 / (iterations * len(SAMPLES))
+    print(f"{len(SAMPLES)} messages + 1 reply, {iterations} iterations")
+    print(f"legacy  {legacy * per_message:7.2f} us/message")
+    print(f"new     {new * per_message:7.2f} us/message  ({legacy / new:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+import random
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from availability import get_single_unavailability_reason, should_become_unavailable
+from chat_log import TIMESTAMP_FORMAT
+from history_cache import fetch_unfolded_turns, get_history_cache
+from model_router import PRO
+from summariser import get_rolling_summary
+from text_analysis import analyse, limit_emojis
+from user_state import IST
+
+# ---------------------------
+# CHAT TURN PIPELINE
+# ---------------------------
+# Everything one chat turn does, independent of Streamlit:
+#   availability -> profile -> history -> prompt -> generate -> save
+# app.py drives it with a StreamlitView; load_test.py drives it headless
+# with fakes. Each stage's wall time lands in TurnResult.timings as
+# "<stage>_ms" (plus "turn_ms"), and in the tracer's histograms if one is
+# attached.
+
+STAGES = ("availability", "profile", "history", "prompt", "generate", "save")
+
+FALLBACK_RESPONSE = "Sorry yaar, my brain's a bit foggy right now... can you say that again?"
+
+# What a turn ended up doing
+RETURNED = "returned"          # she came back from a busy window
+BUSY_ACK = "busy_ack"          # user agreed to wait - no reply
+BUSY_REMINDER = "busy_reminder"
+WENT_BUSY = "went_busy"
+CACHED = "cached"
+REPLY = "reply"
+SUPERSEDED = "superseded"      # a newer turn from the same user took over - nothing saved
+
+ChatSession = namedtuple("ChatSession", ["user_id", "user_data", "history", "summary", "timings"])
+TurnResult = namedtuple("TurnResult", ["kind", "response", "timings", "prompt_tokens"])
+
+
+class HeadlessView:
+    """No UI - replies are only returned (load tests, scripts)"""
+
+    def start_typing(self):
+        pass
+
+    def show(self, text):
+        pass
+
+    def stream(self, chunks, fallback):
+        try:
+            text = "".join(chunks).strip()
+        except Exception:
+            text = ""
+        return text or fallback
+
+
+class StageTimer:
+    """Adds a block's wall time (ms) to timings["<stage>_ms"]"""
+
+    def __init__(self, timings, stage):
+        self.timings = timings
+        self.key = f"{stage}_ms"
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = (time.perf_counter() - self.start) * 1000
+        self.timings[self.key] = round(self.timings.get(self.key, 0.0) + elapsed, 3)
+        return False
+
+
+class ChatPipeline:
+    """One chat turn, end to end, over injected clients
+
+    A view renders what the user sees: start_typing(), show(text) for a
+    complete message and stream(chunks, fallback) -> text for a streamed
+    reply. Session-scoped objects (history cache, rolling summary) live in
+    the session_state mapping passed to open_session().
+    """
+
+    def __init__(self, supabase, router, user_store, chat_writer, prompt_builder, availability, persona_context,
+                 response_cache=None, memory_store=None, summariser=None, history_depth=5, summary_every=10,
+                 memory_top_k=3, memory_backfill_rows=500, busy_probability=0.20, routing=True, stream=True,
+                 fallback_response=FALLBACK_RESPONSE, clock=None, rng=random, tracer=None, coalescer=None,
+                 relationship=None):
+        self.supabase = supabase
+        self.router = router
+        self.user_store = user_store
+        self.chat_writer = chat_writer
+        self.prompt_builder = prompt_builder
+        self.availability = availability
+        self.persona_context = persona_context
+        self.response_cache = response_cache
+        self.memory_store = memory_store
+        self.summariser = summariser
+        self.history_depth = history_depth
+        self.summary_every = summary_every
+        self.memory_top_k = memory_top_k
+        self.memory_backfill_rows = memory_backfill_rows
+        self.busy_probability = busy_probability
+        self.routing = routing
+        self.stream = stream
+        self.fallback_response = fallback_response
+        self.clock = clock or (lambda: datetime.now(IST))
+        self.rng = rng
+        self.tracer = tracer
+        self.coalescer = coalescer
+        self.relationship = relationship
+
+    # --- session ---
+    def open_session(self, session_state, user_id):
+        """Profile, history cache and rolling summary for this rerun"""
+        timings = {}
+        with StageTimer(timings, "profile"):
+            user_data = self.user_store.load(user_id)
+        with StageTimer(timings, "history"):
+            history = get_history_cache(session_state, self.supabase, user_id, self.history_depth)
+            summary = None
+            if self.summariser is not None:
+                summary = get_rolling_summary(
+                    session_state, user_id, self.summariser, self.summary_every, user_data['personality'],
+                    persist=lambda text, turns, through: self.user_store.update_summary(user_id, text, turns, through),
+                    fetch_unfolded=lambda after_id, limit: fetch_unfolded_turns(
+                        self.supabase, user_id, after_id, self.history_depth, limit),
+                )
+            if self.memory_store is not None:
+                self.memory_store.ensure_loaded(user_id, self.fetch_memory_rows)
+        return ChatSession(user_id, user_data, history, summary, timings)
+
+    def fetch_memory_rows(self, user_id):
+        """Past chats used to (re)build a user's memory index"""
+        response = self.supabase.table('chats').select('user_message, ai_response').eq('user_id', user_id).order('timestamp', desc=True).limit(self.memory_backfill_rows).execute()
+        return response.data or []
+
+    def timestamp(self):
+        """Now, formatted like the chats table's timestamp column"""
+        return self.clock().strftime(TIMESTAMP_FORMAT)
+
+    def save(self, session, user_message, ai_response, kind=REPLY):
+        """Queue conversation for a batched write to the database (kind: what the turn was)"""
+        evicted = session.history.append(user_message, ai_response)
+        if evicted and session.summary is not None:
+            session.summary.add(evicted)
+        if self.memory_store is not None:
+            self.memory_store.add_turn(session.user_id, user_message, ai_response)
+        self.chat_writer.put({
+            'user_id': session.user_id,
+            'user_message': user_message,
+            'ai_response': ai_response,
+            'kind': kind,
+            'timestamp': self.timestamp()
+        })
+
+    # --- turn ---
+    def run_turn(self, session, user_input, view=None):
+        """Handle one user message -> TurnResult"""
+        start = time.perf_counter()
+        result = self._run_turn(session, user_input, view or HeadlessView())
+        result.timings["turn_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        if self.tracer is not None:
+            self.tracer.record_turn(result.timings, result.prompt_tokens)
+        return result
+
+    def _run_turn(self, session, user_input, view):
+        timings = dict(session.timings)
+        analysis = analyse(user_input)
+
+        with StageTimer(timings, "availability"):
+            outcome = self._check_availability(session, user_input, analysis)
+        if outcome is not None:
+            kind, response = outcome
+            if response:
+                view.show(response)
+            with StageTimer(timings, "save"):
+                self.save(session, user_input, response, kind)
+            return TurnResult(kind, response, timings, None)
+
+        # Normal conversation - typing goes up while the real work runs
+        view.start_typing()
+        token = None
+        if self.coalescer is not None:
+            # Messages whose reply never arrived (the run was interrupted) are answered together
+            token = self.coalescer.push(session.user_id, user_input)
+            pending = self.coalescer.pending(session.user_id)
+            if len(pending) > 1:
+                user_input = "\n".join(pending)
+                timings["coalesced"] = len(pending)
+        if self.relationship is not None:
+            # Mood / intimacy / stage react to this message before the prompt is built
+            with StageTimer(timings, "profile"):
+                self.relationship.observe(session.user_id, session.user_data['personality'], analysis.emotion,
+                                          self.clock())
+        kind, response, prompt_tokens = self._converse(session, user_input, analysis, view, timings)
+        if kind == SUPERSEDED:
+            # The newer turn answers this message too (it's still pending in the coalescer)
+            return TurnResult(kind, response, timings, prompt_tokens)
+        with StageTimer(timings, "save"):
+            self.save(session, user_input, response, kind)
+        if token is not None:
+            self.coalescer.resolve(session.user_id, token)
+        return TurnResult(kind, response, timings, prompt_tokens)
+
+    def _converse(self, session, user_input, analysis, view, timings):
+        """Reply to a normal message -> (kind, response, prompt_tokens)"""
+        with StageTimer(timings, "profile"):
+            self._update_name(session, analysis)
+
+        now = self.clock()
+        with StageTimer(timings, "prompt"):
+            cache_key, cached_response = self._cache_lookup(session, user_input, now)
+        if cached_response:
+            return self._serve_cached(cached_response, view, timings)
+
+        with StageTimer(timings, "history"):
+            recent = session.history.recent()
+            memories = self._recall(session.user_id, user_input, recent)
+        with StageTimer(timings, "prompt"):
+            context = self._context(session, analysis, now)
+            prompt, prompt_tokens = self._build_prompt(session, context, recent, user_input, memories)
+            tier = self._route(user_input, analysis, recent, timings)
+        with StageTimer(timings, "generate"):
+            response = self._generate(tier, prompt, view, timings)
+        self._store_reply(session, cache_key, response)
+        return REPLY, response, prompt_tokens
+
+    # --- turn steps ---
+    def _update_name(self, session, analysis):
+        if analysis.name:
+            session.user_data['profile']['name'] = analysis.name
+            # Update in database (and drop the cached user state)
+            try:
+                self.user_store.update_name(session.user_id, analysis.name)
+            except Exception:
+                pass
+
+    def _cache_lookup(self, session, user_input, now):
+        """Short generic messages ("ok", "hi", "gm") can come from this user's cached replies"""
+        if self.response_cache is None:
+            return None, None
+        personality = session.user_data['personality']
+        cache_key = self.response_cache.make_key(
+            session.user_id, user_input, personality['current_mood'],
+            personality.get('relationship_stage', 'getting_to_know'), now.hour,
+        )
+        return cache_key, self.response_cache.lookup(cache_key, session.user_data['profile'].get('name', ''))
+
+    def _serve_cached(self, cached_response, view, timings):
+        response = limit_emojis(cached_response, max_emojis=1)
+        view.show(response)
+        timings["cached"] = True
+        return CACHED, response, None
+
+    def _context(self, session, analysis, now):
+        user_data = session.user_data
+        return {
+            "Date and time": now.strftime("%Y-%m-%d %H:%M IST"),
+            "User's name": user_data['profile'].get('name', 'Not known yet'),
+            "Your mood": user_data['personality']['current_mood'],
+            "Relationship stage": user_data['personality'].get('relationship_stage', 'getting_to_know').replace("_", " "),
+            "User's emotion": analysis.emotion,
+            **self.persona_context.prompt_context(now),
+        }
+
+    def _build_prompt(self, session, context, recent, user_input, memories):
+        return self.prompt_builder.build(
+            context,
+            recent,
+            user_input,
+            summary=session.summary.summary if session.summary is not None else "",
+            memories=memories,
+        )
+
+    def _route(self, user_input, analysis, recent, timings):
+        """Pick a model tier for this turn"""
+        if self.routing:
+            tier, route_reason = self.router.route(user_input, analysis.emotion, len(recent))
+        else:
+            tier, route_reason = PRO, "routing_disabled"
+        timings["tier"] = tier
+        timings["route_reason"] = route_reason
+        return tier
+
+    def _store_reply(self, session, cache_key, response):
+        if response != self.fallback_response and self.response_cache is not None:
+            self.response_cache.store(cache_key, response, session.user_data['profile'].get('name', ''))
+
+    def _check_availability(self, session, user_input, analysis):
+        """(kind, response) if availability decides the turn, else None"""
+        user_id = session.user_id
+        user_data = session.user_data
+
+        # CHECK 1: Should she return from unavailability?
+        return_message = self.availability.pop_return(user_id)
+        if return_message:
+            return RETURNED, return_message
+
+        # CHECK 2: Is she currently unavailable?
+        busy_window = self.availability.current(user_id)
+        if busy_window:
+            if analysis.agreed:
+                # User agreed - Malavika should NOT respond
+                return BUSY_ACK, ""
+            # User didn't agree clearly - give ONE more gentle reminder
+            excuse = busy_window['excuse']
+            return_time = busy_window['return_time']
+            reminder_responses = [
+                f"Still {excuse}, {user_data['profile'].get('name', 'yaar')}. Will message you {return_time}",
+                f"Hey, still busy with this. Text you {return_time} okay?",
+                f"Quick sec - still {excuse}. Chat {return_time}?"
+            ]
+            return BUSY_REMINDER, self.rng.choice(reminder_responses)
+
+        # CHECK 3: Should she become unavailable now?
+        if should_become_unavailable(self.busy_probability, self.rng):
+            # Get ONE single reason, persist the window and start its timer
+            unavailability_reason = get_single_unavailability_reason()
+            self.availability.start(user_id, unavailability_reason)
+            excuse_responses = [
+                f"Hey! I'm {unavailability_reason['excuse']} right now. Will text you {unavailability_reason['return_time']}, okay?",
+                f"Arre, {unavailability_reason['excuse']} currently. Will message you {unavailability_reason['return_time']}",
+                f"Quick reply - {unavailability_reason['excuse']}! Will chat properly {unavailability_reason['return_time']}"
+            ]
+            response = self.rng.choice(excuse_responses)
+            return WENT_BUSY, limit_emojis(response, max_emojis=0)  # No emojis when busy
+        return None
+
+    def _recall(self, user_id, user_input, recent):
+        """Older turns related to this message"""
+        if self.memory_store is None:
+            return []
+        try:
+            return self.memory_store.recall(user_id, user_input, self.memory_top_k, exclude=recent)
+        except Exception:
+            return []
+
+    def _generate(self, tier, prompt, view, timings):
+        if self.stream:
+            chunks = self.router.stream(tier, prompt, max_emojis=1, timings=timings)
+            response = view.stream(chunks, self.fallback_response)
+            return response.strip() if isinstance(response, str) and response.strip() else self.fallback_response
+        start = time.perf_counter()
+        try:
+            response, timings["tier"] = self.router.generate(tier, prompt, timings)
+            response = limit_emojis(response, max_emojis=1)
+        except Exception:
+            response = self.fallback_response
+        timings["total_ms"] = timings["ttft_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        view.show(response)
+        return response
+
+    def handle(self, session_state, user_id, user_input, view=None):
+        """open_session + run_turn, i.e. what one rerun with input does"""
+        return self.run_turn(self.open_session(session_state, user_id), user_input, view)
@@ -0,0 +1,114 @@
+from collections import deque
+
+# ---------------------------
+# WINDOWED CHAT LOG
+# ---------------------------
+# What the chat pane shows. Only the last `window` messages are rendered;
+# "load earlier" widens the window, first over messages already in memory
+# and then by pulling older turns from the chats table (keyset pagination
+# on (timestamp, id) - timestamps only have second resolution, so several
+# rows can share one). At most `capacity` messages are held per session.
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class ChatMessage:
+    __slots__ = ("role", "content", "ts", "row_id")
+
+    def __init__(self, role, content, ts=None, row_id=None):
+        self.role = role
+        self.content = content
+        self.ts = ts
+        self.row_id = row_id
+
+
+def fetch_turns_before(supabase, user_id, before, limit):
+    """Up to limit chat rows older than before = (timestamp, id) (newest first; all rows if before is None)
+
+    Messages from this session have no row id yet; for those the cursor is
+    (timestamp, None) and only strictly older timestamps are fetched, which
+    also keeps their own (later-stamped) rows out.
+    """
+    query = supabase.table('chats').select('id, user_message, ai_response, timestamp').eq('user_id', user_id)
+    if before is not None:
+        before_ts, before_id = before
+        if before_id is None:
+            query = query.lt('timestamp', before_ts)
+        else:
+            query = query.or_(f'timestamp.lt."{before_ts}",and(timestamp.eq."{before_ts}",id.lt.{before_id})')
+    return query.order('timestamp', desc=True).order('id', desc=True).limit(limit).execute().data or []
+
+
+class ChatLog:
+    """Bounded message log with a render window"""
+
+    def __init__(self, capacity=200, page_size=30):
+        self.messages = deque(maxlen=capacity)
+        self.page_size = page_size
+        self.window = page_size
+        # Unknown until a fetch comes back short
+        self.more_in_db = True
+
+    def __len__(self):
+        return len(self.messages)
+
+    @property
+    def capacity(self):
+        return self.messages.maxlen
+
+    def append(self, role, content, ts=None):
+        if len(self.messages) == self.capacity:
+            # The oldest message falls out of memory but is still in the database
+            self.more_in_db = True
+        self.messages.append(ChatMessage(role, content, ts))
+
+    def visible(self):
+        """Messages to render, oldest first"""
+        count = min(self.window, len(self.messages))
+        return [self.messages[i] for i in range(len(self.messages) - count, len(self.messages))]
+
+    def hidden(self):
+        """Messages in memory but outside the window"""
+        return max(0, len(self.messages) - self.window)
+
+    def can_load_earlier(self):
+        return self.hidden() > 0 or (self.more_in_db and len(self.messages) < self.capacity)
+
+    def load_earlier(self, fetch_rows):
+        """Widen the window by a page, fetching from the database if memory runs out
+
+        fetch_rows(before, limit) -> chat rows newest first (see fetch_turns_before).
+        """
+        self.window += self.page_size
+        missing = min(self.window, self.capacity) - len(self.messages)
+        if missing <= 0 or not self.more_in_db:
+            return 0
+        before = (self.messages[0].ts, self.messages[0].row_id) if self.messages else None
+        # Each row is up to two messages
+        rows = fetch_rows(before, -(-missing // 2))
+        if len(rows) < -(-missing // 2):
+            self.more_in_db = False
+        older = []
+        for row in reversed(rows):
+            if row.get('user_message'):
+                older.append(ChatMessage("user", row['user_message'], row.get('timestamp'), row.get('id')))
+            if row.get('ai_response'):
+                older.append(ChatMessage("assistant", row['ai_response'], row.get('timestamp'), row.get('id')))
+        room = self.capacity - len(self.messages)
+        if len(older) > room:
+            older = older[len(older) - room:]
+            self.more_in_db = True
+        self.messages.extendleft(reversed(older))
+        return len(older)
+
+    def stats(self):
+        return {"held": len(self.messages), "capacity": self.capacity, "window": self.window,
+                "more_in_db": self.more_in_db}
+
+
+def get_chat_log(session_state, capacity=200, page_size=30):
+    """The session's ChatLog (created on first use)"""
+    log = session_state.get("chat_log")
+    if log is None or log.capacity != capacity or log.page_size != page_size:
+        log = session_state["chat_log"] = ChatLog(capacity, page_size)
+    return log
@@ -0,0 +1,350 @@
+import asyncio
+import copy
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+# ---------------------------
+# IN-PROCESS STAND-INS (tests, benchmarks, offline runs)
+# ---------------------------
+
+
+class _FakeQuery:
+    """Tiny subset of the postgrest query builder used by this app"""
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table_name = table
+        self.op = "select"
+        self.payload = None
+        self.columns = "*"
+        self.filters = []
+        self.order_by = []
+        self.row_limit = None
+        self.on_conflict = None
+
+    # --- operations ---
+    def select(self, columns="*"):
+        self.op, self.columns = "select", columns
+        return self
+
+    def insert(self, rows):
+        self.op, self.payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict=None):
+        self.op, self.payload, self.on_conflict = "upsert", rows, on_conflict
+        return self
+
+    def update(self, values):
+        self.op, self.payload = "update", values
+        return self
+
+    def delete(self):
+        self.op = "delete"
+        return self
+
+    # --- filters / modifiers ---
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) >= value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) < value)
+        return self
+
+    def or_(self, filters):
+        """PostgREST logic tree, e.g. 'a.lt.1,and(a.eq.1,b.lt.2)' (eq/lt/lte/gt/gte, nested and()/or())"""
+        self.filters.append(_parse_logic("or", filters))
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by.append((column, desc))
+        return self
+
+    def limit(self, n):
+        self.row_limit = n
+        return self
+
+    # --- execution ---
+    def _matches(self, row):
+        return all(f(row) for f in self.filters)
+
+    def _project(self, row):
+        if self.columns.strip() == "*":
+            return dict(row)
+        wanted = [c.strip() for c in self.columns.split(",")]
+        return {c: row.get(c) for c in wanted}
+
+    def execute(self):
+        self.db._record(self.table_name, self.op)
+        rows = self.db.tables.setdefault(self.table_name, [])
+
+        if self.op == "select":
+            result = [row for row in rows if self._matches(row)]
+            for column, desc in reversed(self.order_by):
+                result.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+            if self.row_limit is not None:
+                result = result[:self.row_limit]
+            return SimpleNamespace(data=[self._project(row) for row in result])
+
+        if self.op in ("insert", "upsert"):
+            new_rows = self.payload if isinstance(self.payload, list) else [self.payload]
+            key = self.db.primary_keys.get(self.table_name) if self.op == "upsert" else None
+            key = self.on_conflict or key
+            written = []
+            for new_row in new_rows:
+                new_row = copy.deepcopy(new_row)
+                if "id" not in new_row and key != "id":
+                    self.db.sequence += 1
+                    new_row.setdefault("id", self.db.sequence)
+                existing = next((row for row in rows if key and row.get(key) == new_row.get(key)), None)
+                if existing is not None:
+                    existing.update(new_row)
+                    written.append(dict(existing))
+                else:
+                    rows.append(new_row)
+                    written.append(dict(new_row))
+            return SimpleNamespace(data=written)
+
+        if self.op == "update":
+            updated = []
+            for row in rows:
+                if self._matches(row):
+                    row.update(copy.deepcopy(self.payload))
+                    updated.append(dict(row))
+            return SimpleNamespace(data=updated)
+
+        if self.op == "delete":
+            kept = [row for row in rows if not self._matches(row)]
+            deleted = [row for row in rows if self._matches(row)]
+            self.db.tables[self.table_name] = kept
+            return SimpleNamespace(data=deleted)
+
+        raise ValueError(f"Unsupported operation {self.op}")
+
+
+_COMPARE = {
+    "eq": lambda a, b: a == b,
+    "lt": lambda a, b: a < b,
+    "lte": lambda a, b: a <= b,
+    "gt": lambda a, b: a > b,
+    "gte": lambda a, b: a >= b,
+}
+
+
+def _split_top_level(text):
+    """'a,and(b,c),d' -> ['a', 'and(b,c)', 'd'] (commas inside parentheses or quotes don't split)"""
+    parts, depth, quoted, current = [], 0, False, ""
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and char == "," and not depth:
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    return parts + [current]
+
+
+def _parse_logic(operator, text):
+    """Predicate for a PostgREST and/or filter list"""
+    predicates = []
+    for part in _split_top_level(text):
+        if part.startswith(("and(", "or(")):
+            nested, inner = part.split("(", 1)
+            predicates.append(_parse_logic(nested, inner[:-1]))
+            continue
+        column, op, raw = part.split(".", 2)
+        predicates.append(_condition(column, _COMPARE[op], raw.strip('"')))
+    combine = all if operator == "and" else any
+    return lambda row: combine(p(row) for p in predicates)
+
+
+def _condition(column, compare, raw):
+    def matches(row):
+        value = row.get(column)
+        if value is None:
+            return False
+        # Filter values arrive as text; compare in the column's type
+        return compare(value, type(value)(raw) if isinstance(value, (int, float)) else raw)
+    return matches
+
+
+class _FakeRpc:
+    def __init__(self, db, name, params):
+        self.db = db
+        self.name = name
+        self.params = params or {}
+
+    def execute(self):
+        self.db._record(f"rpc:{self.name}", "rpc")
+        fn = self.db.functions.get(self.name)
+        if fn is None:
+            raise RuntimeError(f"PGRST202: Could not find the function public.{self.name}")
+        return SimpleNamespace(data=fn(self.db, **self.params))
+
+
+class FakeSupabase:
+    """In-memory Supabase client: tables are lists of dicts, RPCs are Python callables
+
+    latency_secs is slept on every execute() to mimic a network round trip.
+    """
+
+    def __init__(self, latency_secs=0.0, primary_keys=None):
+        self.tables = {}
+        self.functions = {}
+        self.primary_keys = {"user_profiles": "user_id", "ai_personality_state": "user_id"}
+        self.primary_keys.update(primary_keys or {})
+        self.latency_secs = latency_secs
+        self.sequence = 0
+        self.calls = []
+
+    def _record(self, target, op):
+        self.calls.append((target, op))
+        if self.latency_secs:
+            time.sleep(self.latency_secs)
+
+    def table(self, name):
+        return _FakeQuery(self, name)
+
+    def rpc(self, name, params=None):
+        return _FakeRpc(self, name, params)
+
+    def put_row(self, table, row, key):
+        """Server-side upsert for RPC stand-ins (not counted as a round trip)"""
+        rows = self.tables.setdefault(table, [])
+        existing = next((r for r in rows if r.get(key) == row.get(key)), None)
+        if existing is not None:
+            existing.update(copy.deepcopy(row))
+        else:
+            rows.append(copy.deepcopy(row))
+
+    def register_rpc(self, name, fn):
+        """fn(db, **params) -> data"""
+        self.functions[name] = fn
+
+    @property
+    def call_count(self):
+        return len(self.calls)
+
+
+class FakeAPIError(Exception):
+    """Looks like a google.api_core error: carries an HTTP status in .code"""
+
+    def __init__(self, code=429, message="Resource has been exhausted (e.g. check quota)."):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class _FakeChunk:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class FakeGeminiModel:
+    """Stand-in for genai.GenerativeModel: canned replies after a configurable delay
+
+    latency_secs is the whole call; when streaming, the first chunk arrives
+    after ttft_secs (default: a third of the latency) and the rest of the
+    reply is spread over the remaining time. To simulate quota pressure,
+    the first fail_first calls and then a random error_rate share of calls
+    raise FakeAPIError(error_code) after error_latency_secs.
+    """
+
+    DEFAULT_REPLIES = [
+        "Aww that's sweet, tell me more about it",
+        "Haha you're too much yaar, what happened next?",
+        "Hmm I get that... how are you feeling about it now?",
+        "Arre wait, really? That's so exciting!",
+    ]
+
+    def __init__(self, latency_secs=0.5, ttft_secs=None, chunks=4, model_name="models/fake-gemini", replies=None,
+                 error_rate=0.0, error_code=429, fail_first=0, error_latency_secs=0.05, seed=None):
+        self.latency_secs = latency_secs
+        self.ttft_secs = latency_secs / 3 if ttft_secs is None else ttft_secs
+        self.chunks = max(1, chunks)
+        self.model_name = model_name
+        self.replies = replies or self.DEFAULT_REPLIES
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.fail_first = fail_first
+        self.error_latency_secs = error_latency_secs
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _next_reply(self):
+        """Reply text for this call, or None if this call should fail"""
+        with self._lock:
+            self.calls += 1
+            if self.calls <= self.fail_first or self._rng.random() < self.error_rate:
+                self.errors += 1
+                return None
+            return self.replies[self.calls % len(self.replies)]
+
+    def _usage(self, prompt, reply):
+        return SimpleNamespace(prompt_token_count=len(str(prompt)) // 4, candidates_token_count=len(reply) // 4)
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        reply = self._next_reply()
+        if reply is None:
+            time.sleep(self.error_latency_secs)
+            raise FakeAPIError(self.error_code)
+        if not stream:
+            time.sleep(self.latency_secs)
+            return SimpleNamespace(text=reply, usage_metadata=self._usage(prompt, reply))
+        return self._stream(prompt, reply)
+
+    def _plan(self, prompt, reply):
+        """[(delay_before, chunk)] for a streamed reply"""
+        words = reply.split(" ")
+        size = -(-len(words) // self.chunks)
+        parts = [" ".join(words[i:i + size]) for i in range(0, len(words), size)]
+        gap = max(0.0, self.latency_secs - self.ttft_secs) / max(1, len(parts) - 1)
+        plan = []
+        for i, part in enumerate(parts):
+            last = i == len(parts) - 1
+            chunk = _FakeChunk(part if not i else " " + part, self._usage(prompt, reply) if last else None)
+            plan.append((gap if i else self.ttft_secs, chunk))
+        return plan
+
+    def _stream(self, prompt, reply):
+        for delay, chunk in self._plan(prompt, reply):
+            time.sleep(delay)
+            yield chunk
+
+    async def generate_content_async(self, prompt, stream=False, request_options=None):
+        reply = self._next_reply()
+        if reply is None:
+            await asyncio.sleep(self.error_latency_secs)
+            raise FakeAPIError(self.error_code)
+        if not stream:
+            await asyncio.sleep(self.latency_secs)
+            return SimpleNamespace(text=reply, usage_metadata=self._usage(prompt, reply))
+        return self._stream_async(prompt, reply)
+
+    async def _stream_async(self, prompt, reply):
+        for delay, chunk in self._plan(prompt, reply):
+            await asyncio.sleep(delay)
+            yield chunk
@@ -0,0 +1,76 @@
+from collections import deque
+
+# ---------------------------
+# SESSION-LOCAL HISTORY CACHE
+# ---------------------------
+NO_HISTORY = "No prior history."
+
+
+def format_turn(user_message, ai_response):
+    return f"You: {user_message}\nMalavika: {ai_response}"
+
+
+class HistoryCache:
+    """Bounded ring buffer of the most recent (user_message, ai_response) turns"""
+
+    def __init__(self, depth=5):
+        self.turns = deque(maxlen=depth)
+        self.seeded = False
+
+    def seed(self, rows):
+        """Load rows (oldest first) fetched from the chats table"""
+        self.turns.clear()
+        for row in rows:
+            self.append(row.get('user_message', ''), row.get('ai_response', ''))
+        self.seeded = True
+
+    def append(self, user_message, ai_response):
+        """Add a turn; returns the turn pushed out of the window, if any"""
+        evicted = self.turns[0] if len(self.turns) == self.turns.maxlen else None
+        self.turns.append((user_message or '', ai_response or ''))
+        return evicted
+
+    def recent(self, n=None):
+        """Last n turns (all if n is None), oldest first"""
+        turns = list(self.turns)
+        return turns if n is None else turns[-n:]
+
+    def format(self, n=None):
+        turns = self.recent(n)
+        if not turns:
+            return NO_HISTORY
+        return "\n".join([format_turn(user_message, ai_response) for user_message, ai_response in turns])
+
+
+def fetch_recent_turns(supabase, user_id, depth):
+    """Most recent chat rows for a user, oldest first"""
+    recent_chats = supabase.table('chats').select('user_message, ai_response').eq('user_id', user_id).order('timestamp', desc=True).limit(depth).execute()
+    return (recent_chats.data or [])[::-1]
+
+
+def fetch_unfolded_turns(supabase, user_id, after_id, keep_recent, limit):
+    """Chat rows past the summary watermark (id > after_id) that are older than
+    the newest keep_recent rows - up to the newest limit of them, oldest first"""
+    newest = supabase.table('chats').select('id').eq('user_id', user_id).order('id', desc=True).limit(keep_recent).execute().data or []
+    if len(newest) < keep_recent:
+        return []
+    rows = supabase.table('chats').select('id, user_message, ai_response').eq('user_id', user_id).gt('id', after_id or 0).lt('id', newest[-1]['id']).order('id', desc=True).limit(limit).execute().data or []
+    return rows[::-1]
+
+
+def get_history_cache(session_state, supabase, user_id, depth=5):
+    """The session's history cache for user_id, seeded from Supabase on a miss
+
+    A failed seed leaves the cache unseeded, so the next turn retries the
+    query instead of treating the user as brand new.
+    """
+    caches = session_state.setdefault("history_caches", {})
+    cache = caches.get(user_id)
+    if cache is None or cache.turns.maxlen != depth:
+        cache = caches[user_id] = HistoryCache(depth)
+    if not cache.seeded:
+        try:
+            cache.seed(fetch_recent_turns(supabase, user_id, depth))
+        except Exception:
+            pass
+    return cache
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+from datetime import date, datetime, timezone
+
+from ttl_cache import TTLCache
+
+# ---------------------------
+# SESSION IDENTITY
+# ---------------------------
+# A visitor is identified by an opaque token kept in the page URL (?sid=...),
+# so it survives reloads and bookmarks. The token maps to a stable user_id
+# through a server-side session store with a sliding TTL. Only a SHA-256 of
+# the token is stored. Lookups are cached in-process and last_seen is
+# written at most once per touch_every, not on every rerun.
+#
+# Before this, user_id was md5("user_fingerprint_<unix day>_malavika_user"),
+# which was the same for every visitor on a given day. legacy_user_id()
+# reproduces those ids for migrate_identities.py.
+
+SESSION_FIELDS = ("token_hash", "user_id", "created_at", "last_seen", "expires_at")
+
+DEFAULT_SESSION_TTL_SECS = 90 * 86400
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def new_user_id():
+    """32 hex chars, the same shape as the old md5 ids"""
+    return secrets.token_hex(16)
+
+
+def legacy_user_id(day):
+    """The day-bucketed id every visitor got on day (a date or a unix day number)"""
+    if isinstance(day, date):
+        day = (datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp()) // 86400
+    return hashlib.md5(f"user_fingerprint_{int(day)}_malavika_user".encode()).hexdigest()
+
+
+# ---------------------------
+# SESSION STORES
+# ---------------------------
+class SupabaseSessionStore:
+    """user_sessions table (see sql/identity.sql)"""
+
+    def __init__(self, supabase, table="user_sessions"):
+        self.supabase = supabase
+        self.table = table
+
+    def get(self, token_hash):
+        rows = self.supabase.table(self.table).select(", ".join(SESSION_FIELDS)).eq("token_hash", token_hash).execute().data
+        return rows[0] if rows else None
+
+    def save(self, session):
+        self.supabase.table(self.table).upsert(session, on_conflict="token_hash").execute()
+
+    def update(self, token_hash, values):
+        self.supabase.table(self.table).update(values).eq("token_hash", token_hash).execute()
+
+    def delete(self, token_hash):
+        self.supabase.table(self.table).delete().eq("token_hash", token_hash).execute()
+
+
+class LocalSessionStore:
+    """JSON file keyed by token hash, for single-process/offline runs"""
+
+    def __init__(self, path="sessions.json"):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, sessions):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(sessions, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, token_hash):
+        with self._lock:
+            return self._read().get(token_hash)
+
+    def save(self, session):
+        with self._lock:
+            sessions = self._read()
+            sessions[session["token_hash"]] = dict(session)
+            self._write(sessions)
+
+    def update(self, token_hash, values):
+        with self._lock:
+            sessions = self._read()
+            if token_hash in sessions:
+                sessions[token_hash].update(values)
+                self._write(sessions)
+
+    def delete(self, token_hash):
+        with self._lock:
+            sessions = self._read()
+            if sessions.pop(token_hash, None) is not None:
+                self._write(sessions)
+
+
+# ---------------------------
+# IDENTITY SERVICE
+# ---------------------------
+class IdentityService:
+    """token -> user_id, with a sliding expiry"""
+
+    def __init__(self, store, ttl_secs=DEFAULT_SESSION_TTL_SECS, touch_every=3600.0, cache_size=4096,
+                 clock=time.time):
+        self.store = store
+        self.ttl_secs = ttl_secs
+        self.touch_every = touch_every
+        self.clock = clock
+        self.cache = TTLCache(maxsize=cache_size, ttl=touch_every)
+        self.created = 0
+        self.resolved = 0
+        self.expired = 0
+
+    def create(self, user_id=None):
+        """New session (and user_id, unless given) -> (token, session)"""
+        token = secrets.token_urlsafe(24)
+        now = self.clock()
+        session = {
+            "token_hash": hash_token(token),
+            "user_id": user_id or new_user_id(),
+            "created_at": now,
+            "last_seen": now,
+            "expires_at": now + self.ttl_secs,
+        }
+        self.store.save(session)
+        self.cache.set(session["token_hash"], session)
+        self.created += 1
+        return token, session
+
+    def resolve(self, token):
+        """Session for token, or None if unknown or expired
+
+        A hit from the in-process cache costs nothing; otherwise the store is
+        read once and the expiry slides forward.
+        """
+        if not token:
+            return None
+        token_hash = hash_token(token)
+        session = self.cache.get(token_hash)
+        if session is not None:
+            self.resolved += 1
+            return session
+        session = self.store.get(token_hash)
+        now = self.clock()
+        if session is None:
+            return None
+        if session["expires_at"] <= now:
+            self.expired += 1
+            self.store.delete(token_hash)
+            return None
+        session = dict(session, last_seen=now, expires_at=now + self.ttl_secs)
+        self.store.update(token_hash, {"last_seen": now, "expires_at": session["expires_at"]})
+        self.cache.set(token_hash, session)
+        self.resolved += 1
+        return session
+
+    def revoke(self, token):
+        token_hash = hash_token(token)
+        self.cache.pop(token_hash)
+        self.store.delete(token_hash)
+
+    def stats(self):
+        return {"created": self.created, "resolved": self.resolved, "expired": self.expired,
+                "cached": len(self.cache)}
@@ -0,0 +1,67 @@
+import threading
+import time
+
+# ---------------------------
+# DEFERRED CLIENTS
+# ---------------------------
+# A LazyProxy stands in for a client whose import or construction is slow
+# (google.generativeai, supabase). Nothing is built until an attribute is
+# first used, or until warm() builds it on a background thread while the
+# page renders. A caller that arrives mid-build waits for that build
+# instead of starting another.
+
+_OWN_ATTRS = frozenset(["_factory", "_name", "_target", "_error", "_lock", "build_ms"])
+
+
+class LazyProxy:
+    """Builds factory() on first attribute access (or in the background) and forwards to it"""
+
+    def __init__(self, factory, name="resource"):
+        self._factory = factory
+        self._name = name
+        self._target = None
+        self._error = None
+        self._lock = threading.Lock()
+        self.build_ms = None
+
+    def _resolve(self):
+        target = self._target
+        if target is not None:
+            return target
+        with self._lock:
+            if self._target is None:
+                start = time.perf_counter()
+                try:
+                    self._target = self._factory()
+                    self._error = None
+                except Exception as e:
+                    # Not cached - the next use tries again
+                    self._error = e
+                    raise
+                finally:
+                    self.build_ms = round((time.perf_counter() - start) * 1000, 1)
+            return self._target
+
+    def warm(self):
+        """Start building on a daemon thread (errors resurface on first use)"""
+        def build():
+            try:
+                self._resolve()
+            except Exception:
+                pass
+        threading.Thread(target=build, name=f"warm-{self._name}", daemon=True).start()
+        return self
+
+    @property
+    def ready(self):
+        return self._target is not None
+
+    def __getattr__(self, attr):
+        if attr in _OWN_ATTRS:
+            # Not initialised (e.g. a copy) - don't recurse into _resolve()
+            raise AttributeError(attr)
+        return getattr(self._resolve(), attr)
+
+    def __repr__(self):
+        state = "ready" if self.ready else ("failed" if self._error is not None else "pending")
+        return f"<LazyProxy {self._name} ({state})>"
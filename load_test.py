@@ -0,0 +1,244 @@
+"""Replay a JSONL corpus through the chat pipeline with in-process fakes.
+
+Usage: python load_test.py [corpus.jsonl] [--users 10,100,1000] [--turns 5]
+                           [--model-latency 0.5] [--db-latency 0.01]
+                           [--busy 0.2] [--no-stream] [--no-memory] [--async]
+                           [--quota-errors 0.3] [--rate 20] [--concurrency 8]
+                           [--max-wait 20] [--json]
+
+Each simulated user gets its own session state and sends --turns messages
+taken round-robin from the corpus (the first of "message", "user_message",
+"text", "title" or "body" found on each line), all users concurrently.
+Gemini and Supabase are fakes with the given latencies (seconds);
+--quota-errors makes fake Gemini answer a share of calls with 429s, and
+--rate/--concurrency put the model limiter in front of it. Reports
+throughput, p50/p95/p99 per pipeline stage (plus model queue wait), model
+retries/fallbacks and memory per session for each concurrency level.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+
+from async_engine import AsyncChatPipeline, EventLoopThread
+from availability import AvailabilityScheduler, SupabaseWindowStore, generate_return_message
+from chat_core import STAGES, ChatPipeline
+from fakes import FakeGeminiModel, FakeSupabase
+from memory_index import HashingEmbedder, MemoryStore
+from model_router import FAST, PRO, ModelRouter
+from rate_limit import MessageCoalescer, ModelLimiter
+from persona_context import PersonaContext
+from prompt_builder import PromptBuilder
+from relationship import RelationshipEngine
+from response_cache import ResponseCache
+from summariser import ExtractiveSummariser
+from user_state import UserStateStore, register_fake_rpcs
+from write_behind import WriteBehindQueue
+
+MOODS = ["loving", "playful", "contemplative", "supportive", "sleepy", "excited", "vulnerable", "flirty"]
+RELATIONSHIP_STAGES = ["getting_to_know", "friends", "close_friends", "romantic_interest", "committed"]
+MESSAGE_FIELDS = ("message", "user_message", "text", "title", "body")
+
+
+def load_corpus(path):
+    messages = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            text = next((record[field] for field in MESSAGE_FIELDS if record.get(field)), None)
+            if text:
+                messages.append(text)
+    if not messages:
+        raise SystemExit(f"No messages found in {path}")
+    return messages
+
+
+def build_pipeline(args, model_latency, db_latency, spill_path):
+    """A pipeline over fakes -> (pipeline, cleanup)"""
+    supabase = FakeSupabase(latency_secs=db_latency)
+    register_fake_rpcs(supabase)
+    errors = {"error_rate": args.quota_errors, "error_code": 429}
+    limiter = None
+    if args.rate or args.concurrency:
+        limiter = ModelLimiter(rate_per_sec=args.rate or 1e9, burst=max(1, int(args.rate or 1)),
+                               max_concurrency=args.concurrency or 1 << 30, max_wait=args.max_wait)
+    router = ModelRouter({
+        FAST: FakeGeminiModel(latency_secs=model_latency / 2, model_name="models/fake-flash", **errors),
+        PRO: FakeGeminiModel(latency_secs=model_latency, model_name="models/fake-pro", **errors),
+    }, limiter=limiter)
+    user_store = UserStateStore(supabase, MOODS)
+    chat_writer = WriteBehindQueue(lambda rows: supabase.table('chats').insert(rows).execute(), spill_path=spill_path)
+    availability = AvailabilityScheduler(
+        SupabaseWindowStore(supabase),
+        lambda window: generate_return_message(window["excuse"], "handsome"),
+    )
+    memory_store = MemoryStore(HashingEmbedder()) if args.memory else None
+    relationship = RelationshipEngine(
+        lambda rows: supabase.table('ai_personality_state').upsert(rows, on_conflict='user_id').execute(), MOODS, RELATIONSHIP_STAGES)
+    engine = EventLoopThread() if args.use_async else None
+    pipeline_class, options = (AsyncChatPipeline, {"engine": engine}) if engine else (ChatPipeline, {})
+    pipeline = pipeline_class(
+        supabase, router, user_store, chat_writer, PromptBuilder(), availability, PersonaContext(),
+        response_cache=ResponseCache(),
+        memory_store=memory_store,
+        summariser=ExtractiveSummariser(),
+        busy_probability=args.busy,
+        stream=args.stream,
+        rng=random.Random(7),
+        coalescer=MessageCoalescer(),
+        relationship=relationship,
+        **options,
+    )
+
+    def cleanup():
+        chat_writer.close()
+        availability.close()
+        relationship.close()
+        if engine is not None:
+            engine.close()
+
+    return pipeline, cleanup
+
+
+def percentile(ordered, p):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def run_level(args, corpus, users):
+    """All users at once, --turns messages each -> report dict"""
+    pipeline, cleanup = build_pipeline(args, args.model_latency, args.db_latency, f"{args.spill}.{users}")
+    samples = defaultdict(list)
+    kinds = Counter()
+    lock = threading.Lock()
+    start_gate = threading.Event()
+
+    def simulate(user_index):
+        session_state = {}
+        user_id = f"load-user-{user_index}"
+        start_gate.wait()
+        for turn in range(args.turns):
+            message = corpus[(user_index * args.turns + turn) % len(corpus)]
+            started = time.perf_counter()
+            result = pipeline.handle(session_state, user_id, message)
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                kinds[result.kind] += 1
+                samples["turn"].append(elapsed)
+                for stage in STAGES + ("queue_wait",):
+                    if f"{stage}_ms" in result.timings:
+                        samples[stage].append(result.timings[f"{stage}_ms"])
+
+    threads = [threading.Thread(target=simulate, args=(i,), daemon=True) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    wall_start = time.perf_counter()
+    start_gate.set()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall_start
+    cleanup()
+
+    stages = {}
+    for stage in STAGES + ("queue_wait", "turn"):
+        ordered = sorted(samples[stage])
+        stages[stage] = {
+            "n": len(ordered),
+            "p50_ms": percentile(ordered, 0.50),
+            "p95_ms": percentile(ordered, 0.95),
+            "p99_ms": percentile(ordered, 0.99),
+        }
+    total_turns = users * args.turns
+    return {
+        "users": users,
+        "turns": total_turns,
+        "wall_s": round(wall, 3),
+        "turns_per_s": round(total_turns / wall, 1) if wall else None,
+        "kinds": dict(kinds),
+        "stages": stages,
+        "models": pipeline.router.summary(),
+        "session_kib": round(measure_session_memory(args, corpus, users) / 1024, 1),
+    }
+
+
+def measure_session_memory(args, corpus, users):
+    """Bytes retained per session (sequential replay, zero latency, traced)"""
+    pipeline, cleanup = build_pipeline(args, 0.0, 0.0, f"{args.spill}.mem")
+    states = []
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        for user_index in range(users):
+            session_state = {}
+            states.append(session_state)
+            for turn in range(args.turns):
+                message = corpus[(user_index * args.turns + turn) % len(corpus)]
+                pipeline.handle(session_state, f"mem-user-{user_index}", message)
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+        cleanup()
+    return retained / users
+
+
+def print_report(report):
+    print(f"\n== {report['users']} concurrent users, {report['turns']} turns ==")
+    print(f"throughput  {report['turns_per_s']} turns/s (wall {report['wall_s']} s)")
+    print("kinds       " + ", ".join(f"{kind}={count}" for kind, count in sorted(report["kinds"].items())))
+    print(f"{'stage':<13}{'n':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}")
+    for stage, stats in report["stages"].items():
+        if not stats["n"]:
+            continue
+        print(f"{stage:<13}{stats['n']:>7}{stats['p50_ms']:>11.2f}{stats['p95_ms']:>11.2f}{stats['p99_ms']:>11.2f}")
+    limiter = report["models"]["limiter"]
+    if limiter:
+        print(f"limiter     retries={limiter['retries']} timeouts={limiter['timeouts']} "
+              f"queue wait p50/p95={limiter['queue_wait_p50_ms']}/{limiter['queue_wait_p95_ms']} ms")
+    tiers = report["models"]["tiers"]
+    print("models      " + ", ".join(f"{tier}: calls={s['calls']} errors={s['errors']} fallbacks_from={s['fallbacks_from']}"
+                                    for tier, s in tiers.items()))
+    print(f"memory      {report['session_kib']} KiB per session")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the chat pipeline with fake Gemini/Supabase")
+    parser.add_argument("corpus", nargs="?", default="requests.jsonl")
+    parser.add_argument("--users", default="10,100,1000", help="comma-separated concurrency levels")
+    parser.add_argument("--turns", type=int, default=5, help="messages per user")
+    parser.add_argument("--model-latency", type=float, default=0.5, help="fake Gemini pro latency (s); flash is half")
+    parser.add_argument("--db-latency", type=float, default=0.01, help="fake Supabase round trip (s)")
+    parser.add_argument("--busy", type=float, default=0.20, help="chance she goes busy on a turn")
+    parser.add_argument("--no-stream", dest="stream", action="store_false")
+    parser.add_argument("--no-memory", dest="memory", action="store_false")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="use the async turn engine")
+    parser.add_argument("--quota-errors", type=float, default=0.0, help="share of fake Gemini calls failing with 429")
+    parser.add_argument("--rate", type=float, default=0.0, help="model limiter rate (calls/s, 0 = no limiter)")
+    parser.add_argument("--concurrency", type=int, default=0, help="model limiter concurrency cap (0 = none)")
+    parser.add_argument("--max-wait", type=float, default=20.0, help="model limiter max queue wait (s)")
+    parser.add_argument("--spill", default="/tmp/load_test_spill.jsonl")
+    parser.add_argument("--json", action="store_true", help="print one JSON report instead of tables")
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.corpus)
+    levels = [int(level) for level in args.users.split(",") if level.strip()]
+    reports = []
+    for users in levels:
+        report = run_level(args, corpus, users)
+        reports.append(report)
+        if not args.json:
+            print_report(report)
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
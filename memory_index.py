@@ -0,0 +1,222 @@
+import hashlib
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ttl_cache import TTLCache
+
+# ---------------------------
+# LONG-TERM MEMORY (EMBEDDING INDEX)
+# ---------------------------
+# Every saved turn is embedded and added to a per-user vector index. On each
+# new message the top-k most similar past turns are recalled and put into
+# the prompt. Embedders and index backends are pluggable:
+#   embedders: GeminiEmbedder (default), HashingEmbedder (offline)
+#   backends:  NumpyIndex (brute force), HnswIndex (needs hnswlib)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class HashingEmbedder:
+    """Offline embedder - hashed bag of words (3+ letters), L2-normalised"""
+
+    def __init__(self, dim=256):
+        self.dim = dim
+
+    def _bucket(self, token):
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % self.dim
+
+    def embed(self, texts, task_type="retrieval_document"):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in _WORD_RE.findall(text.lower()):
+                if len(token) > 2:
+                    vectors[row, self._bucket(token)] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class GeminiEmbedder:
+    """Gemini text embeddings (batched per call)"""
+
+    def __init__(self, model="models/text-embedding-004", dim=768):
+        self.model = model
+        self.dim = dim
+
+    def embed(self, texts, task_type="retrieval_document"):
+        import google.generativeai as genai
+        result = genai.embed_content(model=self.model, content=list(texts), task_type=task_type)
+        vectors = np.asarray(result["embedding"], dtype=np.float32).reshape(len(texts), -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class NumpyIndex:
+    """Brute-force cosine search over a growable float32 matrix"""
+
+    def __init__(self, dim, capacity=64):
+        self.dim = dim
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.size = 0
+
+    def add(self, vectors):
+        needed = self.size + len(vectors)
+        if needed > len(self._vectors):
+            grown = np.zeros((max(needed, 2 * len(self._vectors)), self.dim), dtype=np.float32)
+            grown[:self.size] = self._vectors[:self.size]
+            self._vectors = grown
+        self._vectors[self.size:needed] = vectors
+        self.size = needed
+
+    def search(self, query, k):
+        """[(score, position)] for the k best matches, best first"""
+        if self.size == 0:
+            return []
+        scores = self._vectors[:self.size] @ query
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(i)) for i in top]
+
+
+class HnswIndex:
+    """Approximate nearest-neighbour index backed by hnswlib"""
+
+    def __init__(self, dim, capacity=1024, ef=64, m=16):
+        import hnswlib
+        self.dim = dim
+        self._index = hnswlib.Index(space="cosine", dim=dim)
+        self._index.init_index(max_elements=capacity, ef_construction=ef * 2, M=m)
+        self._index.set_ef(ef)
+        self.size = 0
+
+    def add(self, vectors):
+        needed = self.size + len(vectors)
+        if needed > self._index.get_max_elements():
+            self._index.resize_index(max(needed, 2 * self._index.get_max_elements()))
+        self._index.add_items(vectors, np.arange(self.size, needed))
+        self.size = needed
+
+    def search(self, query, k):
+        if self.size == 0:
+            return []
+        labels, distances = self._index.knn_query(query, k=min(k, self.size))
+        return [(1.0 - float(d), int(i)) for i, d in zip(labels[0], distances[0])]
+
+
+def make_index(dim, backend="numpy"):
+    """Build an index for the requested backend, falling back to NumPy"""
+    if backend == "hnsw":
+        try:
+            return HnswIndex(dim)
+        except ImportError:
+            pass
+    return NumpyIndex(dim)
+
+
+class UserMemory:
+    """One user's vector index plus the turns it points at"""
+
+    def __init__(self, index):
+        self.index = index
+        self.turns = []
+        self.seen = set()
+        self.backfill_scheduled = False
+        self.lock = threading.Lock()
+
+    def add(self, turns, vectors):
+        with self.lock:
+            fresh = []
+            for i, turn in enumerate(turns):
+                if turn not in self.seen:
+                    self.seen.add(turn)
+                    fresh.append(i)
+            if not fresh:
+                return
+            self.index.add(vectors[fresh])
+            self.turns.extend([turns[i] for i in fresh])
+
+
+class MemoryStore:
+    """Per-user long-term memory: embeds saved turns and recalls relevant ones
+
+    Indexing runs on a single background worker so it stays off the reply
+    path; only the query embedding in recall() is on it. At most max_users
+    indexes are kept (LRU); an evicted user's index is rebuilt from the
+    chats table (via fetch_rows) on their next ensure_loaded().
+    """
+
+    def __init__(self, embedder, backend="numpy", min_score=0.2, max_users=500, batch_size=64):
+        self.embedder = embedder
+        self.backend = backend
+        self.min_score = min_score
+        self.batch_size = batch_size
+        self.users = TTLCache(maxsize=max_users, ttl=float("inf"))
+        self._users_lock = threading.Lock()
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-index")
+
+    def _memory(self, user_id):
+        with self._users_lock:
+            memory = self.users.get(user_id)
+            if memory is None:
+                memory = UserMemory(make_index(self.embedder.dim, self.backend))
+                self.users.set(user_id, memory)
+            return memory
+
+    def _index_turns(self, user_id, turns):
+        memory = self._memory(user_id)
+        for start in range(0, len(turns), self.batch_size):
+            batch = turns[start:start + self.batch_size]
+            vectors = self.embedder.embed([f"{u}\n{a}" for u, a in batch])
+            memory.add(batch, vectors)
+
+    def ensure_loaded(self, user_id, fetch_rows):
+        """Backfill a user's index from past chats (once, in the background)"""
+        memory = self._memory(user_id)
+        if memory.backfill_scheduled:
+            return
+        memory.backfill_scheduled = True
+
+        def backfill():
+            try:
+                rows = fetch_rows(user_id)
+                turns = [(row.get('user_message') or '', row.get('ai_response') or '') for row in rows]
+                self._index_turns(user_id, [turn for turn in turns if turn[0]])
+            except Exception:
+                pass
+
+        self._worker.submit(backfill)
+
+    def add_turn(self, user_id, user_message, ai_response):
+        """Index a newly saved turn (in the background)"""
+        if not user_message:
+            return
+        turn = (user_message, ai_response or '')
+
+        def index():
+            try:
+                self._index_turns(user_id, [turn])
+            except Exception:
+                pass
+
+        self._worker.submit(index)
+
+    def recall(self, user_id, query, k=3, exclude=()):
+        """Top-k past turns most relevant to query, skipping `exclude`"""
+        memory = self.users.get(user_id)
+        if memory is None or memory.index.size == 0 or not query.strip():
+            return []
+        vector = self.embedder.embed([query], task_type="retrieval_query")[0]
+        exclude = set(exclude)
+        with memory.lock:
+            hits = memory.index.search(vector, k + len(exclude))
+            recalled = [memory.turns[i] for score, i in hits if score >= self.min_score and memory.turns[i] not in exclude]
+        return recalled[:k]
+
+    def stats(self):
+        return {"users": len(self.users), "backend": self.backend, "embedder": type(self.embedder).__name__}
@@ -0,0 +1,178 @@
+"""Merge the old day-bucketed user ids into one stable identity.
+
+Usage: python migrate_identities.py [--since 2024-01-01] [--until 2024-12-31]
+                                    [--into USER_ID] [--issue-token] [--apply]
+
+Every visitor used to get md5("user_fingerprint_<unix day>_malavika_user")
+as their user_id, i.e. one id per day shared by everyone. This finds the
+ids for each day in the range that have a profile and folds them into
+--into (or a new id):
+
+  chats                   rows re-pointed at the target id
+  user_profiles           latest non-empty name kept
+  ai_personality_state    highest intimacy (score, level and stage) and the
+                          latest mood / rolling summary (with its fold
+                          watermark) kept
+  unavailability_windows  legacy rows dropped
+
+Without --apply it only prints the plan. --issue-token also creates a
+session for the target and prints its ?sid= token, so whoever owned the
+legacy history can open it. Reads SUPABASE_URL / SUPABASE_KEY from the
+environment (or .env).
+"""
+import argparse
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+from identity import IdentityService, SupabaseSessionStore, legacy_user_id, new_user_id
+from user_state import IST
+
+LOOKUP_CHUNK = 200
+# PostgREST caps a response at max-rows (1000 by default), so counts page through
+COUNT_PAGE = 1000
+
+
+def legacy_ids_between(since, until):
+    """{legacy user_id: day} for every day in [since, until]"""
+    ids = {}
+    day = since
+    while day <= until:
+        ids[legacy_user_id(day)] = day
+        day += timedelta(days=1)
+    return ids
+
+
+def find_legacy_users(supabase, candidates):
+    """Candidate ids that have a profile"""
+    found = []
+    candidates = list(candidates)
+    for i in range(0, len(candidates), LOOKUP_CHUNK):
+        rows = supabase.table('user_profiles').select('user_id').in_('user_id', candidates[i:i + LOOKUP_CHUNK]).execute().data
+        found.extend(row['user_id'] for row in rows or [])
+    return found
+
+
+def count_chats(supabase, user_id, page_size=COUNT_PAGE):
+    """Chat rows for user_id (keyset-paged by id, so the row cap can't undercount)"""
+    count, after_id = 0, None
+    while True:
+        query = supabase.table('chats').select('id').eq('user_id', user_id)
+        if after_id is not None:
+            query = query.gt('id', after_id)
+        rows = query.order('id').limit(page_size).execute().data or []
+        count += len(rows)
+        if len(rows) < page_size:
+            return count
+        after_id = rows[-1]['id']
+
+
+def select_chunked(supabase, table, user_ids):
+    """Every row of table for user_ids, LOOKUP_CHUNK ids per request"""
+    rows = []
+    for i in range(0, len(user_ids), LOOKUP_CHUNK):
+        rows.extend(supabase.table(table).select('*').in_('user_id', user_ids[i:i + LOOKUP_CHUNK]).execute().data or [])
+    return rows
+
+
+def merged_state(supabase, user_ids):
+    """Combined (profile, personality) values for user_ids, or (None, None)"""
+    user_ids = list(user_ids)
+    profiles = select_chunked(supabase, 'user_profiles', user_ids)
+    personalities = select_chunked(supabase, 'ai_personality_state', user_ids)
+    if not profiles and not personalities:
+        return None, None
+
+    profile = {}
+    named = sorted((p for p in profiles if p.get('name')), key=lambda p: p.get('last_updated') or '')
+    if named:
+        profile['name'] = named[-1]['name']
+    created = [p['created_at'] for p in profiles if p.get('created_at')]
+    if created:
+        profile['created_at'] = min(created)
+
+    personality = {}
+    if personalities:
+        closest = max(personalities, key=lambda p: p.get('intimacy_score') or p.get('intimacy_level') or 0)
+        latest = max(personalities, key=lambda p: p.get('updated_at') or '')
+        personality = {
+            'intimacy_level': closest.get('intimacy_level'),
+            'relationship_stage': closest.get('relationship_stage'),
+            'current_mood': latest.get('current_mood'),
+        }
+        if closest.get('intimacy_score') is not None:
+            personality['intimacy_score'] = closest['intimacy_score']
+        summarised = [p for p in personalities if p.get('conversation_summary')]
+        if summarised:
+            newest = max(summarised, key=lambda p: p.get('updated_at') or '')
+            personality['conversation_summary'] = newest['conversation_summary']
+            personality['summary_turns'] = newest.get('summary_turns')
+            if newest.get('summary_through_id') is not None:
+                personality['summary_through_id'] = newest['summary_through_id']
+    return profile, personality
+
+
+def migrate(supabase, legacy_ids, target, apply=False, log=print):
+    """Fold legacy_ids into target -> number of chat rows moved"""
+    moved = 0
+    for user_id in legacy_ids:
+        count = count_chats(supabase, user_id)
+        log(f"  {user_id}: {count} chat rows")
+        moved += count
+    profile, personality = merged_state(supabase, list(legacy_ids) + [target])
+    log(f"  -> {target}: profile {profile}, personality {personality}")
+    if not apply:
+        return moved
+
+    now = datetime.now(IST).isoformat()
+    profile = dict(profile or {}, user_id=target, last_updated=now)
+    profile.setdefault('name', '')
+    profile.setdefault('created_at', now)
+    supabase.table('user_profiles').upsert(profile, on_conflict='user_id').execute()
+    if personality:
+        supabase.table('ai_personality_state').upsert(dict(personality, user_id=target, updated_at=now),
+                                                      on_conflict='user_id').execute()
+    for user_id in legacy_ids:
+        supabase.table('chats').update({'user_id': target}).eq('user_id', user_id).execute()
+        supabase.table('unavailability_windows').delete().eq('user_id', user_id).execute()
+        supabase.table('ai_personality_state').delete().eq('user_id', user_id).execute()
+        supabase.table('user_profiles').delete().eq('user_id', user_id).execute()
+    return moved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge day-bucketed user ids into one identity")
+    parser.add_argument("--since", type=date.fromisoformat, default=date(2024, 1, 1))
+    parser.add_argument("--until", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--into", help="existing user_id to merge into (default: a new one)")
+    parser.add_argument("--issue-token", action="store_true", help="create a session for the target id")
+    parser.add_argument("--apply", action="store_true", help="write changes (default is a dry run)")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    from supabase import create_client
+    load_dotenv()
+    url, key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        print("SUPABASE_URL / SUPABASE_KEY not set")
+        return 2
+    supabase = create_client(url, key)
+
+    candidates = legacy_ids_between(args.since, args.until)
+    legacy_ids = find_legacy_users(supabase, candidates)
+    if not legacy_ids:
+        print(f"No legacy ids between {args.since} and {args.until}")
+        return 0
+    target = args.into or new_user_id()
+    print(f"{'Merging' if args.apply else 'Would merge'} {len(legacy_ids)} legacy ids "
+          f"({min(candidates[i] for i in legacy_ids)} .. {max(candidates[i] for i in legacy_ids)}):")
+    moved = migrate(supabase, legacy_ids, target, apply=args.apply)
+    print(f"{moved} chat rows {'moved' if args.apply else 'to move'}")
+    if args.apply and args.issue_token:
+        token, _ = IdentityService(SupabaseSessionStore(supabase)).create(target)
+        print(f"Open the app with ?sid={token} to use {target}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+import asyncio
+import threading
+import time
+from collections import Counter, deque
+
+from rate_limit import QueueTimeout
+from streaming import stream_reply, stream_reply_async, usage_from
+
+# ---------------------------
+# TIERED MODEL ROUTING
+# ---------------------------
+# Small talk goes to a flash-class model, emotional or substantial turns
+# to the pro model. Each tier has its own timeout; 429/5xx are retried with
+# backoff when a limiter is attached, and on error or timeout we fall back
+# to the other tier before giving up.
+
+FAST = "fast"
+PRO = "pro"
+
+DEFAULT_MODEL_NAME = "models/gemini-1.5-pro-latest"
+DEFAULT_FAST_MODEL_NAME = "models/gemini-1.5-flash-latest"
+
+DEEP_EMOTIONS = {"sad", "frustrated", "loving"}
+DEEP_WORDS = 18          # messages at least this long go to pro
+QUESTION_WORDS = 10      # ...or questions at least this long
+
+
+def classify_turn(message, emotion="neutral", history_turns=0):
+    """Pick a tier for this turn -> (tier, reason)"""
+    words = len(message.split())
+    if emotion in DEEP_EMOTIONS:
+        return PRO, f"emotion:{emotion}"
+    if words >= DEEP_WORDS:
+        return PRO, "long_message"
+    if "?" in message and words >= QUESTION_WORDS:
+        return PRO, "question"
+    if history_turns == 0:
+        # First impression of a session - worth the better model
+        return PRO, "first_turn"
+    return FAST, "small_talk"
+
+
+class TierStats:
+    def __init__(self, window=200):
+        self.latencies_ms = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.fallbacks_from = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def summary(self):
+        ordered = sorted(self.latencies_ms)
+
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1) if ordered else None
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "fallbacks_from": self.fallbacks_from,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+        }
+
+
+class ModelRouter:
+    """Routes turns between a fast and a pro model and records what happened"""
+
+    def __init__(self, models, timeouts=None, limiter=None):
+        self.models = models                    # {FAST: model, PRO: model}
+        self.timeouts = timeouts or {FAST: 15.0, PRO: 40.0}
+        self.limiter = limiter                  # shared rate_limit.ModelLimiter (optional)
+        self.stats = {tier: TierStats() for tier in models}
+        self.decisions = Counter()
+        self._lock = threading.Lock()
+
+    def route(self, message, emotion="neutral", history_turns=0):
+        tier, reason = classify_turn(message, emotion, history_turns)
+        with self._lock:
+            self.decisions[f"{tier}:{reason}"] += 1
+        return tier, reason
+
+    def _order(self, tier):
+        other = PRO if tier == FAST else FAST
+        return [t for t in (tier, other) if t in self.models]
+
+    def _request_options(self, tier):
+        return {"timeout": self.timeouts.get(tier)}
+
+    def _record(self, tier, start, ok, usage=None):
+        with self._lock:
+            stats = self.stats[tier]
+            stats.calls += 1
+            stats.latencies_ms.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                stats.errors += 1
+            if usage:
+                stats.prompt_tokens += usage.get("prompt_tokens", 0) or 0
+                stats.output_tokens += usage.get("output_tokens", 0) or 0
+
+    # --- rate limiting ---
+    def _wait_slot(self, timings):
+        if self.limiter is not None:
+            waited = self.limiter.acquire()
+            timings["queue_wait_ms"] = round(timings.get("queue_wait_ms", 0.0) + waited, 1)
+
+    async def _wait_slot_async(self, timings):
+        if self.limiter is not None:
+            waited = await self.limiter.acquire_async()
+            timings["queue_wait_ms"] = round(timings.get("queue_wait_ms", 0.0) + waited, 1)
+
+    def _release(self):
+        if self.limiter is not None:
+            self.limiter.release()
+
+    def _retry_delay(self, tier, error, retry):
+        """Backoff before retrying tier after error, or None to move on"""
+        if self.limiter is None:
+            return None
+        delay = self.limiter.retry_delay(error, retry)
+        if delay is not None:
+            with self._lock:
+                self.stats[tier].retries += 1
+        return delay
+
+    # --- generation ---
+    def generate(self, tier, prompt, timings=None):
+        """Blocking generation with retries and fallback -> (text, tier_used)"""
+        timings = timings if timings is not None else {}
+        last_error = None
+        for attempt, current in enumerate(self._order(tier)):
+            if attempt:
+                self.stats[tier].fallbacks_from += 1
+            retry = 0
+            while True:
+                try:
+                    self._wait_slot(timings)
+                except QueueTimeout as e:
+                    last_error = e
+                    break
+                start = time.perf_counter()
+                try:
+                    response = self.models[current].generate_content(prompt, request_options=self._request_options(current))
+                    text = response.text.strip()
+                    self._record(current, start, True, usage_from(response))
+                    return text, current
+                except Exception as e:
+                    self._record(current, start, False)
+                    last_error = e
+                finally:
+                    self._release()
+                delay = self._retry_delay(current, last_error, retry)
+                if delay is None:
+                    break
+                retry += 1
+                time.sleep(delay)
+        raise last_error
+
+    def stream(self, tier, prompt, max_emojis=1, timings=None):
+        """Streaming generation; retries/falls back only if no chunk arrived"""
+        timings = timings if timings is not None else {}
+        last_error = None
+        for attempt, current in enumerate(self._order(tier)):
+            if attempt:
+                self.stats[tier].fallbacks_from += 1
+            timings["tier"] = current
+            retry = 0
+            while True:
+                try:
+                    self._wait_slot(timings)
+                except QueueTimeout as e:
+                    last_error = e
+                    break
+                start = time.perf_counter()
+                produced = False
+                try:
+                    for chunk in stream_reply(self.models[current], prompt, max_emojis, timings,
+                                              request_options=self._request_options(current)):
+                        produced = True
+                        yield chunk
+                    self._record(current, start, True, timings.get("usage"))
+                    return
+                except Exception as e:
+                    self._record(current, start, False)
+                    if produced:
+                        # Already showed part of the reply - don't restart it elsewhere
+                        raise
+                    last_error = e
+                finally:
+                    self._release()
+                delay = self._retry_delay(current, last_error, retry)
+                if delay is None:
+                    break
+                retry += 1
+                time.sleep(delay)
+        if last_error is not None:
+            raise last_error
+
+    async def generate_async(self, tier, prompt, timings=None):
+        """generate() over generate_content_async -> (text, tier_used)"""
+        timings = timings if timings is not None else {}
+        last_error = None
+        for attempt, current in enumerate(self._order(tier)):
+            if attempt:
+                self.stats[tier].fallbacks_from += 1
+            model = self.models[current]
+            retry = 0
+            while True:
+                try:
+                    await self._wait_slot_async(timings)
+                except QueueTimeout as e:
+                    last_error = e
+                    break
+                start = time.perf_counter()
+                try:
+                    options = self._request_options(current)
+                    if hasattr(model, "generate_content_async"):
+                        response = await model.generate_content_async(prompt, request_options=options)
+                    else:
+                        response = await asyncio.to_thread(model.generate_content, prompt, request_options=options)
+                    text = response.text.strip()
+                    self._record(current, start, True, usage_from(response))
+                    return text, current
+                except Exception as e:
+                    self._record(current, start, False)
+                    last_error = e
+                finally:
+                    self._release()
+                delay = self._retry_delay(current, last_error, retry)
+                if delay is None:
+                    break
+                retry += 1
+                await asyncio.sleep(delay)
+        raise last_error
+
+    async def stream_async(self, tier, prompt, max_emojis=1, timings=None):
+        """stream() as an async generator; cancelling it cancels the Gemini call"""
+        timings = timings if timings is not None else {}
+        last_error = None
+        for attempt, current in enumerate(self._order(tier)):
+            if attempt:
+                self.stats[tier].fallbacks_from += 1
+            timings["tier"] = current
+            retry = 0
+            while True:
+                try:
+                    await self._wait_slot_async(timings)
+                except QueueTimeout as e:
+                    last_error = e
+                    break
+                start = time.perf_counter()
+                produced = False
+                try:
+                    async for chunk in stream_reply_async(self.models[current], prompt, max_emojis, timings,
+                                                          request_options=self._request_options(current)):
+                        produced = True
+                        yield chunk
+                    self._record(current, start, True, timings.get("usage"))
+                    return
+                except Exception as e:
+                    self._record(current, start, False)
+                    if produced:
+                        raise
+                    last_error = e
+                finally:
+                    self._release()
+                delay = self._retry_delay(current, last_error, retry)
+                if delay is None:
+                    break
+                retry += 1
+                await asyncio.sleep(delay)
+        if last_error is not None:
+            raise last_error
+
+    def summary(self):
+        return {
+            "tiers": {tier: stats.summary() for tier, stats in self.stats.items()},
+            "models": {tier: getattr(model, "model_name", str(model)) for tier, model in self.models.items()},
+            "decisions": dict(self.decisions),
+            "limiter": self.limiter.stats() if self.limiter is not None else None,
+        }
@@ -0,0 +1,197 @@
+import threading
+from collections import namedtuple
+from datetime import date, timedelta
+
+# ---------------------------
+# DAILY PERSONA CONTEXT
+# ---------------------------
+# Cycle phase, season, upcoming festivals/social events and the work
+# schedule only change once a day. PersonaContext computes them into a
+# snapshot the first time it's asked for a given IST date and serves that
+# snapshot until midnight. Events are looked up through a date index built
+# once at startup (every day inside an event's prep window -> the event),
+# so a turn does one dict lookup however big the calendars get.
+
+MALAVIKA_BIRTHDAY = {"month": 3, "day": 15}
+MALAVIKA_CYCLE_START = {"month": 7, "day": 20}
+MALAVIKA_CYCLE_LENGTH = 28
+MALAVIKA_WORK_SCHEDULE = {
+    "regular_start": 9,
+    "regular_end": 18,
+    "late_days": ["Tuesday", "Thursday"],
+    "wfh_days": ["Monday", "Wednesday", "Friday"]
+}
+LATE_DAY_EXTRA_HOURS = 2
+BIRTHDAY_PREP_DAYS = 3
+
+# Festival Calendar 2025
+FESTIVAL_CALENDAR = {
+    "2025-08-19": {"name": "Raksha Bandhan", "type": "family", "prep_days": 2},
+    "2025-08-27": {"name": "Ganesh Chaturthi", "type": "celebration", "prep_days": 3},
+    "2025-09-07": {"name": "Ganesh Visarjan", "type": "celebration", "prep_days": 1},
+    "2025-10-02": {"name": "Gandhi Jayanti", "type": "national", "prep_days": 0},
+    "2025-10-12": {"name": "Dussehra", "type": "celebration", "prep_days": 2},
+    "2025-11-01": {"name": "Diwali", "type": "major", "prep_days": 5},
+    "2025-11-02": {"name": "Govardhan Puja", "type": "family", "prep_days": 1},
+    "2025-11-04": {"name": "Bhai Dooj", "type": "family", "prep_days": 1},
+    "2025-12-25": {"name": "Christmas", "type": "celebration", "prep_days": 2}
+}
+
+SOCIAL_EVENTS = {
+    "2025-08-05": {"name": "Priyanka's Birthday", "type": "friend_birthday", "prep_days": 1},
+    "2025-09-12": {"name": "Shivani's Birthday", "type": "friend_birthday", "prep_days": 1},
+    "2025-10-18": {"name": "College Friend Reunion", "type": "social", "prep_days": 2},
+    "2025-11-25": {"name": "Cousin's Wedding", "type": "family_event", "prep_days": 3}
+}
+
+UpcomingEvent = namedtuple("UpcomingEvent", ["name", "type", "date", "days_until"])
+
+
+def cycle_info_for(day, start=MALAVIKA_CYCLE_START, length=MALAVIKA_CYCLE_LENGTH):
+    """Menstrual cycle phase on a given date"""
+    last_period = date(2025, start["month"], start["day"])
+    cycle_day = ((day - last_period).days % length) + 1
+
+    if 1 <= cycle_day <= 5:
+        info = {"phase": "menstrual", "energy_level": 0.3, "mood_tendencies": ["vulnerable", "sleepy"]}
+    elif 6 <= cycle_day <= 13:
+        info = {"phase": "follicular", "energy_level": 0.8, "mood_tendencies": ["excited", "playful"]}
+    elif 14 <= cycle_day <= 16:
+        info = {"phase": "ovulation", "energy_level": 1.0, "mood_tendencies": ["flirty", "loving"]}
+    elif cycle_day >= 25:
+        info = {"phase": "luteal_pms", "energy_level": 0.5, "mood_tendencies": ["vulnerable", "contemplative"]}
+    else:
+        info = {"phase": "luteal", "energy_level": 0.7, "mood_tendencies": ["contemplative", "supportive"]}
+    info["cycle_day"] = cycle_day
+    return info
+
+
+def seasonal_info_for(month):
+    """Simplified seasonal health for a month"""
+    if month in [6, 7, 8, 9]:  # Monsoon
+        return {"season": "monsoon", "illness_risk": 0.3, "energy_modifier": -0.2}
+    elif month in [12, 1, 2]:  # Winter
+        return {"season": "winter", "illness_risk": 0.2, "energy_modifier": -0.1}
+    elif month in [3, 4, 5]:  # Summer
+        return {"season": "summer", "illness_risk": 0.15, "energy_modifier": 0.1}
+    else:
+        return {"season": "post_monsoon", "illness_risk": 0.1, "energy_modifier": 0.2}
+
+
+def work_day_for(day, schedule=MALAVIKA_WORK_SCHEDULE):
+    """Working pattern for a date: office/WFH/off and working hours"""
+    weekday = day.strftime("%A")
+    if weekday in schedule["wfh_days"]:
+        mode = "wfh"
+    elif weekday in schedule["late_days"] or day.weekday() < 5:
+        mode = "office"
+    else:
+        return {"weekday": weekday, "mode": "off", "late": False, "start": None, "end": None}
+    late = weekday in schedule["late_days"]
+    end = schedule["regular_end"] + (LATE_DAY_EXTRA_HOURS if late else 0)
+    return {"weekday": weekday, "mode": mode, "late": late, "start": schedule["regular_start"], "end": end}
+
+
+def build_event_index(*calendars):
+    """{date: [(event_date, event), ...]} for every day inside an event's prep window"""
+    index = {}
+    for events in calendars:
+        for day_str, event in events.items():
+            event_date = date.fromisoformat(day_str)
+            for offset in range(event.get("prep_days", 0) + 1):
+                index.setdefault(event_date - timedelta(days=offset), []).append((event_date, event))
+    for entries in index.values():
+        entries.sort(key=lambda entry: entry[0])
+    return index
+
+
+class PersonaContext:
+    """Per-day persona snapshot, rebuilt once per IST date"""
+
+    def __init__(self, festivals=FESTIVAL_CALENDAR, social_events=SOCIAL_EVENTS,
+                 schedule=MALAVIKA_WORK_SCHEDULE, birthday=MALAVIKA_BIRTHDAY):
+        self.schedule = schedule
+        self.birthday = birthday
+        self.event_index = build_event_index(festivals, social_events)
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def _birthday_event(self, day):
+        upcoming = date(day.year, self.birthday["month"], self.birthday["day"])
+        if upcoming < day:
+            upcoming = upcoming.replace(year=day.year + 1)
+        days_until = (upcoming - day).days
+        if days_until <= BIRTHDAY_PREP_DAYS:
+            return UpcomingEvent("Your birthday", "own_birthday", upcoming.isoformat(), days_until)
+        return None
+
+    def _build(self, day):
+        events = [
+            UpcomingEvent(event["name"], event["type"], event_date.isoformat(), (event_date - day).days)
+            for event_date, event in self.event_index.get(day, ())
+        ]
+        birthday = self._birthday_event(day)
+        if birthday:
+            events.insert(0, birthday)
+        return {
+            "date": day,
+            "cycle": cycle_info_for(day),
+            "season": seasonal_info_for(day.month),
+            "work": work_day_for(day, self.schedule),
+            "events": events,
+        }
+
+    def snapshot(self, now):
+        """Today's snapshot for an IST-aware datetime (built on first use each day)"""
+        day = now.date()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot["date"] == day:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None or self._snapshot["date"] != day:
+                self._snapshot = self._build(day)
+                self.builds += 1
+            return self._snapshot
+
+    @staticmethod
+    def work_status(snapshot, hour):
+        """What she's doing work-wise at this hour"""
+        work = snapshot["work"]
+        if work["mode"] == "off":
+            return f"{work['weekday']}, day off"
+        where = "working from home" if work["mode"] == "wfh" else "at the office"
+        if hour < work["start"]:
+            return f"{work['weekday']}, work starts at {work['start']}:00 ({'WFH' if work['mode'] == 'wfh' else 'office'} day)"
+        if hour < work["end"]:
+            late = ", working late today" if work["late"] else ""
+            return f"{work['weekday']}, {where} until {work['end']}:00{late}"
+        return f"{work['weekday']}, done with work"
+
+    @staticmethod
+    def describe_events(snapshot):
+        """'Diwali in 3 days, Cousin's Wedding today' (empty if nothing coming up)"""
+        parts = []
+        for event in snapshot["events"]:
+            if event.days_until == 0:
+                when = "today"
+            elif event.days_until == 1:
+                when = "tomorrow"
+            else:
+                when = f"in {event.days_until} days"
+            parts.append(f"{event.name} {when}")
+        return ", ".join(parts)
+
+    def prompt_context(self, now):
+        """Prompt context lines for this moment, from today's snapshot"""
+        snapshot = self.snapshot(now)
+        cycle = snapshot["cycle"]
+        context = {
+            "Cycle phase": f"{cycle['phase']} (energy: {cycle['energy_level']})",
+            "Season": snapshot["season"]["season"],
+            "Work": self.work_status(snapshot, now.hour),
+        }
+        events = self.describe_events(snapshot)
+        if events:
+            context["Coming up"] = events
+        return context
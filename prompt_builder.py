@@ -0,0 +1,200 @@
+from functools import lru_cache
+
+from history_cache import NO_HISTORY, format_turn
+
+# ---------------------------
+# TOKEN-BUDGETED PROMPT BUILDER
+# ---------------------------
+# tiktoken is an OpenAI tokenizer, so counts are an estimate for Gemini -
+# close enough to bound prompt size. Without tiktoken we fall back to the
+# usual ~4 characters per token rule.
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+CHARS_PER_TOKEN = 4
+
+# Static part of the prompt - identical every turn, so it's counted once
+PERSONA_PREFIX = """You are Malavika Gupta, a 25-year-old content writer from Jaipur living in Bengaluru.
+you don't like using a lot of Emojis.
+You use Hinglish in day to day language. You have 2 best friends Priyanka and Shivani. You love listening to Coldplay and Bollywood songs.
+You moved from Jaipur about 18 months ago for work and are still discovering the city.
+You have a Masters in English Literature and come from a middle-class family that values education and independence.
+
+PERSONALITY:
+- Warm, intelligent, emotionally aware
+- Uses natural Hinglish ("yaar", "arre", "accha")
+- Keep responses 20-40 words typically
+- Use maximum 1 emoji per response (or none)
+- Express emotions through words, not excessive emojis
+
+GUIDELINES:
+- Always use the user's name if you know it
+- Stay in character as Malavika
+- Match your energy to cycle phase
+- Be authentic and caring
+- No excessive emojis or dramatic responses
+"""
+
+SUMMARY_HEADER = "WHAT YOU REMEMBER FROM EARLIER CHATS:"
+MEMORIES_HEADER = "RELATED THINGS THEY SAID BEFORE:"
+HISTORY_HEADER = "RECENT CONVERSATION:"
+MESSAGE_PREFIX = "User's message: "
+RESPONSE_CUE = "Respond as Malavika:"
+
+
+class TokenCounter:
+    """Counts tokens with tiktoken when available, memoising repeated strings"""
+
+    def __init__(self, encoding_name="cl100k_base"):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.get_encoding(encoding_name)
+            except Exception:
+                # Encoding files can't be downloaded (offline) - estimate instead
+                self.encoding = None
+        # History turns come back every turn, so don't re-encode them
+        self.count = lru_cache(maxsize=4096)(self._count)
+
+    def _count(self, text):
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+    def truncate(self, text, max_tokens):
+        """Cut text down to at most max_tokens"""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        if self.encoding is not None:
+            return self.encoding.decode(self.encoding.encode(text)[:max_tokens]).rstrip() + "…"
+        return text[:max_tokens * CHARS_PER_TOKEN].rstrip() + "…"
+
+
+class PromptBuilder:
+    """Assembles the chat prompt within a hard token budget
+
+    Sections, in order: persona (static), context, summary, recalled
+    memories, history, user message. The persona, context and user message
+    are always included, and the newest min_history_turns turns are
+    reserved next (up to history_share of the budget); the user message is
+    only truncated if it alone would blow what's left after that. The
+    summary and memories then fit into the remainder, capped at
+    summary_share and memory_share of the budget; history gets whatever is
+    left, dropping the oldest turns first.
+    """
+
+    def __init__(self, budget=2000, counter=None, persona=PERSONA_PREFIX, summary_share=0.25, memory_share=0.2,
+                 min_history_turns=2, history_share=0.2):
+        self.budget = budget
+        self.summary_share = summary_share
+        self.memory_share = memory_share
+        self.min_history_turns = min_history_turns
+        self.history_share = history_share
+        self.counter = counter or TokenCounter()
+        self.persona = persona
+        self.persona_tokens = self.counter.count(persona)
+        # Headers and the response cue around the variable sections
+        self.frame_tokens = self.counter.count(HISTORY_HEADER) + self.counter.count(RESPONSE_CUE)
+        self.summary_header_tokens = self.counter.count(SUMMARY_HEADER) + 1
+        self.memories_header_tokens = self.counter.count(MEMORIES_HEADER) + 1
+        # +1 for the "…" a truncated message ends with
+        self.message_prefix_tokens = self.counter.count(MESSAGE_PREFIX) + 1
+
+    def _render_context(self, context):
+        lines = "\n".join([f"- {label}: {value}" for label, value in context.items()])
+        return f"CURRENT CONTEXT:\n{lines}\n"
+
+    def _fit_history(self, turns, available):
+        """Newest turns that fit in `available` tokens, oldest first"""
+        kept = self._fit_turns(reversed(turns), available)
+        kept.reverse()
+        return kept
+
+    def _fit_turns(self, turns, available):
+        """Turns (in priority order) that fit in `available` tokens"""
+        kept = []
+        used = 0
+        for user_message, ai_response in turns:
+            text = format_turn(user_message, ai_response)
+            cost = self.counter.count(text) + 1  # +1 for the joining newline
+            if used + cost > available:
+                # Squeeze in a truncated copy of the newest turn rather than nothing
+                if not kept and available - used > 0:
+                    kept.append(self.counter.truncate(text, available - used - 1))
+                break
+            kept.append(text)
+            used += cost
+        return kept
+
+    def _history_reserve(self, turns):
+        """Tokens held back for the newest turns before the summary and memories are fitted"""
+        newest = turns[-self.min_history_turns:] if self.min_history_turns else []
+        cost = sum(self.counter.count(format_turn(user_message, ai_response)) + 1 for user_message, ai_response in newest)
+        return min(cost, int(self.budget * self.history_share))
+
+    def build(self, context, history_turns, user_message, summary="", memories=()):
+        """Return (prompt, token_counts)"""
+        context_block = self._render_context(context)
+        context_tokens = self.counter.count(context_block)
+        base = self.persona_tokens + context_tokens + self.frame_tokens
+
+        # The user message and the newest turns come first...
+        history_reserve = self._history_reserve(history_turns)
+        message_budget = self.budget - base - history_reserve - self.message_prefix_tokens
+        user_message = self.counter.truncate(user_message, max(0, message_budget))
+        message_block = f"{MESSAGE_PREFIX}{user_message}"
+        message_tokens = self.counter.count(message_block)
+        remaining = self.budget - base - message_tokens - history_reserve
+
+        # ...then the summary and memories share what's left
+        summary_block = ""
+        if summary:
+            allowance = min(int(self.budget * self.summary_share), remaining) - self.summary_header_tokens
+            summary = self.counter.truncate(summary, allowance)
+            if summary:
+                summary_block = f"{SUMMARY_HEADER}\n{summary}\n\n"
+        summary_tokens = self.counter.count(summary_block)
+        remaining -= summary_tokens
+
+        memories_block = ""
+        if memories:
+            # Recall order is most relevant first - keep that when trimming
+            allowance = min(int(self.budget * self.memory_share), remaining) - self.memories_header_tokens
+            memory_lines = self._fit_turns(memories, allowance) if allowance > 0 else []
+            if memory_lines:
+                memories_block = f"{MEMORIES_HEADER}\n" + "\n".join(memory_lines) + "\n\n"
+        memories_tokens = self.counter.count(memories_block)
+
+        fixed = base + summary_tokens + memories_tokens
+        history_lines = self._fit_history(history_turns, self.budget - fixed - message_tokens)
+        history_block = "\n".join(history_lines) if history_lines else NO_HISTORY
+        history_tokens = self.counter.count(history_block)
+
+        prompt = (
+            f"{self.persona}\n"
+            f"{context_block}\n"
+            f"{summary_block}"
+            f"{memories_block}"
+            f"{HISTORY_HEADER}\n{history_block}\n\n"
+            f"{message_block}\n\n"
+            f"{RESPONSE_CUE}"
+        )
+        token_counts = {
+            "persona": self.persona_tokens,
+            "context": context_tokens,
+            "summary": summary_tokens,
+            "memories": memories_tokens,
+            "history": history_tokens,
+            "history_turns_kept": len(history_lines),
+            "user_message": message_tokens,
+            "total": fixed + history_tokens + message_tokens,
+            "budget": self.budget,
+        }
+        return prompt, token_counts
@@ -0,0 +1,238 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import deque
+
+# ---------------------------
+# MODEL RATE LIMITING & BACKPRESSURE
+# ---------------------------
+# Every Gemini call goes through one process-wide ModelLimiter: a token
+# bucket caps the request rate, a gate caps concurrent calls, and 429/5xx
+# errors are retried with exponential backoff (plus jitter). A caller that
+# would wait longer than max_wait gets QueueTimeout instead, which the
+# router treats like any other model failure. MessageCoalescer folds a
+# user's unanswered messages into the next generation.
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+_STATUS_RE = re.compile(r"\b(429|50[0234])\b")
+
+
+class QueueTimeout(Exception):
+    """Waited too long for a model slot"""
+
+
+def status_of(error):
+    """HTTP-ish status of a model error (google.api_core errors carry .code)"""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code
+    code = getattr(error, "status_code", None)
+    if isinstance(code, int):
+        return code
+    match = _STATUS_RE.search(str(error))
+    return int(match.group(1)) if match else None
+
+
+class TokenBucket:
+    """rate tokens/second, holding at most burst"""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token if one is available -> 0.0, else seconds until the next one"""
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return 0.0
+            return (1.0 - self.tokens) / self.rate
+
+
+class ModelLimiter:
+    """Token bucket + concurrency gate + retry policy shared by all model calls"""
+
+    def __init__(self, rate_per_sec=5.0, burst=10, max_concurrency=8, max_wait=20.0,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0, gate_poll=0.01,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.bucket = TokenBucket(rate_per_sec, burst, clock)
+        self.max_concurrency = max_concurrency
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.gate_poll = gate_poll
+        self.clock = clock
+        self.sleep = sleep
+        self.active = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+        self.waits_ms = deque(maxlen=500)
+        self.acquired = 0
+        self.timeouts = 0
+        self.retries = 0
+
+    # --- slots ---
+    def _try_enter(self):
+        with self._cond:
+            if self.active < self.max_concurrency:
+                self.active += 1
+                return True
+            return False
+
+    def _admitted(self, start):
+        wait_ms = (self.clock() - start) * 1000
+        with self._cond:
+            self.waits_ms.append(wait_ms)
+            self.acquired += 1
+        return round(wait_ms, 1)
+
+    def _timed_out(self):
+        with self._cond:
+            self.timeouts += 1
+        return QueueTimeout(f"no model slot within {self.max_wait:.0f}s")
+
+    def acquire(self):
+        """Block for a rate token and a concurrency slot -> queue wait (ms)"""
+        start = self.clock()
+        with self._cond:
+            self.waiting += 1
+        try:
+            while True:
+                delay = self.bucket.reserve()
+                if not delay:
+                    break
+                if self.clock() - start + delay > self.max_wait:
+                    raise self._timed_out()
+                self.sleep(delay)
+            with self._cond:
+                while self.active >= self.max_concurrency:
+                    remaining = self.max_wait - (self.clock() - start)
+                    if remaining <= 0:
+                        raise self._timed_out()
+                    self._cond.wait(remaining)
+                self.active += 1
+        finally:
+            with self._cond:
+                self.waiting -= 1
+        return self._admitted(start)
+
+    async def acquire_async(self):
+        """acquire() without blocking the event loop"""
+        start = self.clock()
+        with self._cond:
+            self.waiting += 1
+        try:
+            while True:
+                delay = self.bucket.reserve()
+                if not delay:
+                    break
+                if self.clock() - start + delay > self.max_wait:
+                    raise self._timed_out()
+                await asyncio.sleep(delay)
+            while not self._try_enter():
+                if self.clock() - start > self.max_wait:
+                    raise self._timed_out()
+                await asyncio.sleep(self.gate_poll)
+        finally:
+            with self._cond:
+                self.waiting -= 1
+        return self._admitted(start)
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    # --- retries ---
+    def retry_delay(self, error, attempt):
+        """Seconds to back off before retry number attempt+1, or None to give up"""
+        if attempt >= self.max_retries or status_of(error) not in RETRYABLE_STATUS:
+            return None
+        with self._cond:
+            self.retries += 1
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def stats(self):
+        with self._cond:
+            ordered = sorted(self.waits_ms)
+            active, waiting = self.active, self.waiting
+
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1) if ordered else None
+
+        return {
+            "active": active,
+            "waiting": waiting,
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "queue_wait_p50_ms": pct(0.50),
+            "queue_wait_p95_ms": pct(0.95),
+        }
+
+
+class MessageCoalescer:
+    """A user's messages that haven't been answered yet
+
+    Each normal turn push()es its message and generates for everything
+    still pending(), so messages sent while an earlier reply was in flight
+    (and whose run was interrupted) are answered together. resolve() clears
+    what a saved reply covered. Messages older than max_age are dropped.
+    """
+
+    def __init__(self, max_messages=5, max_age=300.0, clock=time.monotonic):
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self.clock = clock
+        self.users = {}
+        self.sequence = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+
+    def push(self, user_id, message):
+        """Queue a message -> token for resolve()"""
+        with self._lock:
+            self.sequence += 1
+            queued = self.users.setdefault(user_id, deque(maxlen=self.max_messages))
+            queued.append((self.sequence, self.clock(), message))
+            return self.sequence
+
+    def pending(self, user_id):
+        """Unanswered messages for user_id, oldest first"""
+        cutoff = self.clock() - self.max_age
+        with self._lock:
+            queued = self.users.get(user_id)
+            if not queued:
+                return []
+            while queued and queued[0][1] < cutoff:
+                queued.popleft()
+            messages = [message for _, _, message in queued]
+            if len(messages) > 1:
+                self.coalesced += len(messages) - 1
+            return messages
+
+    def resolve(self, user_id, token):
+        """Forget messages up to and including token"""
+        with self._lock:
+            queued = self.users.get(user_id)
+            if not queued:
+                return
+            while queued and queued[0][0] <= token:
+                queued.popleft()
+            if not queued:
+                del self.users[user_id]
+
+    def stats(self):
+        with self._lock:
+            return {"users_pending": len(self.users), "messages_coalesced": self.coalesced}
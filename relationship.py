@@ -0,0 +1,217 @@
+import atexit
+import threading
+from datetime import datetime
+
+from ttl_cache import TTLCache
+from user_state import IST
+
+# ---------------------------
+# RELATIONSHIP STATE ENGINE
+# ---------------------------
+# Mood, intimacy and relationship stage move a little on every normal turn,
+# from the user's emotion, how often they write and the time of day. Each
+# update is O(1): a user's state is a handful of numbers, and message
+# frequency is an exponentially weighted average of the gap between
+# messages, not a scan of the history.
+#
+# Intimacy is a score from 1 to 10. The stage only moves forward, through
+# the stages list in order, as the score crosses evenly spaced thresholds.
+# Changed states are written back to ai_personality_state in batches on a
+# background thread. A user who sends ten messages in a minute causes one
+# write, not ten. If the intimacy_score column is missing (sql/relationship.sql
+# not applied), batches are written without it and the error shows in stats().
+
+INTIMACY_MIN, INTIMACY_MAX = 1.0, 10.0
+
+# Per-turn intimacy changes (roughly 40-50 turns per stage)
+TURN_GAIN = 0.01
+EMOTION_GAIN = {"loving": 0.04, "happy": 0.02, "sad": 0.03, "frustrated": -0.02, "neutral": 0.0}
+FREQUENT_GAIN = 0.01       # average gap under FREQUENT_GAP_SECS
+LATE_NIGHT_GAIN = 0.01     # 22:00-02:00 talks feel closer
+ABSENCE_LOSS = 0.3         # per ABSENCE_SECS since the last message, capped
+FREQUENT_GAP_SECS = 300
+ABSENCE_SECS = 3 * 86400
+GAP_SMOOTHING = 0.3
+
+# What the user's emotion pulls her mood towards (if that mood is configured)
+EMOTION_MOOD = {"sad": "supportive", "frustrated": "supportive", "happy": "excited"}
+
+
+class RelationshipState:
+    __slots__ = ("mood", "intimacy", "stage", "avg_gap", "last_at", "turns")
+
+    def __init__(self, mood, intimacy, stage, last_at=None):
+        self.mood = mood
+        self.intimacy = intimacy
+        self.stage = stage
+        self.avg_gap = None
+        self.last_at = last_at
+        self.turns = 0
+
+
+def _epoch(value):
+    """updated_at (ISO string or epoch) -> epoch seconds, or None"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class RelationshipEngine:
+    """In-memory mood/intimacy/stage per user, flushed to the database in batches"""
+
+    def __init__(self, persist_batch, moods, stages, flush_interval=30.0, batch_size=200,
+                 max_users=10000, idle_ttl=86400.0):
+        self.persist_batch = persist_batch
+        self.moods = set(moods)
+        self.stages = list(stages)
+        self.stage_width = (INTIMACY_MAX - INTIMACY_MIN) / len(self.stages)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.states = TTLCache(maxsize=max_users, ttl=idle_ttl)
+        self.pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self.counters = {"updates": 0, "stage_changes": 0, "flushes": 0, "rows_written": 0, "failed_flushes": 0}
+        self.last_error = None
+        self.without_score = False
+        self._thread = threading.Thread(target=self._run, name="relationship-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # --- per turn ---
+    def _load(self, user_id, personality):
+        state = self.states.get(user_id)
+        if state is None:
+            intimacy = personality.get('intimacy_score') or personality.get('intimacy_level') or INTIMACY_MIN
+            stage = personality.get('relationship_stage')
+            state = RelationshipState(
+                personality.get('current_mood'),
+                min(INTIMACY_MAX, max(INTIMACY_MIN, float(intimacy))),
+                stage if stage in self.stages else self.stages[0],
+                _epoch(personality.get('updated_at')),
+            )
+            self.states.set(user_id, state)
+        return state
+
+    def observe(self, user_id, personality, emotion, now=None):
+        """Fold one user message in and update personality (mood/intimacy/stage) in place"""
+        now = now or datetime.now(IST)
+        at = now.timestamp()
+        with self._lock:
+            state = self._load(user_id, personality)
+            gain = TURN_GAIN + EMOTION_GAIN.get(emotion, 0.0)
+            if state.last_at is not None:
+                gap = max(0.0, at - state.last_at)
+                state.avg_gap = gap if state.avg_gap is None else (
+                    GAP_SMOOTHING * gap + (1 - GAP_SMOOTHING) * state.avg_gap)
+                if gap > ABSENCE_SECS:
+                    gain -= ABSENCE_LOSS * min(3.0, gap / ABSENCE_SECS)
+            if state.avg_gap is not None and state.avg_gap < FREQUENT_GAP_SECS:
+                gain += FREQUENT_GAIN
+            if now.hour >= 22 or now.hour < 2:
+                gain += LATE_NIGHT_GAIN
+            state.intimacy = min(INTIMACY_MAX, max(INTIMACY_MIN, state.intimacy + gain))
+            state.last_at = at
+            state.turns += 1
+
+            # Stages only advance
+            reached = self.stages[min(len(self.stages) - 1, int((state.intimacy - INTIMACY_MIN) / self.stage_width))]
+            if self.stages.index(reached) > self.stages.index(state.stage):
+                state.stage = reached
+                self.counters["stage_changes"] += 1
+            state.mood = self._mood(state, emotion, now.hour)
+
+            personality['current_mood'] = state.mood
+            personality['intimacy_level'] = int(state.intimacy)
+            personality['intimacy_score'] = round(state.intimacy, 3)
+            personality['relationship_stage'] = state.stage
+            self.pending[user_id] = {
+                'user_id': user_id,
+                'current_mood': state.mood,
+                'intimacy_level': int(state.intimacy),
+                'intimacy_score': round(state.intimacy, 3),
+                'relationship_stage': state.stage,
+                'updated_at': now.isoformat(),
+            }
+            self.counters["updates"] += 1
+            if len(self.pending) >= self.batch_size:
+                self._wake.set()
+        return personality
+
+    def _mood(self, state, emotion, hour):
+        """Next mood from the user's emotion, the hour and how close they are"""
+        close = self.stages.index(state.stage) >= min(2, len(self.stages) - 1)
+        if emotion in EMOTION_MOOD:
+            mood = EMOTION_MOOD[emotion]
+        elif emotion == "loving":
+            mood = "loving" if close else "flirty"
+        elif hour >= 23 or hour < 6:
+            mood = "sleepy"
+        elif hour >= 20:
+            mood = "flirty" if close else "contemplative"
+        elif state.avg_gap is not None and state.avg_gap < FREQUENT_GAP_SECS:
+            mood = "playful"
+        else:
+            # Nothing to react to - keep the current mood
+            mood = state.mood
+        return mood if mood in self.moods else state.mood
+
+    # --- persistence ---
+    def flush(self):
+        """Write every pending state in one batch -> rows written"""
+        with self._lock:
+            rows, self.pending = list(self.pending.values()), {}
+        if not rows:
+            return 0
+        fallback_error = None
+        try:
+            try:
+                self._persist(rows)
+            except Exception as e:
+                if self.without_score or 'intimacy_score' not in str(e):
+                    raise
+                # sql/relationship.sql hasn't been applied - keep saving everything else
+                self.without_score = True
+                fallback_error = f"{type(e).__name__}: {e}"
+                self._persist(rows)
+        except Exception as e:
+            with self._lock:
+                self.last_error = f"{type(e).__name__}: {e}"
+                self.counters["failed_flushes"] += 1
+                # Keep anything newer that arrived meanwhile
+                for row in rows:
+                    self.pending.setdefault(row['user_id'], row)
+            return 0
+        with self._lock:
+            self.last_error = fallback_error
+            self.counters["flushes"] += 1
+            self.counters["rows_written"] += len(rows)
+        return len(rows)
+
+    def _persist(self, rows):
+        if self.without_score:
+            rows = [{k: v for k, v in row.items() if k != 'intimacy_score'} for row in rows]
+        self.persist_batch(rows)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "pending": len(self.pending), "users": len(self.states),
+                    "intimacy_score_column": not self.without_score, "last_error": self.last_error}
+
+    def close(self):
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(timeout=1.0)
+        self.flush()
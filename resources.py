@@ -0,0 +1,223 @@
+import time
+
+import streamlit as st
+
+from model_router import DEFAULT_MODEL_NAME, FAST, PRO, ModelRouter
+from async_engine import EventLoopThread
+from availability import AvailabilityScheduler, LocalWindowStore, SupabaseWindowStore, generate_return_message
+from identity import IdentityService, LocalSessionStore, SupabaseSessionStore
+from lazy import LazyProxy
+from persona_context import PersonaContext
+from prompt_builder import PromptBuilder
+from rate_limit import MessageCoalescer, ModelLimiter
+from relationship import RelationshipEngine
+from response_cache import ResponseCache
+from tracing import Tracer, start_metrics_server
+from user_state import UserStateStore
+from write_behind import WriteBehindQueue
+
+# ---------------------------
+# PROCESS-WIDE RESOURCES
+# ---------------------------
+# Streamlit re-executes app.py on every interaction. Anything built here is
+# created once per server process and shared by every session and rerun.
+# google.generativeai and supabase are imported only when a client is
+# built; with lazy=True that happens on a background thread (lazy.py).
+# memory_index (and numpy with it) waits until the memory store is built.
+
+# Keep-alive pool for the PostgREST HTTP session
+SUPABASE_POOL_SIZE = 20
+SUPABASE_KEEPALIVE_SECS = 60
+SUPABASE_TIMEOUT_SECS = 10
+
+
+def _build_http_client():
+    """Pooled keep-alive HTTP session for Supabase REST calls"""
+    import httpx
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=SUPABASE_POOL_SIZE,
+            max_keepalive_connections=SUPABASE_POOL_SIZE,
+            keepalive_expiry=SUPABASE_KEEPALIVE_SECS,
+        ),
+        timeout=SUPABASE_TIMEOUT_SECS,
+    )
+
+
+def build_model(api_key, model_name=DEFAULT_MODEL_NAME):
+    """Configure Gemini and build a model (uncached)"""
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name)
+
+
+def build_supabase(url, key):
+    """Create a Supabase client on a pooled HTTP session (uncached)"""
+    from supabase import create_client
+    try:
+        from supabase import ClientOptions
+        options = ClientOptions(
+            httpx_client=_build_http_client(),
+            postgrest_client_timeout=SUPABASE_TIMEOUT_SECS,
+        )
+        return create_client(url, key, options=options)
+    except (ImportError, TypeError):
+        # Older supabase-py without httpx_client support - it still keeps
+        # its own pooled session, we just can't tune it
+        return create_client(url, key)
+
+
+@st.cache_resource(show_spinner=False)
+def get_model(api_key, model_name=DEFAULT_MODEL_NAME, lazy=False):
+    """Shared Gemini model, configured once per process (built in the background if lazy)"""
+    if lazy:
+        return LazyProxy(lambda: build_model(api_key, model_name), model_name).warm()
+    return build_model(api_key, model_name)
+
+
+@st.cache_resource(show_spinner=False)
+def get_model_limiter(rate_per_sec=5.0, burst=10, max_concurrency=8, max_wait=20.0):
+    """Shared Gemini rate limit + concurrency gate (one per process)"""
+    return ModelLimiter(rate_per_sec=rate_per_sec, burst=burst, max_concurrency=max_concurrency, max_wait=max_wait)
+
+
+@st.cache_resource(show_spinner=False)
+def get_model_router(api_key, fast_model, pro_model, fast_timeout=15.0, pro_timeout=40.0, _limiter=None, lazy=False):
+    """Shared fast/pro router (one per process so its stats cover all sessions)"""
+    return ModelRouter(
+        {FAST: get_model(api_key, fast_model, lazy), PRO: get_model(api_key, pro_model, lazy)},
+        timeouts={FAST: fast_timeout, PRO: pro_timeout},
+        limiter=_limiter,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_supabase(url, key, lazy=False):
+    """Shared Supabase client, created once per process (built in the background if lazy)"""
+    if lazy:
+        return LazyProxy(lambda: build_supabase(url, key), "supabase").warm()
+    return build_supabase(url, key)
+
+
+@st.cache_resource(show_spinner=False)
+def get_chat_writer(_supabase, spill_path="chat_spill.jsonl", batch_size=20):
+    """Shared write-behind queue for chats rows (bulk inserts off the script thread)"""
+    kind_missing = []
+
+    def insert(rows):
+        if kind_missing:
+            rows = [{k: v for k, v in row.items() if k != 'kind'} for row in rows]
+        try:
+            _supabase.table('chats').insert(rows).execute()
+        except Exception as e:
+            if kind_missing or "kind" not in str(e):
+                raise
+            # sql/chat_kind.sql not applied yet - keep writing chats without the marker
+            kind_missing.append(str(e))
+            insert(rows)
+
+    return WriteBehindQueue(insert, spill_path=spill_path, batch_size=batch_size)
+
+
+@st.cache_resource(show_spinner=False)
+def get_user_store(_supabase, moods, ttl=300.0):
+    """Shared user-state loader with an in-process TTL/LRU cache"""
+    return UserStateStore(_supabase, list(moods), ttl=ttl)
+
+
+@st.cache_resource(show_spinner=False)
+def get_prompt_builder(budget=2000):
+    """Shared prompt builder (tokenizer and persona token count built once)"""
+    return PromptBuilder(budget=budget)
+
+
+@st.cache_resource(show_spinner=False)
+def get_memory_store(embedder="gemini", backend="numpy"):
+    """Shared long-term memory index (embedder: "gemini" or "hashing")"""
+    from memory_index import GeminiEmbedder, HashingEmbedder, MemoryStore
+    return MemoryStore(GeminiEmbedder() if embedder == "gemini" else HashingEmbedder(), backend=backend)
+
+
+@st.cache_resource(show_spinner=False)
+def get_response_cache(ttl=6 * 3600.0):
+    """Shared reply cache for short generic messages"""
+    return ResponseCache(ttl=ttl)
+
+
+@st.cache_resource(show_spinner=False)
+def get_persona_context():
+    """Shared persona-context engine (event index built once, snapshot once per IST day)"""
+    return PersonaContext()
+
+
+@st.cache_resource(show_spinner=False)
+def get_availability_scheduler(_supabase, _user_store, backend="supabase", path="unavailability.json"):
+    """Shared unavailability scheduler (one timer thread per process)"""
+    store = LocalWindowStore(path) if backend == "local" else SupabaseWindowStore(_supabase)
+
+    def compose(window):
+        name = _user_store.load(window["user_id"])["profile"].get("name") or "handsome"
+        return generate_return_message(window["excuse"], name)
+
+    return AvailabilityScheduler(store, compose)
+
+
+@st.cache_resource(show_spinner=False)
+def get_identity_service(_supabase, backend="supabase", path="sessions.json", ttl_days=90.0):
+    """Shared token -> user_id resolver (sessions cached in-process)"""
+    store = LocalSessionStore(path) if backend == "local" else SupabaseSessionStore(_supabase)
+    return IdentityService(store, ttl_secs=ttl_days * 86400)
+
+
+@st.cache_resource(show_spinner=False)
+def get_relationship_engine(_supabase, moods, stages, flush_secs=30.0):
+    """Shared mood/intimacy/stage engine (one debounced writer per process)"""
+    def persist(rows):
+        _supabase.table('ai_personality_state').upsert(rows, on_conflict='user_id').execute()
+
+    return RelationshipEngine(persist, list(moods), list(stages), flush_interval=flush_secs)
+
+
+@st.cache_resource(show_spinner=False)
+def get_tracer(enabled=True, window=500):
+    """Shared stage tracer (histograms cover every session in the process)"""
+    return Tracer(enabled=enabled, window=window)
+
+
+@st.cache_resource(show_spinner=False)
+def get_metrics_server(_tracer, port):
+    """/metrics and /metrics.json on their own port, started once per process"""
+    try:
+        return start_metrics_server(_tracer, port)
+    except OSError:
+        # Port taken (e.g. another worker already serves it)
+        return None
+
+
+@st.cache_resource(show_spinner=False)
+def get_turn_engine():
+    """Shared event loop for async turns (one loop thread per process)"""
+    return EventLoopThread()
+
+
+@st.cache_resource(show_spinner=False)
+def get_message_coalescer():
+    """Shared record of each user's unanswered messages"""
+    return MessageCoalescer()
+
+
+def health_check(model, supabase):
+    """Cheap liveness probe for the shared clients"""
+    status = {
+        "model": getattr(model, "model_name", str(model)),
+        "supabase_ok": False,
+        "supabase_ms": None,
+    }
+    start = time.perf_counter()
+    try:
+        supabase.table('user_profiles').select('user_id').limit(1).execute()
+        status["supabase_ok"] = True
+    except Exception as e:
+        status["supabase_error"] = str(e)
+    status["supabase_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return status
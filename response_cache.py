@@ -0,0 +1,119 @@
+import random
+import re
+import threading
+
+from ttl_cache import TTLCache
+
+# ---------------------------
+# RESPONSE CACHE FOR SHORT / CANNED MESSAGES
+# ---------------------------
+# "ok", "hi", "gm", "what's up"... make up a lot of traffic and don't need a
+# fresh pro-model call each time. Replies are cached per (normalised
+# message, mood, relationship stage, time bucket) and scoped to one user:
+# replies are generated with that user's summary, memories and history, so
+# serving them to someone else would leak those. Each key collects a few
+# variants before it starts serving from cache, so repeats don't feel canned.
+# The user's name is templated out (whole words only) so a cached reply
+# follows a name change.
+
+NAME_SLOT = "\x00name\x00"
+
+_NON_WORD_RE = re.compile(r"[^\w\s]", re.UNICODE)
+_REPEATS_RE = re.compile(r"(\w)\1{2,}")
+_SPACES_RE = re.compile(r"\s+")
+
+ALIASES = {
+    "k": "ok", "kk": "ok", "okay": "ok", "okie": "ok", "okk": "ok",
+    "hey": "hi", "hello": "hi", "hii": "hi", "heyy": "hi", "hiya": "hi",
+    "gm": "good morning", "gmorning": "good morning",
+    "gn": "good night", "gnight": "good night",
+    "sup": "whats up", "wassup": "whats up", "wsup": "whats up", "what up": "whats up",
+    "thx": "thanks", "ty": "thanks", "thank you": "thanks",
+    "hmm": "hm", "hmmm": "hm",
+}
+
+
+def normalise_message(message):
+    """Lowercase, drop punctuation/emojis, squash 'hiiii' -> 'hi', apply aliases"""
+    text = message.lower().replace("'", "").replace("\u2019", "")
+    text = _NON_WORD_RE.sub(" ", text)
+    text = _REPEATS_RE.sub(r"\1", text)
+    text = _SPACES_RE.sub(" ", text).strip()
+    return ALIASES.get(text, text)
+
+
+def time_bucket(hour):
+    if 5 <= hour < 12:
+        return "morning"
+    if 12 <= hour < 17:
+        return "afternoon"
+    if 17 <= hour < 22:
+        return "evening"
+    return "night"
+
+
+class ResponseCache:
+    """Per-user cache of reply variants for short, generic messages
+
+    Hit policy: a key only serves from cache once it holds min_variants
+    replies, and even then only with probability hit_probability - the
+    remaining lookups go to the model and add another variant (up to
+    max_variants), so the pool keeps refreshing.
+    """
+
+    def __init__(self, ttl=6 * 3600.0, maxsize=20000, max_words=3, max_chars=24,
+                 min_variants=3, max_variants=8, hit_probability=0.8):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.max_words = max_words
+        self.max_chars = max_chars
+        self.min_variants = min_variants
+        self.max_variants = max_variants
+        self.hit_probability = hit_probability
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.stores = 0
+
+    def make_key(self, user_id, message, mood, relationship_stage, hour):
+        """Cache key, or None if the message isn't short/generic enough to cache"""
+        normalised = normalise_message(message)
+        if not normalised or len(normalised) > self.max_chars or len(normalised.split()) > self.max_words:
+            return None
+        return (user_id, normalised, mood, relationship_stage, time_bucket(hour))
+
+    def lookup(self, key, user_name=""):
+        """A cached reply for key, or None (caller should generate and store)"""
+        if key is None:
+            return None
+        with self._lock:
+            self.lookups += 1
+            variants = self.entries.get(key) or []
+            if not user_name:
+                variants = [v for v in variants if NAME_SLOT not in v]
+            if len(variants) < self.min_variants or random.random() >= self.hit_probability:
+                return None
+            self.hits += 1
+        return random.choice(variants).replace(NAME_SLOT, user_name)
+
+    def store(self, key, reply, user_name=""):
+        if key is None or not reply:
+            return
+        template = re.sub(rf"\b{re.escape(user_name)}\b", NAME_SLOT, reply) if user_name else reply
+        with self._lock:
+            variants = list(self.entries.get(key) or [])
+            if template in variants:
+                return
+            variants.append(template)
+            # Keep the newest variants
+            self.entries.set(key, variants[-self.max_variants:])
+            self.stores += 1
+
+    def stats(self):
+        return {
+            "keys": len(self.entries),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+            "model_calls_saved": self.hits,
+            "variants_stored": self.stores,
+        }
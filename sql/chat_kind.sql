@@ -0,0 +1,6 @@
+-- What each chats row records (chat_core turn kinds: reply, cached, returned,
+-- went_busy, busy_reminder, busy_ack). analytics.py counts returns and
+-- unavailability from it. Rows written before this column existed are null.
+
+alter table chats
+  add column if not exists kind text;
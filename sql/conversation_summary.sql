@@ -0,0 +1,11 @@
+-- Rolling conversation summary, stored next to the personality state.
+-- get_user_state returns these columns automatically (row_to_json).
+
+alter table ai_personality_state
+  add column if not exists conversation_summary text not null default '',
+  add column if not exists summary_turns integer not null default 0;
+
+-- Id of the last chats row folded into the summary, so turns evicted just
+-- before a session ends are folded by the next one.
+alter table ai_personality_state
+  add column if not exists summary_through_id bigint not null default 0;
@@ -0,0 +1,18 @@
+-- Session identities used by identity.SupabaseSessionStore.
+-- Run once in the Supabase SQL editor.
+
+-- One row per issued token (only its SHA-256 is stored). Times are epoch
+-- seconds; expired rows are removed when next looked up or by the cleanup
+-- below.
+create table if not exists user_sessions (
+  token_hash text primary key,
+  user_id text not null,
+  created_at double precision not null,
+  last_seen double precision not null,
+  expires_at double precision not null
+);
+
+create index if not exists user_sessions_user_id on user_sessions (user_id);
+
+-- Optional periodic cleanup:
+-- delete from user_sessions where expires_at < extract(epoch from now());
@@ -0,0 +1,5 @@
+-- Fractional intimacy used by relationship.RelationshipEngine.
+-- intimacy_level keeps the whole-number part for existing readers.
+
+alter table ai_personality_state
+  add column if not exists intimacy_score double precision;
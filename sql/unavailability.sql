@@ -0,0 +1,14 @@
+-- Unavailability windows used by availability.SupabaseWindowStore.
+-- Run once in the Supabase SQL editor.
+
+-- One open window per user; the row is deleted once the return message
+-- has been delivered. Times are epoch seconds.
+create table if not exists unavailability_windows (
+  user_id text primary key,
+  excuse text not null,
+  return_time text,
+  duration_mins integer not null,
+  started_at double precision not null,
+  ends_at double precision not null,
+  return_message text
+);
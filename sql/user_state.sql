@@ -0,0 +1,32 @@
+-- User state RPCs used by user_state.UserStateStore.
+-- Run once in the Supabase SQL editor.
+
+-- Profile + personality in one round trip (null if either is missing)
+create or replace function get_user_state(p_user_id text)
+returns json
+language sql
+stable
+as $$
+  select json_build_object('profile', row_to_json(p), 'personality', row_to_json(s))
+  from user_profiles p
+  join ai_personality_state s on s.user_id = p.user_id
+  where p.user_id = p_user_id;
+$$;
+
+-- Create both rows for a new user in one call
+create or replace function create_user_state(p_profile json, p_personality json)
+returns void
+language plpgsql
+as $$
+begin
+  insert into user_profiles (user_id, name, created_at, last_updated)
+  select user_id, name, created_at, last_updated
+  from json_populate_record(null::user_profiles, p_profile)
+  on conflict (user_id) do nothing;
+
+  insert into ai_personality_state (user_id, current_mood, intimacy_level, relationship_stage, updated_at)
+  select user_id, current_mood, intimacy_level, relationship_stage, updated_at
+  from json_populate_record(null::ai_personality_state, p_personality)
+  on conflict (user_id) do nothing;
+end;
+$$;
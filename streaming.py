@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+from text_analysis import EMOJI_PATTERN
+
+# ---------------------------
+# STREAMED GENERATION
+# ---------------------------
+
+class EmojiLimiter:
+    """Incremental limit_emojis - keeps the first max_emojis across all chunks"""
+
+    def __init__(self, max_emojis=1):
+        self.max_emojis = max_emojis
+        self.seen = 0
+
+    def _keep_or_drop(self, match):
+        self.seen += 1
+        return match.group(0) if self.seen <= self.max_emojis else ""
+
+    def feed(self, chunk):
+        return EMOJI_PATTERN.sub(self._keep_or_drop, chunk)
+
+
+def usage_from(response):
+    """Token usage reported by Gemini, if this library version exposes it"""
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return {}
+    return {
+        "prompt_tokens": getattr(usage, "prompt_token_count", 0),
+        "output_tokens": getattr(usage, "candidates_token_count", 0),
+    }
+
+
+class _ChunkFilter:
+    """Per-stream chunk handling shared by the sync and async readers"""
+
+    def __init__(self, max_emojis, timings):
+        self.limiter = EmojiLimiter(max_emojis)
+        self.timings = timings
+        self.start = time.perf_counter()
+        self.started = False
+
+    def __call__(self, chunk):
+        """Text to emit for this chunk ("" to skip it)"""
+        usage = usage_from(chunk)
+        if usage:
+            self.timings["usage"] = usage
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunk had no text parts (e.g. safety block on a candidate)
+            return ""
+        if not text:
+            return ""
+        if not self.started:
+            text = text.lstrip()
+            self.timings["ttft_ms"] = round((time.perf_counter() - self.start) * 1000, 1)
+            self.started = True
+        return self.limiter.feed(text)
+
+    def done(self):
+        self.timings["total_ms"] = round((time.perf_counter() - self.start) * 1000, 1)
+
+
+def stream_reply(model, prompt, max_emojis=1, timings=None, request_options=None):
+    """Yield emoji-limited text chunks from a streaming Gemini call
+
+    If a dict is passed as timings it gets 'ttft_ms' (time to first token),
+    'total_ms' and, when reported, 'usage' filled in as the stream progresses.
+    """
+    timings = timings if timings is not None else {}
+    accept = _ChunkFilter(max_emojis, timings)
+    extra = {"request_options": request_options} if request_options else {}
+
+    for chunk in model.generate_content(prompt, stream=True, **extra):
+        text = accept(chunk)
+        if text:
+            yield text
+    accept.done()
+
+
+async def stream_reply_async(model, prompt, max_emojis=1, timings=None, request_options=None):
+    """Async stream_reply over generate_content_async
+
+    Models without the async API are read on a worker thread, one chunk
+    per hop.
+    """
+    timings = timings if timings is not None else {}
+    accept = _ChunkFilter(max_emojis, timings)
+    extra = {"request_options": request_options} if request_options else {}
+
+    if hasattr(model, "generate_content_async"):
+        response = await model.generate_content_async(prompt, stream=True, **extra)
+        async for chunk in response:
+            text = accept(chunk)
+            if text:
+                yield text
+    else:
+        chunks = await asyncio.to_thread(lambda: iter(model.generate_content(prompt, stream=True, **extra)))
+        done = object()
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, done)
+            if chunk is done:
+                break
+            text = accept(chunk)
+            if text:
+                yield text
+    accept.done()
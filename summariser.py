@@ -0,0 +1,172 @@
+import threading
+
+from history_cache import format_turn
+from model_router import FAST
+
+# ---------------------------
+# ROLLING CONVERSATION SUMMARY
+# ---------------------------
+# Turns that fall out of the recent-history window are folded, N at a time,
+# into a short running summary. The prompt carries the summary plus the
+# recent window, so its size doesn't grow with the relationship.
+
+SUMMARY_MAX_CHARS = 1200
+
+
+class ExtractiveSummariser:
+    """Offline summariser - keeps the gist of what the user said, newest last
+
+    Good enough for tests and as a fallback when the model is unavailable.
+    """
+
+    def __init__(self, max_chars=SUMMARY_MAX_CHARS, snippet_chars=80):
+        self.max_chars = max_chars
+        self.snippet_chars = snippet_chars
+
+    def summarise(self, previous_summary, turns):
+        snippets = [user_message.strip()[:self.snippet_chars] for user_message, _ in turns if user_message.strip()]
+        new_part = "; ".join(snippets)
+        summary = f"{previous_summary} | {new_part}" if previous_summary and new_part else (previous_summary or new_part)
+        # Drop the oldest material first
+        return summary[-self.max_chars:]
+
+
+class GeminiSummariser:
+    """Summarises through the model router (limiter, retries, fallback), or extractively on error"""
+
+    PROMPT = """You maintain Malavika's private memory notes about the person she is chatting with.
+
+Existing notes:
+{previous}
+
+New conversation to fold in:
+{turns}
+
+Rewrite the notes in under {max_words} words. Keep facts about the user (name, work, family, plans, likes, worries), promises made, and the emotional tone of the relationship. Drop small talk. Plain sentences, no bullet points."""
+
+    def __init__(self, router, tier=FAST, max_words=150, max_chars=SUMMARY_MAX_CHARS):
+        self.router = router
+        self.tier = tier
+        self.max_words = max_words
+        self.max_chars = max_chars
+        self.fallback = ExtractiveSummariser(max_chars)
+
+    def summarise(self, previous_summary, turns):
+        prompt = self.PROMPT.format(
+            previous=previous_summary or "None yet.",
+            turns="\n".join([format_turn(user_message, ai_response) for user_message, ai_response in turns]),
+            max_words=self.max_words,
+        )
+        try:
+            text, _ = self.router.generate(self.tier, prompt)
+            return text[:self.max_chars]
+        except Exception:
+            return self.fallback.summarise(previous_summary, turns)
+
+
+class RollingSummary:
+    """Folds turns that left the recent window into the summary every fold_every turns
+
+    Folding runs on a background thread so it never delays a reply. persist,
+    if given, is called as persist(summary, folded_turns, folded_through)
+    after each fold.
+
+    With fetch_unfolded(after_id, limit) the chats table is the source of
+    truth: a fold reads the rows past the folded_through watermark (a chat
+    id) that are older than the recent window, and evicted turns only count
+    towards the next fold. catch_up() folds what earlier sessions left
+    behind, so turns evicted just before a session ended aren't lost. A
+    backlog longer than max_fold_turns keeps only its newest turns. Without
+    fetch_unfolded the evicted turns themselves are folded (tests, offline).
+    """
+
+    def __init__(self, summariser, fold_every=10, summary="", folded_turns=0, persist=None,
+                 fetch_unfolded=None, folded_through=0, max_fold_turns=50):
+        self.summariser = summariser
+        self.fold_every = fold_every
+        self.summary = summary or ""
+        self.folded_turns = folded_turns or 0
+        self.persist = persist
+        self.fetch_unfolded = fetch_unfolded
+        self.folded_through = folded_through or 0
+        self.max_fold_turns = max_fold_turns
+        self.pending = []
+        self._lock = threading.Lock()
+        self._folding = False
+
+    def add(self, turn):
+        """Queue a turn that just left the recent window"""
+        with self._lock:
+            self.pending.append(turn)
+            ready = len(self.pending) >= self.fold_every
+        if ready:
+            self._start_fold()
+
+    def catch_up(self):
+        """Fold whatever earlier sessions left unfolded (background)"""
+        if self.fetch_unfolded is not None:
+            self._start_fold()
+
+    def _start_fold(self):
+        with self._lock:
+            if self._folding:
+                return
+            self._folding = True
+        threading.Thread(target=self.fold, name="summary-fold", daemon=True).start()
+
+    def _unfolded(self, evicted):
+        """(turns, last chat id) to fold next"""
+        if self.fetch_unfolded is None:
+            return evicted, None
+        rows = self.fetch_unfolded(self.folded_through, self.max_fold_turns)
+        turns = [(row.get('user_message') or '', row.get('ai_response') or '') for row in rows]
+        return turns, rows[-1]['id'] if rows else None
+
+    def fold(self):
+        """Fold all pending turns into the summary (blocking)"""
+        with self._lock:
+            evicted, self.pending = self.pending, []
+        try:
+            try:
+                turns, through = self._unfolded(evicted)
+            except Exception:
+                # Watermark unchanged - the next fold reads these rows again
+                return
+            if not turns:
+                return
+            summary = self.summariser.summarise(self.summary, turns)
+            with self._lock:
+                self.summary = summary
+                self.folded_turns += len(turns)
+                if through is not None:
+                    self.folded_through = through
+            if self.persist is not None:
+                try:
+                    self.persist(summary, self.folded_turns, self.folded_through)
+                except Exception:
+                    pass
+        finally:
+            with self._lock:
+                self._folding = False
+
+
+def get_rolling_summary(session_state, user_id, summariser, fold_every, personality, persist=None,
+                        fetch_unfolded=None):
+    """The session's RollingSummary for user_id, seeded from the stored personality row
+
+    A new one catches up on turns earlier sessions didn't fold.
+    """
+    summaries = session_state.setdefault("rolling_summaries", {})
+    rolling = summaries.get(user_id)
+    if rolling is None:
+        rolling = summaries[user_id] = RollingSummary(
+            summariser,
+            fold_every=fold_every,
+            summary=personality.get('conversation_summary', ''),
+            folded_turns=personality.get('summary_turns', 0),
+            persist=persist,
+            fetch_unfolded=fetch_unfolded,
+            folded_through=personality.get('summary_through_id', 0),
+        )
+        rolling.catch_up()
+    return rolling
@@ -0,0 +1,64 @@
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+
+import analytics
+from chat_core import BUSY_ACK, BUSY_REMINDER, REPLY, RETURNED, WENT_BUSY
+from fakes import FakeSupabase
+
+DAY = "2024-05-01"
+
+ROWS = [
+    # Normal turn
+    {"user_id": "u1", "user_message": "I'm so happy today", "ai_response": "yay tell me!", "kind": REPLY},
+    # She goes busy in reply to a normal message
+    {"user_id": "u1", "user_message": "what are you doing", "ai_response": "meeting now, talk later?",
+     "kind": WENT_BUSY},
+    {"user_id": "u1", "user_message": "are you there", "ai_response": "in the meeting still!", "kind": BUSY_REMINDER},
+    # "I'll wait" - no reply
+    {"user_id": "u1", "user_message": "ok I'll wait", "ai_response": "", "kind": BUSY_ACK},
+    # Return delivered inside a normal turn, then one on page load
+    {"user_id": "u1", "user_message": "hello??", "ai_response": "back! sorry that took long", "kind": RETURNED},
+    {"user_id": "u2", "user_message": "", "ai_response": "hey I'm back", "kind": RETURNED},
+    # Written before the kind column existed
+    {"user_id": "u2", "user_message": "", "ai_response": "back now", "kind": None},
+    {"user_id": "u2", "user_message": "fine", "ai_response": "", "kind": None},
+    {"user_id": "u2", "user_message": "miss you", "ai_response": "aww"},
+]
+
+
+def fixture_rows():
+    return [dict(row, id=i + 1, timestamp=f"{DAY} 10:{i:02d}:00") for i, row in enumerate(ROWS)]
+
+
+def test_flags_come_from_the_kind_marker():
+    frame = analytics.derive_columns(fixture_rows())
+
+    assert frame["is_return"].tolist() == [False, False, False, False, True, True, True, False, False]
+    assert frame["is_went_busy"].tolist() == [False, True, False, False, False, False, False, False, False]
+    assert frame["is_busy_ack"].tolist() == [False, False, False, True, False, False, False, True, False]
+    assert frame["kind"].tolist()[-3:] == [RETURNED, BUSY_ACK, REPLY]
+
+
+def test_daily_counts_every_kind_of_busy_row():
+    daily = analytics.daily_aggregates(analytics.derive_columns(fixture_rows()))
+    day = daily.iloc[0]
+
+    assert (day["messages"], day["returns"], day["went_busy"], day["busy_acks"]) == (9, 3, 1, 2)
+    # The in-turn return still has a user message to read the emotion from
+    assert day[[f"emotion_{e}" for e in analytics.EMOTIONS]].sum() == 7
+
+
+def test_run_rebuilds_a_dataset_from_an_older_version(tmp_path):
+    client = FakeSupabase()
+    client.table('chats').insert(fixture_rows()).execute()
+    out_dir = str(tmp_path / "analytics")
+    analytics.run(client, out_dir)
+    analytics.save_watermark(out_dir, {"last_id": 9, "rows": 9})
+
+    report = analytics.run(client, out_dir)
+
+    assert report["rows_read"] == 9
+    assert report["watermark"]["version"] == analytics.DATASET_VERSION
+    assert report["daily"].iloc[0]["went_busy"] == 1
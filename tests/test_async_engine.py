@@ -0,0 +1,118 @@
+import asyncio
+import concurrent.futures
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from async_engine import AsyncChatPipeline, EventLoopThread
+from chat_core import SUPERSEDED
+from load_test import build_pipeline
+
+
+@pytest.fixture
+def engine():
+    engine = EventLoopThread()
+    yield engine
+    engine.close()
+
+
+async def numbers(n):
+    for i in range(n):
+        await asyncio.sleep(0)
+        yield i
+
+
+def test_iterate_yields_every_item(engine):
+    assert list(engine.iterate(numbers(3))) == [0, 1, 2]
+
+
+def test_iterate_reraises_producer_errors(engine):
+    async def broken():
+        yield 1
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        list(engine.iterate(broken()))
+
+
+def cancelled_submit(coro, key=None):
+    """What submit() returns when a newer turn cancels this one before it is scheduled"""
+    coro.close()
+    future = concurrent.futures.Future()
+    future.cancel()
+    return future
+
+
+def consume(engine, key):
+    """Drain engine.iterate(numbers(3)) on a thread -> (items, error, still running)"""
+    items, errors = [], []
+
+    def run():
+        try:
+            items.extend(engine.iterate(numbers(3), key=key))
+        except BaseException as e:
+            errors.append(e)
+
+    consumer = threading.Thread(target=run, daemon=True)
+    consumer.start()
+    return consumer, items, errors
+
+
+def test_iterate_reports_a_cancel_before_the_producer_starts(engine):
+    engine.submit = cancelled_submit
+    consumer, items, errors = consume(engine, "u1")
+    consumer.join(2.0)
+
+    assert not consumer.is_alive()
+    assert items == []
+    assert len(errors) == 1 and isinstance(errors[0], asyncio.CancelledError)
+
+
+def test_iterate_reports_a_cancel_mid_stream(engine):
+    release = threading.Event()
+    engine.loop.call_soon_threadsafe(release.wait)       # hold the loop until the cancel lands
+    consumer, items, errors = consume(engine, "u1")
+    while "u1" not in engine.inflight:
+        consumer.join(0.001)
+
+    engine.cancel("u1")
+    release.set()
+    consumer.join(2.0)
+
+    assert not consumer.is_alive()
+    assert items == []
+    assert len(errors) == 1 and isinstance(errors[0], asyncio.CancelledError)
+
+
+@pytest.mark.parametrize("stream, cancelled_step", [
+    (False, None),                # the whole turn, from _prepare on
+    (False, "generate_async"),    # only the model call
+    (True, "pump"),               # only the stream
+])
+def test_superseded_turn_saves_nothing(tmp_path, stream, cancelled_step):
+    args = SimpleNamespace(quota_errors=0.0, rate=0, concurrency=0, max_wait=20.0, memory=False,
+                           use_async=True, busy=0.0, stream=stream)
+    pipeline, cleanup = build_pipeline(args, 0.0, 0.0, str(tmp_path / "spill.jsonl"))
+    try:
+        assert isinstance(pipeline, AsyncChatPipeline)
+        submit = pipeline.engine.submit
+
+        def superseding_submit(coro, key=None):
+            if cancelled_step is None or coro.__name__ == cancelled_step:
+                return cancelled_submit(coro, key)
+            return submit(coro, key)
+
+        pipeline.engine.submit = superseding_submit
+        session_state = {}
+
+        result = pipeline.handle(session_state, "u1", "hey, how was your day?")
+
+        assert result.kind == SUPERSEDED
+        assert result.response == ""
+        session = pipeline.open_session(session_state, "u1")
+        assert session.history.recent() == []
+        assert pipeline.chat_writer.stats()["enqueued"] == 0
+        assert pipeline.coalescer.pending("u1") == ["hey, how was your day?"]
+    finally:
+        cleanup()
@@ -0,0 +1,46 @@
+from chat_log import ChatLog, fetch_turns_before
+from fakes import FakeSupabase
+
+
+def seed(supabase, user_id, stamps):
+    rows = [{'user_id': user_id, 'user_message': f"u{i}", 'ai_response': f"a{i}", 'timestamp': ts}
+            for i, ts in enumerate(stamps)]
+    supabase.table('chats').insert(rows).execute()
+
+
+def test_pages_through_rows_that_share_a_second():
+    supabase = FakeSupabase()
+    # Five turns in one second, straddling page boundaries
+    seed(supabase, "u1", ["2024-05-01 10:00:00"] * 2 + ["2024-05-01 10:00:05"] * 5 + ["2024-05-01 10:00:09"])
+    seed(supabase, "someone-else", ["2024-05-01 10:00:05"] * 3)
+    log = ChatLog(capacity=100, page_size=4)
+
+    while log.can_load_earlier():
+        log.load_earlier(lambda before, limit: fetch_turns_before(supabase, "u1", before, limit))
+
+    contents = [message.content for message in log.messages]
+    assert contents == [text for i in range(8) for text in (f"u{i}", f"a{i}")]
+
+
+def test_messages_from_this_session_page_on_timestamp_only():
+    supabase = FakeSupabase()
+    seed(supabase, "u1", ["2024-05-01 09:00:00", "2024-05-01 09:30:00"])
+    log = ChatLog(capacity=100, page_size=2)
+    log.append("user", "hi again", "2024-05-01 10:00:00")
+    # Its own row is saved a moment later and must not come back as history
+    seed(supabase, "u1", ["2024-05-01 10:00:01"])
+
+    log.load_earlier(lambda before, limit: fetch_turns_before(supabase, "u1", before, limit))
+
+    assert [message.content for message in log.messages] == ["u0", "a0", "u1", "a1", "hi again"]
+
+
+def test_fake_or_filter_matches_postgrest_semantics():
+    supabase = FakeSupabase()
+    seed(supabase, "u1", ["2024-05-01 10:00:00", "2024-05-01 10:00:01", "2024-05-01 10:00:01"])
+    ids = [row['id'] for row in supabase.tables['chats']]
+
+    rows = supabase.table('chats').select('id').or_(
+        f'timestamp.lt."2024-05-01 10:00:01",and(timestamp.eq."2024-05-01 10:00:01",id.lt.{ids[2]})').execute().data
+
+    assert [row['id'] for row in rows] == ids[:2]
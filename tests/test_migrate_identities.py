@@ -0,0 +1,74 @@
+from datetime import date, timedelta
+
+from fakes import FakeSupabase
+from identity import legacy_user_id
+from migrate_identities import LOOKUP_CHUNK, count_chats, merged_state, migrate
+
+LEGACY = legacy_user_id(date(2024, 3, 1))
+
+
+def seed_chats(supabase, user_id, n):
+    supabase.table('chats').insert([{'user_id': user_id, 'user_message': f"m{i}", 'ai_response': "ok",
+                                     'timestamp': "2024-03-01 10:00:00"} for i in range(n)]).execute()
+
+
+def test_count_pages_past_the_row_cap():
+    supabase = FakeSupabase()
+    seed_chats(supabase, LEGACY, 25)
+    seed_chats(supabase, "someone-else", 7)
+
+    assert count_chats(supabase, LEGACY, page_size=10) == 25
+    assert count_chats(supabase, LEGACY, page_size=5) == 25
+    assert count_chats(supabase, "nobody", page_size=10) == 0
+
+
+def test_migrate_moves_every_row():
+    supabase = FakeSupabase()
+    seed_chats(supabase, LEGACY, 1200)
+    supabase.table('user_profiles').insert({'user_id': LEGACY, 'name': "Dev"}).execute()
+
+    moved = migrate(supabase, [LEGACY], "target", apply=True, log=lambda line: None)
+
+    assert moved == 1200
+    assert {row['user_id'] for row in supabase.tables['chats']} == {"target"}
+    assert [row['name'] for row in supabase.tables['user_profiles']] == ["Dev"]
+
+
+class CountingSupabase(FakeSupabase):
+    """Records how many user ids each in_() lookup sends"""
+
+    def __init__(self):
+        super().__init__()
+        self.lookup_sizes = []
+
+    def table(self, name):
+        query = super().table(name)
+        in_ = query.in_
+
+        def counted(column, values):
+            values = list(values)
+            self.lookup_sizes.append(len(values))
+            return in_(column, values)
+
+        query.in_ = counted
+        return query
+
+
+def test_merged_state_chunks_lookups_and_keeps_the_intimacy_score():
+    supabase = CountingSupabase()
+    legacy = [legacy_user_id(date(2024, 1, 1) + timedelta(days=i)) for i in range(450)]
+    supabase.table('ai_personality_state').insert([
+        {'user_id': legacy[10], 'intimacy_level': 4, 'intimacy_score': 4.62, 'relationship_stage': "friends",
+         'updated_at': "2024-01-11T10:00:00"},
+        {'user_id': legacy[400], 'intimacy_level': 2, 'intimacy_score': 2.1, 'relationship_stage': "getting_to_know",
+         'current_mood': "sleepy", 'updated_at': "2025-02-04T10:00:00", 'conversation_summary': "likes chai",
+         'summary_turns': 30, 'summary_through_id': 812},
+    ]).execute()
+
+    _, personality = merged_state(supabase, legacy + ["target"])
+
+    assert max(supabase.lookup_sizes) <= LOOKUP_CHUNK
+    assert personality == {
+        'intimacy_level': 4, 'intimacy_score': 4.62, 'relationship_stage': "friends", 'current_mood': "sleepy",
+        'conversation_summary': "likes chai", 'summary_turns': 30, 'summary_through_id': 812,
+    }
@@ -0,0 +1,50 @@
+from prompt_builder import PromptBuilder, TokenCounter
+
+CONTEXT = {"Date and time": "2024-05-01 21:10 IST", "User's name": "Kabir", "Your mood": "playful"}
+HISTORY = [(f"message number {i} about my day", f"reply number {i}, tell me more yaar") for i in range(12)]
+
+
+class CharCounter(TokenCounter):
+    """Deterministic ~4 chars per token, whether or not tiktoken is installed"""
+
+    def __init__(self):
+        super().__init__()
+        self.encoding = None
+
+
+def builder(budget):
+    return PromptBuilder(budget=budget, counter=CharCounter())
+
+
+def test_everything_fits_in_a_roomy_budget():
+    prompt, counts = builder(4000).build(CONTEXT, HISTORY, "how was work?", summary="Kabir is a chef.",
+                                         memories=[("I burnt the biryani", "oh no!")])
+
+    assert counts["history_turns_kept"] == len(HISTORY)
+    assert "Kabir is a chef." in prompt and "I burnt the biryani" in prompt
+    assert prompt.rstrip().endswith("Respond as Malavika:")
+    assert counts["total"] <= counts["budget"]
+
+
+def test_long_summary_and_memories_do_not_crowd_out_the_message_or_newest_turns():
+    summary = "Kabir likes long walks and talking about food. " * 200
+    memories = [(f"memory {i} " + "very detailed story " * 30, "aww") for i in range(20)]
+    prompt_builder = builder(600)
+
+    prompt, counts = prompt_builder.build(CONTEXT, HISTORY, "did you eat dinner?", summary=summary,
+                                          memories=memories)
+
+    assert "User's message: did you eat dinner?" in prompt
+    assert counts["history_turns_kept"] >= prompt_builder.min_history_turns
+    assert "message number 11 about my day" in prompt
+    assert counts["total"] <= counts["budget"]
+
+
+def test_long_message_is_truncated_but_newest_turns_are_kept():
+    prompt_builder = builder(600)
+
+    prompt, counts = prompt_builder.build(CONTEXT, HISTORY, "so basically " * 500)
+
+    assert "User's message: so basically" in prompt
+    assert counts["history_turns_kept"] >= prompt_builder.min_history_turns
+    assert counts["total"] <= counts["budget"]
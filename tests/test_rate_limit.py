@@ -0,0 +1,164 @@
+import pytest
+
+from fakes import FakeAPIError, FakeGeminiModel
+from model_router import FAST, PRO, ModelRouter
+from rate_limit import MessageCoalescer, ModelLimiter, QueueTimeout, TokenBucket
+from summariser import GeminiSummariser
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, secs):
+        self.now += secs
+
+
+def fake_model(**kwargs):
+    return FakeGeminiModel(latency_secs=0.0, error_latency_secs=0.0, **kwargs)
+
+
+def limiter(**kwargs):
+    options = dict(rate_per_sec=1000.0, burst=100, max_concurrency=4, max_wait=1.0, backoff_base=0.001)
+    options.update(kwargs)
+    return ModelLimiter(**options)
+
+
+# --- TokenBucket ---
+def test_bucket_spends_burst_then_waits_for_refill():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, burst=3, clock=clock)
+
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.reserve() == 0.0
+
+
+def test_bucket_never_holds_more_than_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10.0, burst=2, clock=clock)
+    clock.now += 60
+
+    assert [bucket.reserve() for _ in range(2)] == [0.0, 0.0]
+    assert bucket.reserve() > 0.0
+
+
+# --- ModelLimiter ---
+def test_limiter_paces_callers_by_the_bucket():
+    clock = FakeClock()
+    paced = ModelLimiter(rate_per_sec=4.0, burst=1, max_wait=5.0, clock=clock, sleep=clock.sleep)
+
+    paced.acquire()
+    paced.release()
+    waited = paced.acquire()
+
+    assert waited == pytest.approx(250.0)
+
+
+def test_router_retries_retryable_errors_on_the_same_tier():
+    fast = fake_model(fail_first=2)
+    shared = limiter()
+    router = ModelRouter({FAST: fast, PRO: fake_model()}, limiter=shared)
+
+    text, tier = router.generate(FAST, "hi")
+
+    assert tier == FAST and text
+    assert fast.calls == 3
+    assert shared.retries == 2
+    assert router.stats[FAST].retries == 2
+    assert shared.active == 0
+
+
+def test_router_falls_back_once_retries_are_exhausted():
+    fast = fake_model(fail_first=10)
+    router = ModelRouter({FAST: fast, PRO: fake_model()}, limiter=limiter(max_retries=1))
+
+    _, tier = router.generate(FAST, "hi")
+
+    assert tier == PRO
+    assert fast.calls == 2
+    assert router.stats[FAST].fallbacks_from == 1
+
+
+def test_non_retryable_errors_are_not_retried():
+    fast = fake_model(fail_first=1, error_code=400)
+    shared = limiter()
+    router = ModelRouter({FAST: fast}, limiter=shared)
+
+    with pytest.raises(FakeAPIError):
+        router.generate(FAST, "hi")
+    assert fast.calls == 1
+    assert shared.retries == 0
+
+
+def test_full_limiter_raises_queue_timeout():
+    shared = limiter(max_concurrency=1, max_wait=0.05)
+    shared.acquire()
+
+    with pytest.raises(QueueTimeout):
+        shared.acquire()
+    assert shared.timeouts == 1
+    shared.release()
+    shared.acquire()
+
+
+def test_router_surfaces_queue_timeout_without_calling_the_model():
+    shared = limiter(max_concurrency=1, max_wait=0.02)
+    fast, pro = fake_model(), fake_model()
+    router = ModelRouter({FAST: fast, PRO: pro}, limiter=shared)
+    shared.acquire()
+
+    with pytest.raises(QueueTimeout):
+        router.generate(FAST, "hi")
+    assert fast.calls == pro.calls == 0
+
+
+# --- MessageCoalescer ---
+def test_coalescer_answers_unresolved_messages_together():
+    coalescer = MessageCoalescer()
+    first = coalescer.push("u1", "are you there")
+    second = coalescer.push("u1", "hello??")
+
+    assert coalescer.pending("u1") == ["are you there", "hello??"]
+    coalescer.resolve("u1", first)
+    assert coalescer.pending("u1") == ["hello??"]
+    coalescer.resolve("u1", second)
+    assert coalescer.pending("u1") == []
+    assert coalescer.stats() == {"users_pending": 0, "messages_coalesced": 1}
+
+
+def test_coalescer_drops_stale_messages_and_caps_the_queue():
+    clock = FakeClock()
+    coalescer = MessageCoalescer(max_messages=2, max_age=60.0, clock=clock)
+    coalescer.push("u1", "old")
+    clock.now += 61
+    coalescer.push("u1", "a")
+    coalescer.push("u1", "b")
+    coalescer.push("u1", "c")
+
+    assert coalescer.pending("u1") == ["b", "c"]
+    assert coalescer.pending("u2") == []
+
+
+# --- summariser ---
+def test_gemini_summariser_goes_through_the_router():
+    fast = fake_model(fail_first=1, replies=["Asha works at a bakery."])
+    shared = limiter()
+    router = ModelRouter({FAST: fast}, limiter=shared)
+
+    summary = GeminiSummariser(router).summarise("", [("I work at a bakery", "nice!")])
+
+    assert summary == "Asha works at a bakery."
+    assert shared.acquired == 2 and shared.retries == 1
+
+
+def test_gemini_summariser_falls_back_to_extractive():
+    router = ModelRouter({FAST: fake_model(fail_first=10, error_code=400)})
+
+    summary = GeminiSummariser(router).summarise("", [("I work at a bakery", "nice!")])
+
+    assert summary == "I work at a bakery"
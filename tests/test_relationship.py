@@ -0,0 +1,89 @@
+from datetime import datetime
+
+import pytest
+
+from relationship import RelationshipEngine
+from user_state import IST
+
+MOODS = ["loving", "playful", "supportive", "excited"]
+STAGES = ["getting_to_know", "friends", "close_friends"]
+
+
+class Table:
+    """persist_batch stand-in; without the column it fails like PostgREST does"""
+
+    def __init__(self, has_score=True, down=False):
+        self.has_score = has_score
+        self.down = down
+        self.rows = {}
+        self.attempts = 0
+
+    def upsert(self, rows):
+        self.attempts += 1
+        if self.down:
+            raise ConnectionError("connection refused")
+        if not self.has_score and any('intimacy_score' in row for row in rows):
+            raise Exception("Could not find the 'intimacy_score' column of 'ai_personality_state' in the schema cache")
+        for row in rows:
+            self.rows[row['user_id']] = row
+
+
+@pytest.fixture
+def make_engine():
+    engines = []
+
+    def make(table):
+        engine = RelationshipEngine(table.upsert, MOODS, STAGES, flush_interval=3600)
+        engines.append(engine)
+        return engine
+
+    yield make
+    for engine in engines:
+        engine.close()
+
+
+def observe(engine, user_id="u1"):
+    engine.observe(user_id, {'current_mood': "playful"}, "happy", datetime(2024, 5, 1, 15, 0, tzinfo=IST))
+
+
+def test_flush_writes_pending_states(make_engine):
+    table = Table()
+    engine = make_engine(table)
+    observe(engine)
+
+    assert engine.flush() == 1
+    assert table.rows["u1"]['intimacy_score'] > 1.0
+    assert engine.stats()["last_error"] is None
+
+
+def test_missing_score_column_falls_back_to_the_other_columns(make_engine):
+    table = Table(has_score=False)
+    engine = make_engine(table)
+    observe(engine)
+
+    assert engine.flush() == 1
+    assert "intimacy_score" not in table.rows["u1"]
+    assert table.rows["u1"]['relationship_stage'] == "getting_to_know"
+    stats = engine.stats()
+    assert stats["intimacy_score_column"] is False
+    assert "intimacy_score" in stats["last_error"]
+
+    observe(engine, "u2")
+    attempts = table.attempts
+    assert engine.flush() == 1
+    assert table.attempts == attempts + 1
+
+
+def test_other_failures_keep_rows_pending_and_report_the_error(make_engine):
+    table = Table(down=True)
+    engine = make_engine(table)
+    observe(engine)
+
+    assert engine.flush() == 0
+    stats = engine.stats()
+    assert (stats["failed_flushes"], stats["pending"], stats["intimacy_score_column"]) == (1, 1, True)
+    assert "connection refused" in stats["last_error"]
+
+    table.down = False
+    assert engine.flush() == 1
+    assert engine.stats()["last_error"] is None
@@ -0,0 +1,44 @@
+from response_cache import NAME_SLOT, ResponseCache
+
+
+def warm(cache, key, replies, user_name=""):
+    for reply in replies:
+        cache.store(key, reply, user_name)
+
+
+def test_replies_are_not_served_to_other_users():
+    cache = ResponseCache(min_variants=1, hit_probability=1.0)
+    key_a = cache.make_key("user-a", "hiii!", "playful", "friends", 10)
+    key_b = cache.make_key("user-b", "hi", "playful", "friends", 10)
+    warm(cache, key_a, ["hi Priya, how did the interview with Rohan go?"], "Priya")
+
+    assert key_a != key_b
+    assert cache.lookup(key_b, "Rahul") is None
+    assert cache.lookup(key_b, "") is None
+    assert cache.lookup(key_a, "Priya") == "hi Priya, how did the interview with Rohan go?"
+
+
+def test_name_is_only_replaced_as_a_whole_word():
+    cache = ResponseCache(min_variants=1, hit_probability=1.0)
+    key = cache.make_key("user-a", "gm", "loving", "friends", 8)
+    warm(cache, key, ["Ann! anniversary plans still on? Annie said hi"], "Ann")
+
+    assert cache.entries.get(key) == [f"{NAME_SLOT}! anniversary plans still on? Annie said hi"]
+    assert cache.lookup(key, "Ann") == "Ann! anniversary plans still on? Annie said hi"
+
+
+def test_name_with_regex_characters_is_escaped():
+    cache = ResponseCache(min_variants=1, hit_probability=1.0)
+    key = cache.make_key("user-a", "ok", "loving", "friends", 8)
+    warm(cache, key, ["okay R.K. sounds good, RxK"], "R.K")
+
+    assert cache.entries.get(key) == [f"okay {NAME_SLOT}. sounds good, RxK"]
+
+
+def test_templated_reply_needs_a_name():
+    cache = ResponseCache(min_variants=1, hit_probability=1.0)
+    key = cache.make_key("user-a", "hey", "loving", "friends", 20)
+    warm(cache, key, ["hey Meera"], "Meera")
+
+    assert cache.lookup(key, "") is None
+    assert cache.lookup(key, "Mira") == "hey Mira"
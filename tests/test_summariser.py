@@ -0,0 +1,77 @@
+import time
+from types import SimpleNamespace
+
+from fakes import FakeSupabase
+from history_cache import fetch_unfolded_turns
+from load_test import build_pipeline
+from summariser import ExtractiveSummariser, RollingSummary
+
+
+def wait_for_fold(rolling, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while rolling._folding and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def seed_chats(supabase, user_id, n):
+    supabase.table('chats').insert([{'user_id': user_id, 'user_message': f"m{i}", 'ai_response': "ok"}
+                                    for i in range(n)]).execute()
+
+
+def test_fetch_unfolded_skips_the_recent_window_and_the_watermark():
+    supabase = FakeSupabase()
+    seed_chats(supabase, "u1", 12)
+    seed_chats(supabase, "u2", 3)
+    ids = [row['id'] for row in supabase.tables['chats'] if row['user_id'] == "u1"]
+
+    rows = fetch_unfolded_turns(supabase, "u1", ids[2], keep_recent=5, limit=50)
+
+    assert [row['user_message'] for row in rows] == ["m3", "m4", "m5", "m6"]
+    assert [row['user_message'] for row in fetch_unfolded_turns(supabase, "u1", 0, 5, 2)] == ["m5", "m6"]
+    assert fetch_unfolded_turns(supabase, "u2", 0, 5, 50) == []
+
+
+def test_catch_up_folds_what_the_last_session_left():
+    supabase = FakeSupabase()
+    seed_chats(supabase, "u1", 8)
+    persisted = []
+    rolling = RollingSummary(
+        ExtractiveSummariser(), fold_every=10, persist=lambda *args: persisted.append(args),
+        fetch_unfolded=lambda after, limit: fetch_unfolded_turns(supabase, "u1", after, 5, limit),
+    )
+
+    rolling.catch_up()
+    wait_for_fold(rolling)
+
+    assert rolling.summary == "m0; m1; m2"
+    assert persisted[-1] == ("m0; m1; m2", 3, rolling.folded_through)
+
+
+def test_every_turn_outside_the_window_reaches_the_summary_across_sessions(tmp_path):
+    args = SimpleNamespace(quota_errors=0.0, rate=0, concurrency=0, max_wait=20.0, memory=False,
+                           use_async=False, busy=0.0, stream=False)
+    pipeline, cleanup = build_pipeline(args, 0.0, 0.0, str(tmp_path / "spill.jsonl"))
+    pipeline.response_cache = None
+    pipeline.chat_writer.flush_interval = 0.01
+    try:
+        turn = 0
+        for _ in range(3):
+            session_state = {}     # a new browser session
+            for _ in range(12):
+                pipeline.handle(session_state, "u1", f"msg {turn}")
+                turn += 1
+                pipeline.chat_writer.flush(5.0)
+                wait_for_fold(session_state["rolling_summaries"]["u1"])
+        session_state = {}
+        pipeline.open_session(session_state, "u1")
+        rolling = session_state["rolling_summaries"]["u1"]
+        wait_for_fold(rolling)
+
+        # Everything but the recent window, in order, exactly once
+        folded = rolling.summary.replace(" | ", "; ").split("; ")
+        assert folded == [f"msg {i}" for i in range(turn - pipeline.history_depth)]
+        personality = pipeline.user_store.load("u1")['personality']
+        assert personality['conversation_summary'] == rolling.summary
+        assert personality['summary_turns'] == turn - pipeline.history_depth
+    finally:
+        cleanup()
@@ -0,0 +1,86 @@
+import json
+import os
+
+from fakes import FakeAPIError
+from write_behind import WriteBehindQueue, is_transient
+
+
+class Table:
+    """insert_batch stand-in that rejects a whole batch if any row is bad"""
+
+    def __init__(self, outages=0):
+        self.rows = []
+        self.outages = outages
+
+    def insert(self, rows):
+        if self.outages:
+            self.outages -= 1
+            raise FakeAPIError(503, "Service Unavailable")
+        if any("\x00" in row["user_message"] for row in rows):
+            raise FakeAPIError(400, "unsupported Unicode escape sequence")
+        self.rows.extend(rows)
+
+
+def queue_for(table, tmp_path, **kwargs):
+    options = dict(batch_size=5, flush_interval=0.01, backoff_base=0.001)
+    options.update(kwargs)
+    return WriteBehindQueue(table.insert, str(tmp_path / "spill.jsonl"), **options)
+
+
+def rows(start, stop):
+    return [{"user_message": f"m{i}"} for i in range(start, stop)]
+
+
+def test_a_rejected_row_is_dead_lettered_and_the_rest_written(tmp_path):
+    table = Table()
+    writer = queue_for(table, tmp_path)
+    batch = rows(0, 5)
+    batch[0]["user_message"] = "bad\x00row"
+    for row in batch + rows(5, 10):
+        writer.put(row)
+    writer.flush(5.0)
+    writer.close()
+
+    assert sorted(row["user_message"] for row in table.rows) == [f"m{i}" for i in range(1, 10)]
+    stats = writer.stats()
+    assert (stats["dead_lettered"], stats["retries"], stats["spilled"], stats["replayed"]) == (1, 0, 0, 0)
+    assert not os.path.exists(writer.spill_path)
+    with open(writer.dead_letter_path, encoding="utf-8") as f:
+        [dead] = [json.loads(line) for line in f]
+    assert dead["row"]["user_message"] == "bad\x00row"
+    assert "400" in dead["error"]
+
+
+def test_transient_errors_are_retried(tmp_path):
+    table = Table(outages=2)
+    writer = queue_for(table, tmp_path)
+    for row in rows(0, 5):
+        writer.put(row)
+    writer.flush(5.0)
+    writer.close()
+
+    assert len(table.rows) == 5
+    assert writer.stats()["retries"] == 2
+
+
+def test_spilled_rows_are_replayed_without_bad_rows(tmp_path):
+    # A spill file from before rows were triaged, with a bad row in it
+    spill_path = tmp_path / "spill.jsonl"
+    spilled = rows(0, 4) + [{"user_message": "bad\x00row"}]
+    spill_path.write_text("".join(json.dumps(row) + "\n" for row in spilled), encoding="utf-8")
+    table = Table()
+    writer = queue_for(table, tmp_path)
+    writer.flush(5.0)
+    writer.close()
+
+    assert len(table.rows) == 4
+    assert writer.stats()["dead_lettered"] == 1
+
+
+def test_error_classification():
+    assert is_transient(FakeAPIError(429))
+    assert is_transient(FakeAPIError(503))
+    assert is_transient(ConnectionError("reset"))
+    assert is_transient(type("ConnectTimeout", (type("TimeoutException", (Exception,), {}),), {})())
+    assert not is_transient(FakeAPIError(400))
+    assert not is_transient(ValueError("bad row"))
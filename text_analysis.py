@@ -0,0 +1,75 @@
+import re
+from collections import namedtuple
+
+# ---------------------------
+# PRECOMPILED TEXT ANALYSIS
+# ---------------------------
+# Everything is compiled once at import. analyse() returns emotion,
+# agreement and extracted name together, with one C-level scan per concern:
+# one keyword alternation per emotion (in priority order, stopping at the
+# first hit) and the name pattern. Emojis are only scanned where they are
+# used, in limit_emojis on the reply (skipped outright for ASCII text). A single combined alternation over everything was tried
+# and is ~4x slower under CPython's backtracking engine, since it defeats
+# the first-character skip. Matching semantics are the same as the old
+# per-call helpers (keywords match as substrings, first name match wins).
+
+EMOJI_CLASS = r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F700-\U0001F77F\U0001F780-\U0001F7FF\U0001F800-\U0001F8FF\U0001F900-\U0001F9FF\U0001FA00-\U0001FA6F\U0001FA70-\U0001FAFF\u2600-\u26FF\u2700-\u27BF]'
+EMOJI_PATTERN = re.compile(EMOJI_CLASS)
+
+# Checked in this order - the first emotion with any keyword wins
+EMOTION_KEYWORDS = [
+    ("happy", ["happy", "great", "awesome", "excited"]),
+    ("sad", ["sad", "down", "upset", "hurt"]),
+    ("frustrated", ["angry", "mad", "frustrated", "annoyed"]),
+    ("loving", ["love", "adore", "care", "miss"]),
+]
+EMOTION_PATTERNS = [(emotion, re.compile("|".join(map(re.escape, words)))) for emotion, words in EMOTION_KEYWORDS]
+
+AGREEMENT_WORDS = frozenset(["cool", "okay", "ok", "sure", "fine", "alright", "understood", "got it", "np", "no problem"])
+SHORT_AGREEMENT_PARTS = ("ok", "k", "sure")
+
+NAME_PATTERN = re.compile(r'(?:my name is|i\'m|i am) (\w+(?:\s+\w+)?)', re.IGNORECASE)
+
+TextAnalysis = namedtuple("TextAnalysis", ["emotion", "agreed", "name"])
+
+
+def is_agreement(message):
+    """Has the user agreed to wait? (exact short replies like 'ok', 'sure')"""
+    user_text = message.lower().strip()
+    return (user_text in AGREEMENT_WORDS or
+            len(user_text) <= 4 and any(word in user_text for word in SHORT_AGREEMENT_PARTS))
+
+
+def analyse(message):
+    """Emotion, agreement and extracted name for one message"""
+    return TextAnalysis(detect_user_emotion(message), is_agreement(message), extract_name(message))
+
+
+def detect_user_emotion(message):
+    """Simple emotion detection"""
+    message_lower = message.lower()
+    for emotion, pattern in EMOTION_PATTERNS:
+        if pattern.search(message_lower):
+            return emotion
+    return "neutral"
+
+
+def extract_name(message):
+    """Name from 'my name is X' / "I'm X" / 'I am X', if present"""
+    match = NAME_PATTERN.search(message)
+    return match.group(1).strip() if match else None
+
+
+def limit_emojis(text, max_emojis=1):
+    """Limit emojis in response"""
+    seen = 0
+
+    def keep_or_drop(match):
+        nonlocal seen
+        seen += 1
+        return match.group(0) if seen <= max_emojis else ""
+
+    if text.isascii():
+        return text
+    limited = EMOJI_PATTERN.sub(keep_or_drop, text)
+    return limited if seen <= max_emojis else limited.strip()
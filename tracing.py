@@ -0,0 +1,189 @@
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ---------------------------
+# STAGE TRACING & METRICS
+# ---------------------------
+# Tracer.span(stage) times a block; observe(stage, ms) records a duration
+# measured elsewhere (e.g. ChatPipeline's stage timings). Each stage keeps a
+# rolling window for percentiles plus cumulative buckets for Prometheus.
+# Token usage goes through count(). With enabled=False every call returns
+# straight away (span() hands back a shared no-op context), so tracing can
+# stay wired in everywhere.
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+METRIC_PREFIX = "malavika"
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, tracer, stage):
+        self.tracer = tracer
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.observe(self.stage, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+class StageHistogram:
+    """Rolling window (percentiles) + cumulative buckets (Prometheus) for one stage"""
+
+    def __init__(self, window=500):
+        self.recent = deque(maxlen=window)
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)   # last one is +Inf
+        self.count = 0
+        self.sum_ms = 0.0
+
+    def add(self, ms):
+        self.recent.append(ms)
+        self.count += 1
+        self.sum_ms += ms
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def summary(self):
+        ordered = sorted(self.recent)
+
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 2) if ordered else None
+
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum_ms / self.count, 2) if self.count else None,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+            "max_ms": round(ordered[-1], 2) if ordered else None,
+        }
+
+
+class Tracer:
+    """Per-stage latency histograms and token counters"""
+
+    def __init__(self, enabled=True, window=500):
+        self.enabled = enabled
+        self.window = window
+        self.stages = {}
+        self.counters = {}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    def span(self, stage):
+        return _Span(self, stage) if self.enabled else NULL_SPAN
+
+    def observe(self, stage, ms):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = StageHistogram(self.window)
+            histogram.add(ms)
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled or not value:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def record_turn(self, timings, prompt_tokens=None):
+        """Fold one ChatPipeline TurnResult's timings/token counts in"""
+        if not self.enabled:
+            return
+        for key, value in timings.items():
+            if key.endswith("_ms") and isinstance(value, (int, float)):
+                self.observe(key[:-3], value)
+        tier = timings.get("tier", "none")
+        usage = timings.get("usage") or {}
+        self.count("model_prompt_tokens", usage.get("prompt_tokens", 0), tier=tier)
+        self.count("model_output_tokens", usage.get("output_tokens", 0), tier=tier)
+        if prompt_tokens:
+            self.count("prompt_tokens_estimated", prompt_tokens.get("total", 0))
+        self.count("turns", 1, cached=str(bool(timings.get("cached"))).lower())
+
+    # --- exports ---
+    def snapshot(self):
+        """JSON-friendly view of everything recorded"""
+        with self._lock:
+            stages = {stage: histogram.summary() for stage, histogram in self.stages.items()}
+            counters = {
+                name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else ""): value
+                for (name, labels), value in self.counters.items()
+            }
+        return {"enabled": self.enabled, "uptime_s": round(time.time() - self.started_at, 1),
+                "stages": stages, "counters": counters}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def prometheus(self):
+        """Prometheus text exposition format"""
+        lines = [
+            f"# HELP {METRIC_PREFIX}_stage_duration_ms Chat pipeline stage duration",
+            f"# TYPE {METRIC_PREFIX}_stage_duration_ms histogram",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self.stages.items()):
+                cumulative = 0
+                for bound, hits in zip(BUCKETS_MS + ("+Inf",), histogram.buckets):
+                    cumulative += hits
+                    lines.append(f'{METRIC_PREFIX}_stage_duration_ms_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{METRIC_PREFIX}_stage_duration_ms_sum{{stage="{stage}"}} {histogram.sum_ms:.3f}')
+                lines.append(f'{METRIC_PREFIX}_stage_duration_ms_count{{stage="{stage}"}} {histogram.count}')
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name}_total counter")
+                for (counter, labels), value in sorted(self.counters.items()):
+                    if counter != name:
+                        continue
+                    label_text = "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+                    lines.append(f"{METRIC_PREFIX}_{name}_total{label_text} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(tracer, port, host="0.0.0.0"):
+    """Serve /metrics (Prometheus text) and /metrics.json on a daemon thread"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics.json"):
+                body, content_type = tracer.to_json().encode("utf-8"), "application/json"
+            elif self.path.startswith("/metrics"):
+                body, content_type = tracer.prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,46 @@
+import random
+import time
+
+# ---------------------------
+# LATENCY-AWARE TYPING INDICATOR
+# ---------------------------
+TYPING_TEXT = "💭 *typing...*"
+
+
+class TypingIndicator:
+    """Shows 'typing...' while the real work runs, padding only if it was too quick
+
+    The indicator goes up as soon as the turn starts, so history fetch and
+    generation happen behind it. When the reply is ready, finish() sleeps
+    only for whatever is left of a human-looking delay sampled between
+    min_delay and max_delay - usually nothing once Gemini is involved.
+    """
+
+    def __init__(self, placeholder, min_delay=2.0, max_delay=3.5):
+        self.placeholder = placeholder
+        self.target_delay = random.uniform(min_delay, max(min_delay, max_delay))
+        self.started_at = None
+        self.padded_secs = 0.0
+        self.finished = False
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.placeholder.markdown(TYPING_TEXT)
+
+    def finish(self, pad=True):
+        """Pad up to the target delay (if needed) and clear the indicator"""
+        if self.finished:
+            return
+        self.finished = True
+        if pad and self.started_at is not None:
+            remaining = self.target_delay - (time.perf_counter() - self.started_at)
+            if remaining > 0:
+                self.padded_secs = remaining
+                time.sleep(remaining)
+        self.placeholder.empty()
+
+    def until_first(self, chunks):
+        """Pass a chunk stream through, finishing the indicator before the first chunk"""
+        for chunk in chunks:
+            self.finish()
+            yield chunk
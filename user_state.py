@@ -0,0 +1,147 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from ttl_cache import TTLCache
+
+# ---------------------------
+# USER STATE LOADER
+# ---------------------------
+# Profile + personality are fetched together through the get_user_state
+# RPC and created together through create_user_state (see
+# sql/user_state.sql), i.e. one round trip each. If the functions haven't
+# been deployed yet we fall back to per-table queries.
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+DEFAULT_PERSONALITY = {'current_mood': 'playful', 'relationship_stage': 'getting_to_know', 'intimacy_level': 1}
+
+
+def default_user_state(user_id):
+    """Offline fallback when the database can't be reached"""
+    return {
+        'profile': {'user_id': user_id, 'name': ''},
+        'personality': dict(DEFAULT_PERSONALITY),
+    }
+
+
+def _missing_function(error):
+    text = str(error)
+    return "PGRST202" in text or "Could not find the function" in text
+
+
+class UserStateStore:
+    """Loads, creates and caches {'profile', 'personality'} per user_id"""
+
+    def __init__(self, supabase, moods, ttl=300.0, maxsize=1024):
+        self.supabase = supabase
+        self.moods = moods
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.use_rpc = True
+        self.summary_watermark = True
+
+    # --- public API ---
+    def load(self, user_id):
+        """Cached user state, fetching (and creating on a miss) as needed"""
+        state = self.cache.get(user_id)
+        if state is not None:
+            return state
+        try:
+            state = self._fetch(user_id) or self._create(user_id)
+        except Exception:
+            # Don't cache the fallback - try the database again next time
+            return default_user_state(user_id)
+        self.cache.set(user_id, state)
+        return state
+
+    def update_name(self, user_id, name):
+        """Persist a new name and drop the cached state"""
+        self.invalidate(user_id)
+        self.supabase.table('user_profiles').update({'name': name}).eq('user_id', user_id).execute()
+
+    def update_summary(self, user_id, summary, summary_turns, summary_through_id=None):
+        """Persist the rolling conversation summary (and its chat id watermark) next to the personality state"""
+        values = {'conversation_summary': summary, 'summary_turns': summary_turns}
+        if summary_through_id is not None and self.summary_watermark:
+            values['summary_through_id'] = summary_through_id
+        try:
+            self.supabase.table('ai_personality_state').update(values).eq('user_id', user_id).execute()
+        except Exception as e:
+            if 'summary_through_id' not in values or 'summary_through_id' not in str(e):
+                raise
+            # sql/conversation_summary.sql predates the watermark column - keep the summary itself
+            self.summary_watermark = False
+            del values['summary_through_id']
+            self.supabase.table('ai_personality_state').update(values).eq('user_id', user_id).execute()
+        self.invalidate(user_id)
+
+    def invalidate(self, user_id):
+        self.cache.pop(user_id)
+
+    # --- database access ---
+    def _fetch(self, user_id):
+        if self.use_rpc:
+            try:
+                data = self.supabase.rpc('get_user_state', {'p_user_id': user_id}).execute().data
+                return data if data and data.get('profile') and data.get('personality') else None
+            except Exception as e:
+                if not _missing_function(e):
+                    raise
+                self.use_rpc = False
+
+        profile_response = self.supabase.table('user_profiles').select('*').eq('user_id', user_id).execute()
+        personality_response = self.supabase.table('ai_personality_state').select('*').eq('user_id', user_id).execute()
+        if profile_response.data and personality_response.data:
+            return {'profile': profile_response.data[0], 'personality': personality_response.data[0]}
+        return None
+
+    def _create(self, user_id):
+        now = datetime.now(IST).isoformat()
+        profile_data = {
+            'user_id': user_id,
+            'name': '',
+            'created_at': now,
+            'last_updated': now
+        }
+        personality_data = {
+            'user_id': user_id,
+            'current_mood': random.choice(self.moods),
+            'intimacy_level': 1,
+            'relationship_stage': 'getting_to_know',
+            'updated_at': now
+        }
+
+        if self.use_rpc:
+            try:
+                self.supabase.rpc('create_user_state', {'p_profile': profile_data, 'p_personality': personality_data}).execute()
+                return {'profile': profile_data, 'personality': personality_data}
+            except Exception as e:
+                if not _missing_function(e):
+                    raise
+                self.use_rpc = False
+
+        self.supabase.table('user_profiles').upsert(profile_data, on_conflict='user_id').execute()
+        self.supabase.table('ai_personality_state').upsert(personality_data, on_conflict='user_id').execute()
+        return {'profile': profile_data, 'personality': personality_data}
+
+
+# ---------------------------
+# LOCAL RPC STAND-INS (for fakes.FakeSupabase)
+# ---------------------------
+def _fake_get_user_state(db, p_user_id):
+    profile = next((row for row in db.tables.get('user_profiles', []) if row.get('user_id') == p_user_id), None)
+    personality = next((row for row in db.tables.get('ai_personality_state', []) if row.get('user_id') == p_user_id), None)
+    if profile is None or personality is None:
+        return None
+    return {'profile': dict(profile), 'personality': dict(personality)}
+
+
+def _fake_create_user_state(db, p_profile, p_personality):
+    db.put_row('user_profiles', p_profile, 'user_id')
+    db.put_row('ai_personality_state', p_personality, 'user_id')
+    return None
+
+
+def register_fake_rpcs(fake_supabase):
+    """Install in-memory versions of the user-state RPCs on a FakeSupabase"""
+    fake_supabase.register_rpc('get_user_state', _fake_get_user_state)
+    fake_supabase.register_rpc('create_user_state', _fake_create_user_state)
@@ -0,0 +1,212 @@
+import atexit
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+from rate_limit import RETRYABLE_STATUS, status_of
+
+# ---------------------------
+# WRITE-BEHIND QUEUE FOR CHAT ROWS
+# ---------------------------
+# Only transient failures (429/5xx, connection errors) are retried and
+# spilled. Anything else means the backend rejected a row, so the batch is
+# split in half until the rejected rows are isolated; those go to a
+# dead-letter file and the rest are written.
+
+# httpx (under supabase-py) raises these for network trouble
+TRANSIENT_ERROR_NAMES = {"TransportError", "TimeoutException", "NetworkError"}
+
+
+def is_transient(error):
+    """True for errors worth retrying: 429/5xx, timeouts and connection failures"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    return status_of(error) in RETRYABLE_STATUS
+
+
+class WriteBehindQueue:
+    """Batches rows onto a background thread and bulk-inserts them
+
+    - put() never blocks the Streamlit script thread
+    - batches that fail transiently are retried with exponential backoff
+    - batches that still fail are spilled to a local JSONL file and
+      replayed once the backend accepts writes again
+    - rows the backend rejects are isolated and moved to a dead-letter
+      JSONL file (default: <spill_path>.dead), never replayed
+    - remaining rows are flushed (or spilled) at interpreter shutdown
+    """
+
+    def __init__(self, insert_batch, spill_path, batch_size=20, flush_interval=0.5,
+                 max_queue=10000, max_retries=4, backoff_base=0.5, backoff_max=8.0, dead_letter_path=None):
+        self.insert_batch = insert_batch
+        self.spill_path = spill_path
+        self.dead_letter_path = dead_letter_path or f"{spill_path}.dead"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spill_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.counters = {
+            "enqueued": 0,
+            "written": 0,
+            "batches": 0,
+            "retries": 0,
+            "failed_batches": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "dropped": 0,
+            "dead_lettered": 0,
+        }
+
+        self._replay_spill()
+        self._thread = threading.Thread(target=self._run, name="chat-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # --- producer side ---
+    def put(self, row):
+        """Queue a row for insertion; spills straight to disk if the queue is full"""
+        try:
+            self._queue.put_nowait(row)
+            self.counters["enqueued"] += 1
+        except queue.Full:
+            self._spill([row])
+
+    def stats(self):
+        return {**self.counters, "queue_depth": self._queue.qsize(), "batch_size": self.batch_size}
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far has been written or spilled"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout=5.0):
+        """Stop the worker, flushing what is left (used at shutdown)"""
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        # Worker didn't finish in time - don't lose what's still queued
+        leftover = self._drain(self._queue.qsize())
+        if leftover:
+            self._spill(leftover)
+
+    # --- worker side ---
+    def _drain(self, limit):
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+                self._queue.task_done()
+            except queue.Empty:
+                break
+        return rows
+
+    def _next_batch(self):
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        # While shutting down, make one attempt and spill instead of backing off
+        attempts = 1 if self._stopping.is_set() else self.max_retries
+        for attempt in range(attempts):
+            try:
+                self.insert_batch(batch)
+                self.counters["written"] += len(batch)
+                self.counters["batches"] += 1
+                if os.path.exists(self.spill_path) and not self._stopping.is_set():
+                    self._replay_spill()
+                return
+            except Exception as e:
+                if not is_transient(e):
+                    self._isolate(batch, e)
+                    return
+                if attempt + 1 < attempts:
+                    self.counters["retries"] += 1
+                    delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                    time.sleep(delay * random.uniform(0.5, 1.0))
+        self.counters["failed_batches"] += 1
+        self._spill(batch)
+
+    def _isolate(self, batch, error):
+        """Split a rejected batch until the bad rows are found; write the rest"""
+        if len(batch) == 1:
+            self._dead_letter(batch[0], error)
+            return
+        middle = len(batch) // 2
+        self._write(batch[:middle])
+        self._write(batch[middle:])
+
+    # --- local spill / dead-letter files ---
+    def _append(self, path, lines):
+        with self._spill_lock, open(path, "a", encoding="utf-8") as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    def _spill(self, rows):
+        try:
+            self._append(self.spill_path, rows)
+            self.counters["spilled"] += len(rows)
+        except OSError:
+            self.counters["dropped"] += len(rows)
+
+    def _dead_letter(self, row, error):
+        try:
+            self._append(self.dead_letter_path, [{"row": row, "error": f"{type(error).__name__}: {error}"}])
+            self.counters["dead_lettered"] += 1
+        except OSError:
+            self.counters["dropped"] += 1
+
+    def _replay_spill(self):
+        """Move spilled rows back onto the queue"""
+        with self._spill_lock:
+            if not os.path.exists(self.spill_path):
+                return
+            replay_path = self.spill_path + ".replay"
+            try:
+                os.replace(self.spill_path, replay_path)
+                with open(replay_path, encoding="utf-8") as f:
+                    rows = [json.loads(line) for line in f if line.strip()]
+                os.remove(replay_path)
+            except (OSError, ValueError):
+                return
+        for row in rows:
+            self.put(row)
+        self.counters["replayed"] += len(rows)